@@ -1,96 +1,219 @@
 from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
-import sqlite3
+from datetime import datetime
 import json
-from pathlib import Path
-from .auth import token_required
+import math
+from .database import get_db, ANALYTICS_DATABASE_PATH
+from .utils.auth import token_required
+from .utils.rate_limiting import ingest_limit
+from .services.analytics_retention import (
+    init_analytics_db, update_rollups, event_timestamp, histogram_value, normalize_url,
+    BUCKET_PATTERN, PERFORMANCE_COLUMNS
+)
 
 analytics_bp = Blueprint('analytics', __name__)
 
-def init_analytics_db():
-    """Initialize the analytics database"""
-    db_path = Path('database/analytics.db')
-    db_path.parent.mkdir(exist_ok=True)
+# Maximum number of events accepted in one batch request
+ANALYTICS_BATCH_MAX_EVENTS = 500
+
+# Upper bounds for numeric event fields; larger timings are client clock glitches
+PERFORMANCE_MAX_MS = 24 * 60 * 60 * 1000
+EVENT_MAX_POSITION = 2 ** 31 - 1
+
+ERROR_INSERT = '''
+    INSERT INTO errors (
+        type, message, source, lineno, colno, stack, timestamp, user_agent, url
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+PERFORMANCE_INSERT = '''
+    INSERT INTO performance (
+        page_load, dom_content_loaded, first_paint, dns_lookup,
+        tcp_connection, server_response, dom_processing,
+        resource_loading, timestamp, url
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+BEHAVIOR_INSERT = '''
+    INSERT INTO user_behavior (
+        type, data, timestamp, url, user_agent
+    ) VALUES (?, ?, ?, ?, ?)
+'''
+
+PERFORMANCE_FIELDS = [
+    'pageLoad', 'domContentLoaded', 'firstPaint', 'dnsLookup',
+    'tcpConnection', 'serverResponse', 'domProcessing', 'resourceLoading'
+]
+
+PERCENTILES = (50, 90, 99)
+
+def error_row(data, user_agent, url):
+    """Build an errors row from an error event"""
+    return (
+        data['type'],
+        data['message'],
+        data.get('source'),
+        data.get('lineno'),
+        data.get('colno'),
+        data.get('stack'),
+        event_timestamp(data.get('timestamp')),
+        user_agent,
+        url
+    )
+
+def performance_metrics(data):
+    """Map each timing field to its value, or None when it is missing or out of range"""
+    return {
+        field: data.get(field) if _is_number(data.get(field), PERFORMANCE_MAX_MS) else None
+        for field in PERFORMANCE_FIELDS
+    }
+
+def performance_row(data, url):
+    """Build a performance row from a timing sample, dropping timings that are out of range"""
+    return tuple(performance_metrics(data).values()) + (
+        event_timestamp(data.get('timestamp')),
+        url
+    )
+
+def behavior_row(data, user_agent, url):
+    """Build a user_behavior row from a behavior event"""
+    return (
+        data['type'],
+        json.dumps(data['data']),
+        event_timestamp(data.get('timestamp')),
+        url,
+        user_agent
+    )
+
+def percentiles_from_histogram(buckets, percentiles=PERCENTILES):
+    """Compute percentiles from a {bucket: count} histogram"""
+    samples = sum(buckets.values())
+    result = {f'p{p}': None for p in percentiles}
+    if not samples:
+        return dict(result, samples=0)
+    
+    ordered = sorted(buckets.items())
+    for p in percentiles:
+        rank = math.ceil(samples * p / 100)
+        seen = 0
+        for bucket, count in ordered:
+            seen += count
+            if seen >= rank:
+                result[f'p{p}'] = round(histogram_value(bucket), 1)
+                break
+    return dict(result, samples=samples)
+
+def query_percentiles(conn, fields, start_day=None, end_day=None, url=None):
+    """Get percentiles per timing field from the daily histograms"""
+    query = '''
+        SELECT field, bucket, SUM(count)
+        FROM performance_histograms
+        WHERE day BETWEEN ? AND ?
+    '''
+    params = [start_day or '', end_day or '~']
+    if url is not None:
+        query += ' AND url = ?'
+        params.append(normalize_url(url))
+    query += f" AND field IN ({', '.join('?' for _ in fields)}) GROUP BY field, bucket"
+    params.extend(fields)
     
-    conn = sqlite3.connect(db_path)
+    histograms = {field: {} for field in fields}
+    for field, bucket, count in conn.execute(query, params).fetchall():
+        histograms[field][bucket] = count
+    return {
+        field: percentiles_from_histogram(buckets)
+        for field, buckets in histograms.items()
+    }
+
+def insert_events(conn, errors=(), performance=(), behavior=()):
+    """Insert telemetry rows with one executemany per table (caller commits)"""
     c = conn.cursor()
+    if errors:
+        c.executemany(ERROR_INSERT, errors)
+    if performance:
+        c.executemany(PERFORMANCE_INSERT, performance)
+    if behavior:
+        c.executemany(BEHAVIOR_INSERT, behavior)
     
-    # Create tables for different types of analytics
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS errors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL,
-            message TEXT NOT NULL,
-            source TEXT,
-            lineno INTEGER,
-            colno INTEGER,
-            stack TEXT,
-            timestamp TEXT NOT NULL,
-            user_agent TEXT,
-            url TEXT
-        )
-    ''')
+    update_rollups(conn, errors, performance, behavior)
+
+def parse_stats_range(start, end):
+    """Convert optional start/end ISO dates or datetimes into inclusive rollup buckets"""
+    start_bucket = end_bucket = None
+    if start:
+        start_bucket = datetime.fromisoformat(start).strftime('%Y-%m-%dT%H')
+    if end:
+        end_time = datetime.fromisoformat(end)
+        # A bare date covers the whole day
+        if len(end) == 10:
+            end_time = end_time.replace(hour=23)
+        end_bucket = end_time.strftime('%Y-%m-%dT%H')
+    return start_bucket, end_bucket
+
+def _is_number(value, maximum):
+    # bool is an int subclass; NaN, infinities and huge values break bucketing and SQLite binding
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+        and 0 <= value <= maximum
+    )
+
+def validate_event(event):
+    """Validate one batched event, returning an error message or None"""
+    if not isinstance(event, dict):
+        return 'Event must be an object'
     
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS performance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            page_load INTEGER,
-            dom_content_loaded INTEGER,
-            first_paint INTEGER,
-            dns_lookup INTEGER,
-            tcp_connection INTEGER,
-            server_response INTEGER,
-            dom_processing INTEGER,
-            resource_loading INTEGER,
-            timestamp TEXT NOT NULL,
-            url TEXT
-        )
-    ''')
+    for field in ('url', 'source', 'stack'):
+        if event.get(field) is not None and not isinstance(event[field], str):
+            return f'Field {field} must be a string'
+    timestamp = event.get('timestamp')
+    if timestamp is not None and not (isinstance(timestamp, str) and BUCKET_PATTERN.match(timestamp)):
+        return 'Field timestamp must be an ISO 8601 string'
     
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_behavior (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL,
-            data TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            url TEXT,
-            user_agent TEXT
-        )
-    ''')
+    kind = event.get('kind')
+    if kind == 'error':
+        if not isinstance(event.get('type'), str) or not isinstance(event.get('message'), str):
+            return 'Error events require string type and message'
+        for field in ('lineno', 'colno'):
+            value = event.get(field)
+            if value is not None and not (isinstance(value, int) and _is_number(value, EVENT_MAX_POSITION)):
+                return f'Error field {field} must be a non-negative integer'
+    elif kind == 'performance':
+        # One bad timing (e.g. a negative value from a skewed browser clock) only drops that
+        # timing; the sample is rejected when none of its timings are usable
+        if all(value is None for value in performance_metrics(event).values()):
+            return 'Performance events require at least one timing in milliseconds'
+    elif kind == 'behavior':
+        if not isinstance(event.get('type'), str) or 'data' not in event:
+            return 'Behavior events require a string type and data'
+    else:
+        return f'Unknown event kind: {kind}'
     
-    conn.commit()
-    conn.close()
+    return None
+
+def single_event(kind):
+    """Read a single-event request body as an event of the given kind, with its validation error"""
+    data = request.get_json(silent=True)
+    event = dict(data, kind=kind) if isinstance(data, dict) else data
+    return event, validate_event(event)
 
 @analytics_bp.route('/api/analytics/error', methods=['POST'])
+@ingest_limit
 def track_error():
     """Track error events"""
     try:
-        data = request.json
-        data['timestamp'] = data.get('timestamp', datetime.now().isoformat())
-        data['user_agent'] = request.headers.get('User-Agent')
-        data['url'] = request.headers.get('Referer')
-        
-        conn = sqlite3.connect('database/analytics.db')
-        c = conn.cursor()
+        data, error = single_event('error')
+        if error:
+            return jsonify({'error': error}), 400
         
-        c.execute('''
-            INSERT INTO errors (
-                type, message, source, lineno, colno, stack, timestamp, user_agent, url
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['type'],
-            data['message'],
-            data.get('source'),
-            data.get('lineno'),
-            data.get('colno'),
-            data.get('stack'),
-            data['timestamp'],
-            data['user_agent'],
-            data['url']
-        ))
+        conn = get_db(ANALYTICS_DATABASE_PATH)
+        insert_events(conn, errors=[error_row(
+            data,
+            request.headers.get('User-Agent'),
+            request.headers.get('Referer')
+        )])
         
         conn.commit()
-        conn.close()
         
         return jsonify({'message': 'Error tracked successfully'}), 201
         
@@ -98,37 +221,21 @@ def track_error():
         return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/api/analytics/performance', methods=['POST'])
+@ingest_limit
 def track_performance():
     """Track performance metrics"""
     try:
-        data = request.json
-        timestamp = datetime.now().isoformat()
-        url = request.headers.get('Referer')
+        data, error = single_event('performance')
+        if error:
+            return jsonify({'error': error}), 400
         
-        conn = sqlite3.connect('database/analytics.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT INTO performance (
-                page_load, dom_content_loaded, first_paint, dns_lookup,
-                tcp_connection, server_response, dom_processing,
-                resource_loading, timestamp, url
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('pageLoad'),
-            data.get('domContentLoaded'),
-            data.get('firstPaint'),
-            data.get('dnsLookup'),
-            data.get('tcpConnection'),
-            data.get('serverResponse'),
-            data.get('domProcessing'),
-            data.get('resourceLoading'),
-            timestamp,
-            url
-        ))
+        conn = get_db(ANALYTICS_DATABASE_PATH)
+        insert_events(conn, performance=[performance_row(
+            data,
+            request.headers.get('Referer')
+        )])
         
         conn.commit()
-        conn.close()
         
         return jsonify({'message': 'Performance data tracked successfully'}), 201
         
@@ -136,79 +243,142 @@ def track_performance():
         return jsonify({'error': str(e)}), 500
 
 @analytics_bp.route('/api/analytics/behavior', methods=['POST'])
+@ingest_limit
 def track_behavior():
     """Track user behavior"""
     try:
-        data = request.json
-        data['timestamp'] = data.get('timestamp', datetime.now().isoformat())
-        data['user_agent'] = request.headers.get('User-Agent')
-        data['url'] = request.headers.get('Referer')
-        
-        conn = sqlite3.connect('database/analytics.db')
-        c = conn.cursor()
+        data, error = single_event('behavior')
+        if error:
+            return jsonify({'error': error}), 400
         
-        c.execute('''
-            INSERT INTO user_behavior (
-                type, data, timestamp, url, user_agent
-            ) VALUES (?, ?, ?, ?, ?)
-        ''', (
-            data['type'],
-            json.dumps(data['data']),
-            data['timestamp'],
-            data['url'],
-            data['user_agent']
-        ))
+        conn = get_db(ANALYTICS_DATABASE_PATH)
+        insert_events(conn, behavior=[behavior_row(
+            data,
+            request.headers.get('User-Agent'),
+            request.headers.get('Referer')
+        )])
         
         conn.commit()
-        conn.close()
         
         return jsonify({'message': 'User behavior tracked successfully'}), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@analytics_bp.route('/api/analytics/batch', methods=['POST'])
+@ingest_limit
+def track_batch():
+    """Track a batch of mixed error, performance and behavior events"""
+    try:
+        # sendBeacon posts text/plain or a Blob, so ignore the content type
+        data = request.get_json(force=True, silent=True)
+        events = data.get('events') if isinstance(data, dict) else data
+        
+        if not isinstance(events, list):
+            return jsonify({'error': 'Expected a list of events'}), 400
+        if len(events) > ANALYTICS_BATCH_MAX_EVENTS:
+            return jsonify({
+                'error': f'Batch exceeds {ANALYTICS_BATCH_MAX_EVENTS} events'
+            }), 413
+        
+        user_agent = request.headers.get('User-Agent')
+        referer = request.headers.get('Referer')
+        rows = {'errors': [], 'performance': [], 'behavior': []}
+        rejected = []
+        
+        for index, event in enumerate(events):
+            error = validate_event(event)
+            if error:
+                rejected.append({'index': index, 'error': error})
+                continue
+            
+            url = event.get('url') or referer
+            if event['kind'] == 'error':
+                rows['errors'].append(error_row(event, user_agent, url))
+            elif event['kind'] == 'performance':
+                rows['performance'].append(performance_row(event, url))
+            else:
+                rows['behavior'].append(behavior_row(event, user_agent, url))
+        
+        conn = get_db(ANALYTICS_DATABASE_PATH)
+        insert_events(conn, **rows)
+        
+        conn.commit()
+        
+        return jsonify({
+            'message': 'Events tracked successfully',
+            'accepted': len(events) - len(rejected),
+            'rejected': rejected
+        }), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @analytics_bp.route('/api/analytics/stats', methods=['GET'])
 def get_analytics_stats():
-    """Get analytics statistics"""
+    """Get analytics statistics from the hourly rollups"""
     try:
-        conn = sqlite3.connect('database/analytics.db')
-        c = conn.cursor()
+        try:
+            start_bucket, end_bucket = parse_stats_range(
+                request.args.get('start'),
+                request.args.get('end')
+            )
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO dates or datetimes'}), 400
         
-        # Get error statistics
-        c.execute('SELECT COUNT(*) FROM errors')
-        total_errors = c.fetchone()[0]
+        # Open-ended ranges compare against sentinels that sort outside any bucket
+        bounds = (start_bucket or '', end_bucket or '~')
         
-        c.execute('''
-            SELECT type, COUNT(*) as count
-            FROM errors
-            GROUP BY type
-        ''')
-        error_types = dict(c.fetchall())
+        conn = get_db(ANALYTICS_DATABASE_PATH)
+        c = conn.cursor()
         
-        # Get performance statistics
+        # Get error and user behavior statistics
         c.execute('''
-            SELECT AVG(page_load) as avg_page_load,
-                   AVG(dom_content_loaded) as avg_dom_content_loaded,
-                   AVG(first_paint) as avg_first_paint
-            FROM performance
-        ''')
-        performance_stats = dict(zip(['avg_page_load', 'avg_dom_content_loaded', 'avg_first_paint'], c.fetchone()))
+            SELECT category, type, SUM(count) as count
+            FROM event_rollups
+            WHERE bucket BETWEEN ? AND ?
+            GROUP BY category, type
+        ''', bounds)
+        error_types = {}
+        behavior_types = {}
+        for category, event_type, count in c.fetchall():
+            if category == 'error':
+                error_types[event_type] = count
+            else:
+                behavior_types[event_type] = count
+        total_errors = sum(error_types.values())
         
-        # Get user behavior statistics
+        # Get performance statistics
         c.execute('''
-            SELECT type, COUNT(*) as count
-            FROM user_behavior
-            GROUP BY type
-        ''')
-        behavior_types = dict(c.fetchall())
+            SELECT field, SUM(total), SUM(samples)
+            FROM performance_rollups
+            WHERE bucket BETWEEN ? AND ?
+            AND field IN ('page_load', 'dom_content_loaded', 'first_paint')
+            GROUP BY field
+        ''', bounds)
+        averages = {
+            field: total / samples if samples else None
+            for field, total, samples in c.fetchall()
+        }
+        performance_stats = {
+            f'avg_{field}': averages.get(field)
+            for field in ('page_load', 'dom_content_loaded', 'first_paint')
+        }
+        performance_stats['percentiles'] = query_percentiles(
+            conn,
+            ['page_load', 'dom_content_loaded', 'first_paint'],
+            start_bucket and start_bucket[:10],
+            end_bucket and end_bucket[:10]
+        )
         
         # Get recent errors
         c.execute('''
             SELECT type, message, timestamp
             FROM errors
+            WHERE timestamp BETWEEN ? AND ?
             ORDER BY timestamp DESC
             LIMIT 5
-        ''')
+        ''', (bounds[0], bounds[1] + '~'))
         recent_errors = [
             {
                 'type': row[0],
@@ -218,9 +388,11 @@ def get_analytics_stats():
             for row in c.fetchall()
         ]
         
-        conn.close()
-        
         return jsonify({
+            'range': {
+                'start': start_bucket,
+                'end': end_bucket
+            },
             'errors': {
                 'total': total_errors,
                 'by_type': error_types,
@@ -233,16 +405,52 @@ def get_analytics_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@analytics_bp.route('/api/analytics/performance/percentiles', methods=['GET'])
+def get_performance_percentiles():
+    """Get p50/p90/p99 timings by URL and date range"""
+    try:
+        fields = request.args.getlist('field') or PERFORMANCE_COLUMNS
+        unknown = [field for field in fields if field not in PERFORMANCE_COLUMNS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        
+        try:
+            start_bucket, end_bucket = parse_stats_range(
+                request.args.get('start'),
+                request.args.get('end')
+            )
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO dates or datetimes'}), 400
+        
+        url = request.args.get('url')
+        conn = get_db(ANALYTICS_DATABASE_PATH)
+        
+        return jsonify({
+            'url': normalize_url(url) if url is not None else None,
+            'range': {
+                'start': start_bucket and start_bucket[:10],
+                'end': end_bucket and end_bucket[:10]
+            },
+            'percentiles': query_percentiles(
+                conn,
+                fields,
+                start_bucket and start_bucket[:10],
+                end_bucket and end_bucket[:10],
+                url
+            )
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @analytics_bp.route('/analytics/website/<int:website_id>', methods=['GET'])
 @token_required
 def get_website_analytics(current_user, website_id):
     """Get analytics for a specific website"""
-    conn = sqlite3.connect('database/3clickbuilder.db')
-    conn.row_factory = sqlite3.Row
+    conn = get_db('database/3clickbuilder.db')
     website = conn.execute('SELECT * FROM websites WHERE id = ?', (website_id,)).fetchone()
     
     if not website:
-        conn.close()
         return jsonify({'message': 'Website not found!'}), 404
     
     # Get views in the last 30 days
@@ -271,8 +479,6 @@ def get_website_analytics(current_user, website_id):
         AND created_at >= date('now', '-30 days')
     ''', (website_id,)).fetchone()
     
-    conn.close()
-    
     return jsonify({
         'website_id': website_id,
         'views': [dict(row) for row in views],
@@ -281,6 +487,7 @@ def get_website_analytics(current_user, website_id):
     })
 
 @analytics_bp.route('/analytics/track', methods=['POST'])
+@ingest_limit
 def track_visit():
     """Track a website visit"""
     data = request.get_json()
@@ -288,7 +495,7 @@ def track_visit():
     if not data or not data.get('website_id'):
         return jsonify({'message': 'Missing website ID!'}), 400
     
-    conn = sqlite3.connect('database/3clickbuilder.db')
+    conn = get_db('database/3clickbuilder.db')
     conn.execute('''
         INSERT INTO website_views (
             website_id,
@@ -303,7 +510,6 @@ def track_visit():
         datetime.now()
     ))
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Visit tracked successfully!'})
 
@@ -311,7 +517,7 @@ def track_visit():
 @token_required
 def get_analytics_summary(current_user):
     """Get analytics summary for all user's websites"""
-    conn = sqlite3.connect('database/3clickbuilder.db')
+    conn = get_db('database/3clickbuilder.db')
     
     # Get total websites
     total_websites = conn.execute('''
@@ -341,8 +547,6 @@ def get_analytics_summary(current_user):
         LIMIT 5
     ''', (current_user['id'],)).fetchall()
     
-    conn.close()
-    
     return jsonify({
         'total_websites': total_websites['count'],
         'total_views_30d': total_views['count'],
@@ -350,4 +554,4 @@ def get_analytics_summary(current_user):
     })
 
 # Initialize database when module is imported
-init_analytics_db() 
\ No newline at end of file
+init_analytics_db()
\ No newline at end of file
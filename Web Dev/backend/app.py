@@ -1,13 +1,13 @@
 from flask import Flask
 from flask_cors import CORS
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 import os
 from dotenv import load_dotenv
 import logging
 from .routes import auth, websites, templates, subscriptions, analytics
-from .database import init_db
+from .database import init_db, init_app as init_database, check_storage_settings
 from .utils.error_handlers import handle_error
+from .services.website_generator import warm_up_templates
+from .utils.rate_limiting import limiter
 
 # Load environment variables
 load_dotenv()
@@ -26,12 +26,8 @@ def create_app():
     # Configure CORS
     CORS(app, resources={r"/*": {"origins": "*"}})
     
-    # Configure rate limiting
-    limiter = Limiter(
-        app=app,
-        key_func=get_remote_address,
-        default_limits=["200 per day", "50 per hour"]
-    )
+    # Configure rate limiting; counters are shared by all workers through SQLite storage
+    limiter.init_app(app)
     
     # Register blueprints
     app.register_blueprint(auth.auth_bp, url_prefix='/auth')
@@ -43,9 +39,18 @@ def create_app():
     # Register error handlers
     app.register_error_handler(Exception, handle_error)
     
+    # Return pooled database connections when each app context ends
+    init_database(app)
+    
     # Initialize database
     with app.app_context():
         init_db()
+        
+        # Report journal mode and pragmas actually in effect for each database file
+        app.config['DATABASE_STORAGE_SETTINGS'] = check_storage_settings()
+    
+    # Compile templates now rather than on each worker's first request
+    app.config['TEMPLATE_COMPILE_TIMES'] = warm_up_templates()
     
     return app
 
@@ -1,37 +1,324 @@
 import sqlite3
 import os
+import re
+import threading
+import time
+import logging
 from contextlib import contextmanager
-from .utils.error_handlers import handle_error
+from flask import g, has_app_context
+from .utils.error_handlers import handle_error, APIError, ServiceUnavailableError
+
+logger = logging.getLogger(__name__)
 
 # Database configuration
-DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'database/3clickbuilder.db')
+DATABASE_PATH = os.getenv(
+    'DATABASE_PATH',
+    os.path.join(os.path.dirname(__file__), 'database/3clickbuilder.db')
+)
+ANALYTICS_DATABASE_PATH = os.getenv('ANALYTICS_DATABASE_PATH', 'database/analytics.db')
+FEEDBACK_DATABASE_PATH = os.getenv('FEEDBACK_DATABASE_PATH', 'database/feedback.db')
 
-def get_db():
-    """Get database connection"""
-    try:
-        # Ensure database directory exists
-        os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+# Connection pool configuration
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+
+# Storage profiles applied to every new connection
+STORAGE_PROFILES = {
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,  # KiB when negative, i.e. ~16MB per connection
+        'mmap_size': 134217728,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    },
+    'development': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000
+    }
+}
+
+def get_storage_profile():
+    """Get the active storage profile, with per-pragma environment overrides"""
+    name = os.getenv('DB_STORAGE_PROFILE', 'production')
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f'Unknown storage profile: {name}')
+    
+    profile = dict(STORAGE_PROFILES[name])
+    for pragma in profile:
+        override = os.getenv(f'DB_PRAGMA_{pragma.upper()}')
+        if override is not None:
+            profile[pragma] = override
         
-        # Connect to database
-        conn = sqlite3.connect(DATABASE_PATH)
+        # Values are interpolated into PRAGMA statements, so keep them to plain words
+        if not re.match(r'^-?\w+$', str(profile[pragma])):
+            raise ValueError(f'Invalid value for PRAGMA {pragma}: {profile[pragma]}')
+    return profile
+
+def apply_storage_profile(conn, profile=None):
+    """Apply pragma settings to a connection"""
+    profile = profile or get_storage_profile()
+    
+    # busy_timeout first so the journal mode switch can wait on other workers
+    conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+    for pragma in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store'):
+        conn.execute(f'PRAGMA {pragma} = {profile[pragma]}').fetchall()
+
+class ConnectionPool:
+    """Bounded pool of reusable connections to a single SQLite database file"""
+    def __init__(self, path, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'discarded': 0
+        }
+
+    def _connect(self):
+        """Open a new connection to the pool's database file"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        profile = get_storage_profile()
+        conn = sqlite3.connect(
+            self.path,
+            timeout=int(profile['busy_timeout']) / 1000,
+            check_same_thread=False
+        )
         conn.row_factory = sqlite3.Row
+        try:
+            apply_storage_profile(conn, profile)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        """Ping connections that have been idle longer than the check interval"""
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        """Close a connection and free its slot (caller holds the lock)"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._size -= 1
+        self._stats['discarded'] += 1
+        self._condition.notify()
+
+    def acquire(self):
+        """Check out a connection, waiting up to the pool timeout for a free slot"""
+        deadline = None
+        with self._condition:
+            while True:
+                while self._idle:
+                    conn, idle_since = self._idle.pop()
+                    if self._is_healthy(conn, idle_since):
+                        self._stats['hits'] += 1
+                        return conn
+                    self._discard(conn)
+                
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._stats['misses'] += 1
+                    break
+                
+                if deadline is None:
+                    self._stats['waits'] += 1
+                    deadline = time.monotonic() + self.timeout
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise ServiceUnavailableError('Database connection pool exhausted')
+                self._condition.wait(remaining)
+        
+        try:
+            return self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            with self._condition:
+                self._discard(conn)
+            return
+        
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def close(self):
+        """Close all idle connections"""
+        with self._condition:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+    def stats(self):
+        """Return pool counters for monitoring"""
+        with self._condition:
+            return dict(
+                self._stats,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                max_size=self.max_size
+            )
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+def get_pool(path=DATABASE_PATH):
+    """Get the connection pool for a database file, creating it on first use"""
+    global _pools_pid
+    key = os.path.abspath(path)
+    with _pools_lock:
+        # Connections must not be shared with a forked parent (gunicorn workers)
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(key)
+        return pool
+
+def get_pool_stats():
+    """Get hit/miss/wait counters for every connection pool in this process"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.path: pool.stats() for pool in pools}
+
+def check_storage_settings(paths=None):
+    """Report the effective pragma settings for each database file"""
+    paths = paths or [DATABASE_PATH, ANALYTICS_DATABASE_PATH, FEEDBACK_DATABASE_PATH]
+    expected = get_storage_profile()
+    report = {}
+    
+    for path in paths:
+        with pooled_connection(path) as conn:
+            settings = {
+                pragma: conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                for pragma in expected
+            }
+        
+        # WAL is persistent per file and silently refused on some filesystems
+        if str(settings['journal_mode']).lower() != str(expected['journal_mode']).lower():
+            logger.warning(
+                f"{path}: journal_mode is {settings['journal_mode']}, "
+                f"expected {expected['journal_mode']}"
+            )
+        logger.info(f'{path}: storage settings {settings}')
+        report[os.path.abspath(path)] = settings
+    
+    return report
+
+class _ScopedConnections(dict):
+    """Connections checked out by one app context or thread"""
+    def release_all(self):
+        while self:
+            path, conn = self.popitem()
+            get_pool(path).release(conn)
+
+    def __del__(self):
+        # Runs when the owning context or thread goes away so slots are not leaked
+        try:
+            self.release_all()
+        except Exception:
+            pass
+
+_thread_local = threading.local()
+
+def _connection_scope():
+    """Connections held by the current app context, or by the current thread"""
+    if has_app_context():
+        if '_db_connections' not in g:
+            g._db_connections = _ScopedConnections()
+        return g._db_connections
+    
+    if not hasattr(_thread_local, 'connections'):
+        _thread_local.connections = _ScopedConnections()
+    return _thread_local.connections
+
+def get_db(path=DATABASE_PATH):
+    """Get database connection"""
+    try:
+        scope = _connection_scope()
+        conn = scope.get(path)
+        if conn is None:
+            conn = scope[path] = get_pool(path).acquire()
         
         return conn
+    except APIError:
+        raise
     except Exception as e:
         raise handle_error(e)
 
+def close_db(exception=None):
+    """Return the current context's connections to their pools"""
+    if has_app_context():
+        connections = g.pop('_db_connections', None)
+    else:
+        connections = getattr(_thread_local, 'connections', None)
+    
+    if connections:
+        connections.release_all()
+
+def init_app(app):
+    """Register connection teardown with the Flask application"""
+    app.teardown_appcontext(close_db)
+
+@contextmanager
+def pooled_connection(path=DATABASE_PATH):
+    """Borrow a connection for the duration of a block, outside of any request"""
+    pool = get_pool(path)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
 @contextmanager
-def db_transaction():
+def db_transaction(path=DATABASE_PATH):
     """Context manager for database transactions"""
-    conn = get_db()
+    conn = get_db(path)
     try:
         yield conn
         conn.commit()
     except Exception as e:
         conn.rollback()
         raise handle_error(e)
-    finally:
-        conn.close()
 
 def init_db():
     """Initialize database with required tables"""
@@ -49,7 +336,8 @@ def init_db():
                 is_active BOOLEAN DEFAULT TRUE,
                 is_admin BOOLEAN DEFAULT FALSE,
                 subscription_status TEXT DEFAULT 'free',
-                subscription_end_date TIMESTAMP
+                subscription_end_date TIMESTAMP,
+                stripe_customer_id TEXT
             )
             ''')
             
@@ -66,6 +354,7 @@ def init_db():
                 updated_at TIMESTAMP,
                 is_published BOOLEAN DEFAULT FALSE,
                 custom_domain TEXT,
+                version_count INTEGER NOT NULL DEFAULT 0,
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
             ''')
@@ -95,9 +384,26 @@ def init_db():
                 status TEXT NOT NULL,
                 start_date TIMESTAMP,
                 end_date TIMESTAMP,
+                cancel_at_period_end BOOLEAN DEFAULT FALSE,
+                stripe_synced_at REAL,
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
             ''')
+            migrate_subscriptions(db)
+            
+            # Create stripe_events table (webhook events already applied to the mirror)
+            db.execute('''
+            CREATE TABLE IF NOT EXISTS stripe_events (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                created REAL NOT NULL,
+                received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stripe_events_created
+            ON stripe_events (created)
+            ''')
             
             # Create website_analytics table
             db.execute('''
@@ -107,9 +413,11 @@ def init_db():
                 page_views INTEGER DEFAULT 0,
                 unique_visitors INTEGER DEFAULT 0,
                 date DATE,
-                FOREIGN KEY (website_id) REFERENCES websites (id)
+                FOREIGN KEY (website_id) REFERENCES websites (id),
+                UNIQUE (website_id, date)
             )
             ''')
+            migrate_website_analytics(db)
             
             # Create website_versions table
             db.execute('''
@@ -120,10 +428,67 @@ def init_db():
                 content JSON,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 created_by INTEGER,
+                storage_kind TEXT NOT NULL DEFAULT 'snapshot',
+                base_version INTEGER,
+                delta BLOB,
+                content_hash TEXT,
+                content_size INTEGER,
                 FOREIGN KEY (website_id) REFERENCES websites (id),
-                FOREIGN KEY (created_by) REFERENCES users (id)
+                FOREIGN KEY (created_by) REFERENCES users (id),
+                UNIQUE (website_id, version_number)
+            )
+            ''')
+            migrate_website_versions(db)
+            migrate_version_numbers(db)
+            
+            # Create version_blobs table (version content stored once per distinct hash)
+            db.execute('''
+            CREATE TABLE IF NOT EXISTS version_blobs (
+                content_hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            
+            # Create rendered_sites table
+            db.execute('''
+            CREATE TABLE IF NOT EXISTS rendered_sites (
+                website_id INTEGER PRIMARY KEY,
+                html BLOB NOT NULL,
+                html_gzip BLOB NOT NULL,
+                html_brotli BLOB,
+                etag TEXT NOT NULL,
+                content_length INTEGER NOT NULL,
+                rendered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (website_id) REFERENCES websites (id)
+            )
+            ''')
+            
+            # Create jobs table (render/publish work queue; times are epoch seconds)
+            db.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_type TEXT NOT NULL,
+                payload JSON NOT NULL,
+                user_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                run_after REAL NOT NULL,
+                leased_until REAL,
+                worker_id TEXT,
+                last_error TEXT,
+                result JSON,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
             )
             ''')
+            db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after
+            ON jobs (status, run_after)
+            ''')
             
             # Create api_keys table
             db.execute('''
@@ -138,9 +503,195 @@ def init_db():
             )
             ''')
             
+            # Create revoked_tokens table (rows are pruned once the token has expired anyway)
+            db.execute('''
+            CREATE TABLE IF NOT EXISTS revoked_tokens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                token_id TEXT UNIQUE NOT NULL,
+                user_id INTEGER,
+                expires_at REAL NOT NULL,
+                revoked_at REAL NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+            ''')
+            db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at
+            ON revoked_tokens (expires_at)
+            ''')
+            
     except Exception as e:
         raise handle_error(e)
 
+def migrate_website_analytics(db):
+    """Merge duplicate day rows and enforce one row per website per day"""
+    # Tables created with the UNIQUE constraint, or already migrated, have nothing to do
+    for index in db.execute("PRAGMA index_list('website_analytics')").fetchall():
+        columns = [
+            row['name']
+            for row in db.execute(f"PRAGMA index_info('{index['name']}')").fetchall()
+        ]
+        if index['unique'] and columns == ['website_id', 'date']:
+            return
+    
+    # Fold every duplicate into the oldest row for that website and day
+    db.execute('''
+    UPDATE website_analytics
+    SET page_views = (
+            SELECT SUM(page_views) FROM website_analytics AS d
+            WHERE d.website_id = website_analytics.website_id
+            AND d.date = website_analytics.date
+        ),
+        unique_visitors = (
+            SELECT SUM(unique_visitors) FROM website_analytics AS d
+            WHERE d.website_id = website_analytics.website_id
+            AND d.date = website_analytics.date
+        )
+    WHERE id IN (
+        SELECT MIN(id) FROM website_analytics
+        GROUP BY website_id, date
+        HAVING COUNT(*) > 1
+    )
+    ''')
+    db.execute('''
+    DELETE FROM website_analytics
+    WHERE id NOT IN (
+        SELECT MIN(id) FROM website_analytics
+        GROUP BY website_id, date
+    )
+    ''')
+    db.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_website_analytics_website_date
+    ON website_analytics (website_id, date)
+    ''')
+
+def migrate_subscriptions(db):
+    """Add Stripe mirror columns and enforce one row per Stripe subscription"""
+    columns = {
+        row['name']
+        for row in db.execute("PRAGMA table_info('users')").fetchall()
+    }
+    if 'stripe_customer_id' not in columns:
+        db.execute('ALTER TABLE users ADD COLUMN stripe_customer_id TEXT')
+    
+    columns = {
+        row['name']
+        for row in db.execute("PRAGMA table_info('subscriptions')").fetchall()
+    }
+    if 'cancel_at_period_end' not in columns:
+        db.execute('ALTER TABLE subscriptions ADD COLUMN cancel_at_period_end BOOLEAN DEFAULT FALSE')
+    if 'stripe_synced_at' not in columns:
+        db.execute('ALTER TABLE subscriptions ADD COLUMN stripe_synced_at REAL')
+    
+    # Keep the newest row for each Stripe subscription so webhooks can upsert by its id
+    db.execute('''
+    DELETE FROM subscriptions
+    WHERE stripe_subscription_id IS NOT NULL
+    AND id NOT IN (
+        SELECT MAX(id) FROM subscriptions
+        WHERE stripe_subscription_id IS NOT NULL
+        GROUP BY stripe_subscription_id
+    )
+    ''')
+    db.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_subscriptions_stripe_subscription_id
+    ON subscriptions (stripe_subscription_id)
+    ''')
+    db.execute('''
+    CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id
+    ON subscriptions (user_id)
+    ''')
+
+def migrate_website_versions(db):
+    """Add delta storage columns; existing rows hold full content and become snapshots"""
+    columns = {
+        row['name']
+        for row in db.execute("PRAGMA table_info('website_versions')").fetchall()
+    }
+    
+    if 'storage_kind' not in columns:
+        db.execute(
+            "ALTER TABLE website_versions ADD COLUMN storage_kind TEXT NOT NULL DEFAULT 'snapshot'"
+        )
+    if 'base_version' not in columns:
+        db.execute('ALTER TABLE website_versions ADD COLUMN base_version INTEGER')
+    if 'delta' not in columns:
+        db.execute('ALTER TABLE website_versions ADD COLUMN delta BLOB')
+    
+    # Listing metadata; rows written before these columns are filled in lazily on first listing
+    if 'content_hash' not in columns:
+        db.execute('ALTER TABLE website_versions ADD COLUMN content_hash TEXT')
+    if 'content_size' not in columns:
+        db.execute('ALTER TABLE website_versions ADD COLUMN content_size INTEGER')
+    
+    db.execute('''
+    CREATE INDEX IF NOT EXISTS idx_website_versions_content_hash
+    ON website_versions (content_hash)
+    ''')
+
+def migrate_version_numbers(db):
+    """Add the per-website version counter and enforce one row per website per version number"""
+    columns = {
+        row['name']
+        for row in db.execute("PRAGMA table_info('websites')").fetchall()
+    }
+    if 'version_count' not in columns:
+        db.execute('ALTER TABLE websites ADD COLUMN version_count INTEGER NOT NULL DEFAULT 0')
+        db.execute('''
+        UPDATE websites
+        SET version_count = COALESCE((
+            SELECT MAX(version_number) FROM website_versions
+            WHERE website_versions.website_id = websites.id
+        ), 0)
+        ''')
+    
+    # Tables created with the UNIQUE constraint, or already migrated, have nothing to do
+    for index in db.execute("PRAGMA index_list('website_versions')").fetchall():
+        columns = [
+            row['name']
+            for row in db.execute(f"PRAGMA index_info('{index['name']}')").fetchall()
+        ]
+        if index['unique'] and columns == ['website_id', 'version_number']:
+            return
+    
+    # Concurrent saves could share a number; keep the first row and append the others in order
+    duplicates = db.execute('''
+    SELECT id, website_id FROM website_versions
+    WHERE id NOT IN (
+        SELECT MIN(id) FROM website_versions
+        GROUP BY website_id, version_number
+    )
+    ORDER BY id
+    ''').fetchall()
+    for duplicate in duplicates:
+        db.execute(
+            '''
+            UPDATE website_versions
+            SET version_number = (
+                SELECT MAX(version_number) + 1 FROM website_versions
+                WHERE website_id = ?
+            )
+            WHERE id = ?
+            ''',
+            (duplicate['website_id'], duplicate['id'])
+        )
+        db.execute(
+            '''
+            UPDATE websites
+            SET version_count = (
+                SELECT MAX(version_number) FROM website_versions
+                WHERE website_id = ?
+            )
+            WHERE id = ?
+            ''',
+            (duplicate['website_id'], duplicate['website_id'])
+        )
+    
+    db.execute('DROP INDEX IF EXISTS idx_website_versions_website_version')
+    db.execute('''
+    CREATE UNIQUE INDEX idx_website_versions_website_version
+    ON website_versions (website_id, version_number)
+    ''')
+
 def execute_query(query, params=None):
     """Execute a database query"""
     try:
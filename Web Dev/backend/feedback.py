@@ -1,18 +1,16 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-import sqlite3
 import json
 import os
 from pathlib import Path
+from .database import get_db, get_pool, FEEDBACK_DATABASE_PATH
 
 feedback_bp = Blueprint('feedback', __name__)
 
 def init_feedback_db():
     """Initialize the feedback database"""
-    db_path = Path('database/feedback.db')
-    db_path.parent.mkdir(exist_ok=True)
-    
-    conn = sqlite3.connect(db_path)
+    pool = get_pool(FEEDBACK_DATABASE_PATH)
+    conn = pool.acquire()
     c = conn.cursor()
     c.execute('''
         CREATE TABLE IF NOT EXISTS feedback (
@@ -28,7 +26,7 @@ def init_feedback_db():
         )
     ''')
     conn.commit()
-    conn.close()
+    pool.release(conn)
 
 @feedback_bp.route('/api/feedback', methods=['POST'])
 def submit_feedback():
@@ -43,7 +41,7 @@ def submit_feedback():
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
         # Connect to database
-        conn = sqlite3.connect('database/feedback.db')
+        conn = get_db(FEEDBACK_DATABASE_PATH)
         c = conn.cursor()
         
         # Insert feedback
@@ -67,8 +65,6 @@ def submit_feedback():
         # Log feedback to file for backup
         log_feedback(data, feedback_id)
         
-        conn.close()
-        
         return jsonify({
             'message': 'Feedback submitted successfully',
             'id': feedback_id
@@ -106,7 +102,7 @@ def log_feedback(data, feedback_id):
 def get_feedback_stats():
     """Get feedback statistics"""
     try:
-        conn = sqlite3.connect('database/feedback.db')
+        conn = get_db(FEEDBACK_DATABASE_PATH)
         c = conn.cursor()
         
         # Get total feedback count
@@ -143,8 +139,6 @@ def get_feedback_stats():
             for row in c.fetchall()
         ]
         
-        conn.close()
-        
         return jsonify({
             'total_count': total_count,
             'type_stats': type_stats,
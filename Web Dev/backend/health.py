@@ -1,8 +1,13 @@
 from flask import Blueprint, jsonify
-import sqlite3
 import os
 import psutil
 import time
+from .database import pooled_connection, get_pool_stats
+from .services.analytics import page_view_buffer
+from .services.website_generator import tradie_bot
+from .services.job_queue import get_queue_stats
+from .utils.auth import get_auth_cache_stats
+from .services.password_hashing import password_hasher
 
 health_bp = Blueprint('health', __name__)
 
@@ -14,6 +19,11 @@ def health_check():
         'timestamp': time.time(),
         'components': {
             'database': check_database(),
+            'analytics_buffer': check_analytics_buffer(),
+            'site_generator': check_site_generator(),
+            'job_queue': check_job_queue(),
+            'auth_cache': check_auth_cache(),
+            'password_hashing': check_password_hashing(),
             'disk': check_disk_space(),
             'memory': check_memory_usage(),
             'uptime': get_uptime()
@@ -29,16 +39,16 @@ def health_check():
 def check_database():
     """Check database connection and size"""
     try:
-        conn = sqlite3.connect('database/3clickbuilder.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM websites')
-        count = cursor.fetchone()[0]
-        conn.close()
+        with pooled_connection('database/3clickbuilder.db') as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM websites')
+            count = cursor.fetchone()[0]
         
         return {
             'status': 'healthy',
             'message': 'Database connection successful',
-            'websites_count': count
+            'websites_count': count,
+            'pools': get_pool_stats()
         }
     except Exception as e:
         return {
@@ -46,6 +56,58 @@ def check_database():
             'message': f'Database error: {str(e)}'
         }
 
+def check_analytics_buffer():
+    """Check the page view write-behind buffer"""
+    stats = page_view_buffer.stats()
+    return dict(
+        stats,
+        status='healthy' if stats['pending_rows'] < stats['max_keys'] else 'unhealthy',
+        message=f"{stats['pending_hits']} buffered hits awaiting flush"
+    )
+
+def check_site_generator():
+    """Report render cache and post-processing pipeline statistics"""
+    pipeline = tradie_bot.pipeline.stats()
+    return {
+        'status': 'healthy',
+        'message': f"{sum(stage['bytes_saved'] for stage in pipeline.values())} bytes saved by post-processing",
+        'render_cache': tradie_bot.render_cache.stats(),
+        'pipeline': pipeline
+    }
+
+def check_job_queue():
+    """Check the render/publish job queue backlog"""
+    try:
+        stats = get_queue_stats()
+        return dict(
+            stats,
+            status='healthy',
+            message=f"{stats['queued']} jobs queued, {stats['dead']} dead-lettered"
+        )
+    except Exception as e:
+        return {
+            'status': 'unhealthy',
+            'message': f'Job queue error: {str(e)}'
+        }
+
+def check_auth_cache():
+    """Report verified-token and user lookup cache statistics"""
+    stats = get_auth_cache_stats()
+    return dict(
+        stats,
+        status='healthy',
+        message=f"{stats['tokens']['hits']} token and {stats['users']['hits']} user cache hits"
+    )
+
+def check_password_hashing():
+    """Report password hashing latency, queue wait and rejected requests"""
+    stats = password_hasher.stats()
+    return dict(
+        stats,
+        status='healthy' if stats['in_flight'] < stats['workers'] + stats['max_queue'] else 'unhealthy',
+        message=f"{stats['in_flight']} hashes in flight, {stats['rejected']} rejected"
+    )
+
 def check_disk_space():
     """Check available disk space"""
     try:
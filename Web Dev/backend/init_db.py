@@ -86,7 +86,8 @@ def init_db():
             page_views INTEGER DEFAULT 0,
             unique_visitors INTEGER DEFAULT 0,
             date DATE,
-            FOREIGN KEY (website_id) REFERENCES websites (id)
+            FOREIGN KEY (website_id) REFERENCES websites (id),
+            UNIQUE (website_id, date)
         )
         ''')
         
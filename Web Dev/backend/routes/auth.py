@@ -1,12 +1,11 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-import jwt
-from datetime import datetime, timedelta
-import os
+from datetime import datetime
 from ..models.user import User
 from ..database import get_db
 from ..utils.validators import validate_email, validate_password
-from ..utils.error_handlers import handle_error
+from ..utils.error_handlers import handle_error, AuthenticationError
+from ..utils.auth import invalidate_user, generate_token, verify_token, revoke_token, get_bearer_token
+from ..services.password_hashing import hash_password, verify_password, needs_rehash, rehash_password
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -36,7 +35,7 @@ def register():
             return jsonify({'error': 'Email already registered'}), 409
         
         # Create new user
-        hashed_password = generate_password_hash(data['password'])
+        hashed_password = hash_password(data['password'])
         cursor = db.execute(
             '''
             INSERT INTO users (email, password_hash, full_name, created_at)
@@ -77,7 +76,7 @@ def login():
             (data['email'],)
         ).fetchone()
         
-        if not user or not check_password_hash(user['password_hash'], data['password']):
+        if not user or not verify_password(user['password_hash'], data['password']):
             return jsonify({'error': 'Invalid email or password'}), 401
         
         # Update last login
@@ -85,8 +84,18 @@ def login():
             'UPDATE users SET last_login = ? WHERE id = ?',
             (datetime.now(), user['id'])
         )
+        
+        # Upgrade hashes made with an older method or cost while the password is at hand
+        if needs_rehash(user['password_hash']):
+            db.execute(
+                'UPDATE users SET password_hash = ? WHERE id = ?',
+                (rehash_password(data['password']), user['id'])
+            )
         db.commit()
         
+        # A fresh login always sees the current admin flag and plan
+        invalidate_user(user['id'])
+        
         # Generate token
         token = generate_token(user['id'])
         
@@ -105,8 +114,9 @@ def login():
 @auth_bp.route('/logout', methods=['POST'])
 def logout():
     try:
-        # In a real application, you might want to blacklist the token
-        # For now, we'll just return a success message
+        # Revoke the token so no worker accepts it again before it expires
+        revoke_token(get_bearer_token())
+        
         return jsonify({'message': 'Successfully logged out'})
         
     except Exception as e:
@@ -115,22 +125,11 @@ def logout():
 @auth_bp.route('/me', methods=['GET'])
 def get_current_user():
     try:
-        # Get token from header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Missing or invalid token'}), 401
-            
-        token = auth_header.split(' ')[1]
-        
-        # Verify token
+        # Verify token, including revocation
         try:
-            payload = jwt.decode(
-                token,
-                os.getenv('JWT_SECRET_KEY'),
-                algorithms=['HS256']
-            )
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+            payload = verify_token(get_bearer_token())
+        except AuthenticationError as e:
+            return jsonify({'error': e.message}), 401
         
         # Get user from database
         db = get_db()
@@ -151,16 +150,4 @@ def get_current_user():
         })
         
     except Exception as e:
-        return handle_error(e)
-
-def generate_token(user_id):
-    """Generate JWT token for user"""
-    payload = {
-        'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=1)
-    }
-    return jwt.encode(
-        payload,
-        os.getenv('JWT_SECRET_KEY'),
-        algorithm='HS256'
-    ) 
\ No newline at end of file
+        return handle_error(e)
\ No newline at end of file
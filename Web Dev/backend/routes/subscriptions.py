@@ -1,16 +1,13 @@
 from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta
-import stripe
 import os
 from ..database import get_db
 from ..utils.error_handlers import handle_error
 from ..utils.auth import login_required, subscription_required
+from ..utils.rate_limiting import limiter
+from ..services import billing
 
 subscriptions_bp = Blueprint('subscriptions', __name__)
 
-# Initialize Stripe
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
-
 # Define subscription plans
 SUBSCRIPTION_PLANS = {
     'tradie': {
@@ -65,84 +62,22 @@ def create_subscription():
         if 'payment_method_id' not in data:
             return jsonify({'error': 'Payment method is required'}), 400
             
-        # Get or create Stripe customer
         db = get_db()
         user = db.execute(
             'SELECT * FROM users WHERE id = ?',
             (user_id,)
         ).fetchone()
         
-        if not user['stripe_customer_id']:
-            customer = stripe.Customer.create(
-                email=user['email'],
-                payment_method=data['payment_method_id'],
-                invoice_settings={'default_payment_method': data['payment_method_id']}
-            )
-            db.execute(
-                'UPDATE users SET stripe_customer_id = ? WHERE id = ?',
-                (customer.id, user_id)
-            )
-        else:
-            customer = stripe.Customer.retrieve(user['stripe_customer_id'])
-        
-        # Create setup fee invoice
-        setup_invoice = stripe.Invoice.create(
-            customer=customer.id,
-            collection_method='charge_automatically',
-            pending_invoice_items_behavior='exclude',
-            items=[{
-                'price_data': {
-                    'unit_amount': int(SUBSCRIPTION_PLANS['tradie']['setup_fee'] * 100),
-                    'currency': 'aud',
-                    'product_data': {
-                        'name': 'Website Setup Fee',
-                        'description': 'One-time setup fee for your tradie website'
-                    }
-                },
-                'quantity': 1
-            }]
-        )
-        
-        # Create monthly subscription
-        subscription = stripe.Subscription.create(
-            customer=customer.id,
-            items=[{
-                'price_data': {
-                    'unit_amount': int(SUBSCRIPTION_PLANS['tradie']['monthly_fee'] * 100),
-                    'currency': 'aud',
-                    'recurring': {
-                        'interval': 'month'
-                    },
-                    'product_data': {
-                        'name': 'Monthly Website Hosting',
-                        'description': 'Monthly hosting and maintenance for your tradie website'
-                    }
-                },
-                'quantity': 1
-            }],
-            expand=['latest_invoice.payment_intent']
-        )
-        
-        # Update user's subscription in database
-        db.execute(
-            '''
-            INSERT INTO subscriptions (
-                user_id, stripe_customer_id, stripe_subscription_id,
-                plan_type, status, start_date, end_date
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''',
-            (
-                user_id,
-                customer.id,
-                subscription.id,
-                'tradie',
-                subscription.status,
-                datetime.now(),
-                datetime.fromtimestamp(subscription.current_period_end)
-            )
+        # Customer, setup fee invoice and subscription; the client sends a new Idempotency-Key
+        # for each checkout attempt, and a retried request with the same key reuses the objects
+        # already created
+        subscription, setup_invoice = billing.create_subscription(
+            user,
+            data['payment_method_id'],
+            'tradie',
+            SUBSCRIPTION_PLANS['tradie'],
+            request_key=request.headers.get('Idempotency-Key')
         )
-        db.commit()
         
         return jsonify({
             'message': 'Subscription created successfully',
@@ -173,19 +108,8 @@ def cancel_subscription():
         if not subscription:
             return jsonify({'error': 'No active subscription found'}), 404
         
-        # Cancel Stripe subscription
-        stripe.Subscription.delete(subscription['stripe_subscription_id'])
-        
-        # Update subscription in database
-        db.execute(
-            '''
-            UPDATE subscriptions 
-            SET status = 'canceled', end_date = ?
-            WHERE id = ?
-            ''',
-            (datetime.now(), subscription['id'])
-        )
-        db.commit()
+        # Cancel in Stripe and record the result in the local mirror
+        billing.cancel_subscription(user_id, subscription)
         
         return jsonify({
             'message': 'Subscription canceled successfully'
@@ -194,6 +118,21 @@ def cancel_subscription():
     except Exception as e:
         return handle_error(e)
 
+@subscriptions_bp.route('/webhook', methods=['POST'])
+@limiter.exempt
+def stripe_webhook():
+    """Apply Stripe subscription events to the local mirror"""
+    try:
+        status = billing.ingest_webhook(
+            request.get_data(),
+            request.headers.get('Stripe-Signature')
+        )
+        
+        return jsonify({'status': status})
+        
+    except Exception as e:
+        return handle_error(e)
+
 @subscriptions_bp.route('/current', methods=['GET'])
 @login_required
 def get_current_subscription():
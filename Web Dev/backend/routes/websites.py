@@ -1,15 +1,45 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from datetime import datetime
 import json
 from ..database import get_db
 from ..utils.error_handlers import handle_error
 from ..utils.auth import login_required
-from ..services.website_generator import generate_website_html
-from ..services.analytics import track_page_view
-from ..services.version_control import create_version, get_versions, restore_version
+from ..utils.rate_limiting import limiter
+from ..services.analytics import track_hit
+from ..services.rendered_sites import get_rendered_site, delete_rendered_site
+from ..services.site_assets import get_site_asset
+from ..services.bulk_generation import BULK_MAX_RECORDS
+from ..services.version_control import (
+    list_versions, get_version, restore_version, compare_versions,
+    create_version, save_website_version, VERSIONS_PAGE_SIZE
+)
+from ..services.website_jobs import queue_render, queue_publish, queue_bulk_generation
+from ..services.job_queue import get_job
 
 websites_bp = Blueprint('websites', __name__)
 
+# Holds the date a browser last viewed a site; scoped to the site's path
+VISITOR_COOKIE = 'last_visit'
+
+def _track_visit(website_id, repeat_views=True):
+    """Track a page view, and a unique visitor on a browser's first view today"""
+    # Returns the visit date for new visitors so the response can remember them. With
+    # repeat_views=False only a browser's first view today is counted
+    today = datetime.now().date().isoformat()
+    is_new_visitor = request.cookies.get(VISITOR_COOKIE) != today
+    if is_new_visitor or repeat_views:
+        track_hit(website_id, is_new_visitor)
+    return today if is_new_visitor else None
+
+def _mark_visitor(response, visit_date):
+    """Remember a new visitor for the rest of the day"""
+    if visit_date:
+        response.set_cookie(
+            VISITOR_COOKIE, visit_date, max_age=86400,
+            path=request.path, httponly=True, samesite='Lax'
+        )
+    return response
+
 @websites_bp.route('/create', methods=['POST'])
 @login_required
 def create_website():
@@ -26,9 +56,6 @@ def create_website():
         if not all(field in data for field in required_fields):
             return jsonify({'error': 'Missing required fields'}), 400
         
-        # Generate website HTML
-        html_content = generate_website_html(data)
-        
         # Create website in database
         db = get_db()
         cursor = db.execute(
@@ -49,19 +76,53 @@ def create_website():
                 datetime.now()
             )
         )
-        db.commit()
-        
         website_id = cursor.lastrowid
         
+        # The website and its first version are committed together
+        create_version(website_id, data, user_id)
+        
+        # Render off the request path
+        job_id = queue_render(website_id, user_id, snapshot=False)
+        
         return jsonify({
             'id': website_id,
             'message': 'Website created successfully',
-            'url': f"https://{data['businessName'].lower().replace(' ', '-')}"
+            'url': f"https://{data['businessName'].lower().replace(' ', '-')}",
+            'job_id': job_id
         }), 201
         
     except Exception as e:
         return handle_error(e)
 
+@websites_bp.route('/bulk', methods=['POST'])
+@login_required
+def create_websites_bulk():
+    try:
+        data = request.get_json() or {}
+        records = data.get('records')
+        
+        if not isinstance(records, list) or not records:
+            return jsonify({'error': 'records must be a non-empty list'}), 400
+        
+        if len(records) > BULK_MAX_RECORDS:
+            return jsonify({'error': f'At most {BULK_MAX_RECORDS} records per request'}), 413
+        
+        # Rendering runs in the job worker; the report is the job's result
+        job_id = queue_bulk_generation(
+            request.user['id'],
+            records,
+            publish=bool(data.get('publish'))
+        )
+        
+        return jsonify({
+            'message': 'Bulk generation queued',
+            'records': len(records),
+            'job_id': job_id
+        }), 202
+        
+    except Exception as e:
+        return handle_error(e)
+
 @websites_bp.route('/', methods=['GET'])
 @login_required
 def get_websites():
@@ -96,10 +157,11 @@ def get_website(website_id):
             return jsonify({'error': 'Website not found'}), 404
         
         # Track page view if website is published
+        visit_date = None
         if website['is_published']:
-            track_page_view(website_id)
+            visit_date = _track_visit(website_id)
         
-        return jsonify(dict(website))
+        return _mark_visitor(jsonify(dict(website)), visit_date)
         
     except Exception as e:
         return handle_error(e)
@@ -121,21 +183,17 @@ def update_website(website_id):
         if not website:
             return jsonify({'error': 'Website not found'}), 404
         
-        # Generate new HTML
-        html_content = generate_website_html(data)
+        # Update website and snapshot the new version in one transaction
+        version_number = save_website_version(website_id, data, user_id)
         
-        # Update website
-        db.execute(
-            '''
-            UPDATE websites 
-            SET content = ?, updated_at = ?
-            WHERE id = ?
-            ''',
-            (json.dumps(data), datetime.now(), website_id)
-        )
-        db.commit()
+        # Re-render and refresh the served document in the worker
+        job_id = queue_render(website_id, user_id, snapshot=False)
         
-        return jsonify({'message': 'Website updated successfully'})
+        return jsonify({
+            'message': 'Website updated successfully',
+            'version': version_number,
+            'job_id': job_id
+        }), 202
         
     except Exception as e:
         return handle_error(e)
@@ -157,6 +215,7 @@ def delete_website(website_id):
             return jsonify({'error': 'Website not found'}), 404
         
         # Delete website
+        delete_rendered_site(website_id)
         db.execute('DELETE FROM websites WHERE id = ?', (website_id,))
         db.commit()
         
@@ -181,16 +240,104 @@ def publish_website(website_id):
         if not website:
             return jsonify({'error': 'Website not found'}), 404
         
-        # Update publish status
-        db.execute(
-            'UPDATE websites SET is_published = TRUE WHERE id = ?',
-            (website_id,)
-        )
-        db.commit()
+        # Rendering and publishing happen in the worker
+        job_id = queue_publish(website_id, user_id)
         
         return jsonify({
-            'message': 'Website published successfully',
-            'url': f"https://{website['published_url']}"
+            'message': 'Website publish queued',
+            'url': f"https://{website['published_url']}",
+            'job_id': job_id
+        }), 202
+        
+    except Exception as e:
+        return handle_error(e)
+
+@websites_bp.route('/site/<published_url>', methods=['GET'])
+@limiter.exempt
+def serve_published_website(published_url):
+    try:
+        site = get_rendered_site(published_url)
+        
+        if not site:
+            return jsonify({'error': 'Website not found'}), 404
+        
+        # Browsers revalidate on every visit, so a 304 is counted only as a browser's first
+        # view today; repeat revalidations are not counted again
+        not_modified = site['etag'].strip('"') in request.if_none_match
+        visit_date = _track_visit(site['website_id'], repeat_views=not not_modified)
+        
+        headers = {
+            'ETag': site['etag'],
+            'Vary': 'Accept-Encoding',
+            # A response that sets the visitor cookie must not be stored by shared caches
+            'Cache-Control': f"{'private' if visit_date else 'public'}, max-age=0, must-revalidate"
+        }
+        
+        if not_modified:
+            return _mark_visitor(Response(status=304, headers=headers), visit_date)
+        
+        # Serve the smallest precompressed variant the client accepts
+        if site['html_brotli'] is not None and request.accept_encodings['br']:
+            body = site['html_brotli']
+            headers['Content-Encoding'] = 'br'
+        elif request.accept_encodings['gzip']:
+            body = site['html_gzip']
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            body = site['html']
+        
+        return _mark_visitor(Response(body, mimetype='text/html', headers=headers), visit_date)
+        
+    except Exception as e:
+        return handle_error(e)
+
+@websites_bp.route('/assets/<filename>', methods=['GET'])
+@limiter.exempt
+def serve_site_asset(filename):
+    try:
+        encodings = [
+            encoding for encoding in ('br', 'gzip')
+            if request.accept_encodings[encoding]
+        ]
+        asset = get_site_asset(filename, encodings)
+        
+        if not asset:
+            return jsonify({'error': 'Asset not found'}), 404
+        
+        body, mimetype, encoding = asset
+        
+        # Filenames carry a content hash, so a given URL never changes
+        headers = {
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': 'public, max-age=31536000, immutable'
+        }
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        
+        return Response(body, mimetype=mimetype, headers=headers)
+        
+    except Exception as e:
+        return handle_error(e)
+
+@websites_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_job_status(job_id):
+    try:
+        job = get_job(job_id, request.user['id'])
+        
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({
+            'id': job['id'],
+            'type': job['job_type'],
+            'status': job['status'],
+            'attempts': job['attempts'],
+            'max_attempts': job['max_attempts'],
+            'last_error': job['last_error'],
+            'result': job['result'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
         })
         
     except Exception as e:
@@ -212,8 +359,81 @@ def get_website_versions(website_id):
         if not website:
             return jsonify({'error': 'Website not found'}), 404
         
-        versions = get_versions(website_id)
-        return jsonify(versions)
+        # Metadata only, newest first; pass next_before back as ?before= for the next page
+        page = list_versions(
+            website_id,
+            limit=request.args.get('limit', VERSIONS_PAGE_SIZE, type=int),
+            before=request.args.get('before', type=int)
+        )
+        return jsonify(page)
+        
+    except Exception as e:
+        return handle_error(e)
+
+@websites_bp.route('/<int:website_id>/versions/compare', methods=['GET'])
+@login_required
+def compare_website_versions(website_id):
+    try:
+        user_id = request.user['id']
+        version1 = request.args.get('from', type=int)
+        version2 = request.args.get('to', type=int)
+        
+        if version1 is None or version2 is None:
+            return jsonify({'error': 'from and to version numbers are required'}), 400
+        
+        # Verify ownership
+        db = get_db()
+        website = db.execute(
+            'SELECT * FROM websites WHERE id = ? AND user_id = ?',
+            (website_id, user_id)
+        ).fetchone()
+        
+        if not website:
+            return jsonify({'error': 'Website not found'}), 404
+        
+        found = db.execute(
+            '''
+            SELECT COUNT(*) FROM website_versions
+            WHERE website_id = ? AND version_number IN (?, ?)
+            ''',
+            (website_id, version1, version2)
+        ).fetchone()[0]
+        
+        if found < len({version1, version2}):
+            return jsonify({'error': 'Version not found'}), 404
+        
+        return jsonify(compare_versions(website_id, version1, version2))
+        
+    except Exception as e:
+        return handle_error(e)
+
+@websites_bp.route('/<int:website_id>/versions/<int:version_number>', methods=['GET'])
+@login_required
+def get_website_version(website_id, version_number):
+    try:
+        user_id = request.user['id']
+        
+        # Verify ownership
+        db = get_db()
+        website = db.execute(
+            'SELECT * FROM websites WHERE id = ? AND user_id = ?',
+            (website_id, user_id)
+        ).fetchone()
+        
+        if not website:
+            return jsonify({'error': 'Website not found'}), 404
+        
+        exists = db.execute(
+            'SELECT 1 FROM website_versions WHERE website_id = ? AND version_number = ?',
+            (website_id, version_number)
+        ).fetchone()
+        
+        if not exists:
+            return jsonify({'error': 'Version not found'}), 404
+        
+        version = get_version(website_id, version_number)
+        version['content'] = json.loads(version['content'])
+        return jsonify(version)
         
     except Exception as e:
         return handle_error(e)
@@ -234,21 +454,16 @@ def restore_website_version(website_id, version_id):
         if not website:
             return jsonify({'error': 'Website not found'}), 404
         
-        # Restore version
-        content = restore_version(website_id, version_id)
+        # Restore version; the website content and the new version are committed together
+        restore_version(website_id, version_id, user_id)
         
-        # Update website content
-        db.execute(
-            '''
-            UPDATE websites 
-            SET content = ?, updated_at = ?
-            WHERE id = ?
-            ''',
-            (json.dumps(content), datetime.now(), website_id)
-        )
-        db.commit()
+        # restore_version already recorded the snapshot, so only re-render
+        job_id = queue_render(website_id, user_id, snapshot=False)
         
-        return jsonify({'message': 'Version restored successfully'})
+        return jsonify({
+            'message': 'Version restored successfully',
+            'job_id': job_id
+        })
         
     except Exception as e:
         return handle_error(e) 
\ No newline at end of file
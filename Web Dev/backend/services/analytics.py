@@ -1,90 +1,191 @@
 from datetime import datetime, timedelta
-from ..database import get_db
+import atexit
+import logging
+import os
+import threading
+import time
+from ..database import get_db, pooled_connection
 from ..utils.error_handlers import handle_error
 
-def track_page_view(website_id):
-    """Track a page view for a website"""
-    try:
-        db = get_db()
-        today = datetime.now().date()
-        
-        # Check if there's already a record for today
-        existing_record = db.execute(
-            '''
-            SELECT * FROM website_analytics 
-            WHERE website_id = ? AND date = ?
-            ''',
-            (website_id, today)
-        ).fetchone()
+logger = logging.getLogger(__name__)
+
+# Write-behind buffer configuration
+ANALYTICS_WRITE_BEHIND = os.getenv('ANALYTICS_WRITE_BEHIND', 'true').lower() == 'true'
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 5))
+ANALYTICS_BUFFER_MAX_KEYS = int(os.getenv('ANALYTICS_BUFFER_MAX_KEYS', 1000))
+ANALYTICS_FLUSH_MAX_BACKOFF = float(os.getenv('ANALYTICS_FLUSH_MAX_BACKOFF', 300))
+
+# The (website_id, date) key makes this race-free across workers
+DAILY_COUNTERS_UPSERT = '''
+    INSERT INTO website_analytics (website_id, date, page_views, unique_visitors)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (website_id, date) DO UPDATE SET
+        page_views = page_views + excluded.page_views,
+        unique_visitors = unique_visitors + excluded.unique_visitors
+'''
+
+class PageViewBuffer:
+    """Per-process aggregation of daily counter deltas, flushed in batches"""
+    def __init__(self, flush_interval=ANALYTICS_FLUSH_INTERVAL,
+                 max_keys=ANALYTICS_BUFFER_MAX_KEYS, max_backoff=ANALYTICS_FLUSH_MAX_BACKOFF):
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.max_backoff = max_backoff
+        self._deltas = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._timer = None
+        self._timer_pid = None
+        self._stats = {
+            'buffered_hits': 0,
+            'flushed_rows': 0,
+            'flushed_hits': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'last_flush_seconds': 0.0
+        }
+
+    def add(self, website_id, page_views=0, unique_visitors=0):
+        """Buffer counter deltas for today, waking the flush thread if the buffer is full"""
+        key = (website_id, datetime.now().date())
+        with self._lock:
+            views, visitors = self._deltas.get(key, (0, 0))
+            self._deltas[key] = (views + page_views, visitors + unique_visitors)
+            self._stats['buffered_hits'] += page_views + unique_visitors
+            full = len(self._deltas) >= self.max_keys
         
-        if existing_record:
-            # Update existing record
-            db.execute(
-                '''
-                UPDATE website_analytics 
-                SET page_views = page_views + 1
-                WHERE id = ?
-                ''',
-                (existing_record['id'],)
+        self._ensure_timer()
+        if full:
+            # Never write on the request thread; the flush thread picks this up
+            self._flush_requested.set()
+
+    def flush(self):
+        """Write all buffered deltas in a single executemany transaction"""
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+            if not deltas:
+                return 0
+            
+            rows = [
+                (website_id, date, views, visitors)
+                for (website_id, date), (views, visitors) in deltas.items()
+            ]
+            started = time.monotonic()
+            try:
+                with pooled_connection() as db:
+                    db.executemany(DAILY_COUNTERS_UPSERT, rows)
+                    db.commit()
+            except Exception as e:
+                # Put the deltas back so the next flush retries them
+                with self._lock:
+                    for key, (views, visitors) in deltas.items():
+                        pending = self._deltas.get(key, (0, 0))
+                        self._deltas[key] = (pending[0] + views, pending[1] + visitors)
+                    self._stats['failed_flushes'] += 1
+                    # Back off so a failing database is not retried on every wake-up
+                    self._backoff = min(max(self._backoff * 2, self.flush_interval), self.max_backoff)
+                    self._retry_at = time.monotonic() + self._backoff
+                logger.error(f"Failed to flush page view buffer: {str(e)}")
+                return 0
+            
+            with self._lock:
+                self._backoff = 0.0
+                self._retry_at = 0.0
+                self._stats['flushes'] += 1
+                self._stats['flushed_rows'] += len(rows)
+                self._stats['flushed_hits'] += sum(row[2] + row[3] for row in rows)
+                self._stats['last_flush_seconds'] = time.monotonic() - started
+            return len(rows)
+
+    def _ensure_timer(self):
+        """Start the periodic flush thread in this process if it is not running"""
+        if self._timer_pid == os.getpid() and self._timer.is_alive():
+            return
+        with self._lock:
+            # A forked gunicorn worker inherits the object but not the thread
+            if self._timer_pid == os.getpid() and self._timer.is_alive():
+                return
+            self._timer = threading.Thread(
+                target=self._run,
+                name='page-view-buffer',
+                daemon=True
             )
-        else:
-            # Create new record
-            db.execute(
-                '''
-                INSERT INTO website_analytics (website_id, page_views, date)
-                VALUES (?, 1, ?)
-                ''',
-                (website_id, today)
+            self._timer_pid = os.getpid()
+            self._timer.start()
+
+    def _run(self):
+        while True:
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            delay = self._retry_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.flush()
+
+    def stats(self):
+        """Return buffered/flushed counters for monitoring"""
+        with self._lock:
+            return dict(
+                self._stats,
+                pending_rows=len(self._deltas),
+                pending_hits=sum(v + u for v, u in self._deltas.values()),
+                flush_interval=self.flush_interval,
+                max_keys=self.max_keys,
+                retry_in_seconds=max(self._retry_at - time.monotonic(), 0.0)
             )
-        
-        db.commit()
-        
-    except Exception as e:
-        raise handle_error(e)
 
-def track_unique_visitor(website_id, visitor_id):
-    """Track a unique visitor for a website"""
+page_view_buffer = PageViewBuffer()
+atexit.register(page_view_buffer.flush)
+
+def increment_daily_counters(website_id, page_views=0, unique_visitors=0):
+    """Atomically add to today's counters for a website"""
     try:
         db = get_db()
         today = datetime.now().date()
         
-        # Check if there's already a record for today
-        existing_record = db.execute(
-            '''
-            SELECT * FROM website_analytics 
-            WHERE website_id = ? AND date = ?
-            ''',
-            (website_id, today)
-        ).fetchone()
-        
-        if existing_record:
-            # Update existing record
-            db.execute(
-                '''
-                UPDATE website_analytics 
-                SET unique_visitors = unique_visitors + 1
-                WHERE id = ?
-                ''',
-                (existing_record['id'],)
-            )
-        else:
-            # Create new record
-            db.execute(
-                '''
-                INSERT INTO website_analytics (website_id, unique_visitors, date)
-                VALUES (?, 1, ?)
-                ''',
-                (website_id, today)
-            )
+        db.execute(
+            DAILY_COUNTERS_UPSERT,
+            (website_id, today, page_views, unique_visitors)
+        )
         
         db.commit()
         
     except Exception as e:
         raise handle_error(e)
 
+def record_daily_counters(website_id, page_views=0, unique_visitors=0):
+    """Record counters through the write-behind buffer, or directly if it is disabled"""
+    if ANALYTICS_WRITE_BEHIND:
+        page_view_buffer.add(website_id, page_views, unique_visitors)
+    else:
+        increment_daily_counters(website_id, page_views, unique_visitors)
+
+def track_page_view(website_id):
+    """Track a page view for a website"""
+    record_daily_counters(website_id, page_views=1)
+
+def track_unique_visitor(website_id, visitor_id):
+    """Track a unique visitor for a website"""
+    record_daily_counters(website_id, unique_visitors=1)
+
+def track_hit(website_id, is_new_visitor=False):
+    """Track a page view and, for first-time visitors, a unique visitor in one statement"""
+    record_daily_counters(
+        website_id,
+        page_views=1,
+        unique_visitors=1 if is_new_visitor else 0
+    )
+
 def get_website_analytics(website_id, start_date=None, end_date=None):
     """Get analytics data for a website"""
     try:
+        # Include this worker's not-yet-flushed hits
+        page_view_buffer.flush()
+        
         db = get_db()
         
         # Set default date range if not provided
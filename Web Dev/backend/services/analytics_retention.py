@@ -0,0 +1,481 @@
+from datetime import datetime, timedelta
+import argparse
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+from ..database import get_pool, ANALYTICS_DATABASE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Retention policy: raw events for N days, hourly rollups for M days, then daily
+ANALYTICS_RETENTION_DAYS = int(os.getenv('ANALYTICS_RETENTION_DAYS', 30))
+ANALYTICS_HOURLY_ROLLUP_DAYS = int(os.getenv('ANALYTICS_HOURLY_ROLLUP_DAYS', 90))
+ANALYTICS_ARCHIVE_DIR = os.getenv('ANALYTICS_ARCHIVE_DIR', 'archive/analytics')
+ANALYTICS_PURGE_BATCH_SIZE = int(os.getenv('ANALYTICS_PURGE_BATCH_SIZE', 1000))
+ANALYTICS_PURGE_PAUSE = float(os.getenv('ANALYTICS_PURGE_PAUSE', 0.05))
+
+# Daily percentile histograms are kept per URL, so they are dropped after their own window
+ANALYTICS_HISTOGRAM_DAYS = int(os.getenv('ANALYTICS_HISTOGRAM_DAYS', 365))
+
+RAW_EVENT_TABLES = ['errors', 'performance', 'user_behavior']
+
+PERFORMANCE_COLUMNS = [
+    'page_load', 'dom_content_loaded', 'first_paint', 'dns_lookup',
+    'tcp_connection', 'server_response', 'dom_processing', 'resource_loading'
+]
+
+EVENT_ROLLUP_UPSERT = '''
+    INSERT INTO event_rollups (bucket, category, type, count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (bucket, category, type) DO UPDATE SET
+        count = count + excluded.count
+'''
+
+PERFORMANCE_ROLLUP_UPSERT = '''
+    INSERT INTO performance_rollups (bucket, field, total, samples)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (bucket, field) DO UPDATE SET
+        total = total + excluded.total,
+        samples = samples + excluded.samples
+'''
+
+HISTOGRAM_UPSERT = '''
+    INSERT INTO performance_histograms (day, url, field, bucket, count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (day, url, field, bucket) DO UPDATE SET
+        count = count + excluded.count
+'''
+
+BUCKET_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}')
+ISO_TIMESTAMP_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]*'
+
+# Each histogram bucket is 5% wider than the last, bounding percentile error to ~2.5%.
+# Changing this invalidates stored histograms; rebuild them with rebuild-rollups.
+HISTOGRAM_GROWTH = 0.05
+HISTOGRAM_MAX_BUCKET = 400
+
+def init_analytics_db():
+    """Initialize the analytics database"""
+    pool = get_pool(ANALYTICS_DATABASE_PATH)
+    conn = pool.acquire()
+    c = conn.cursor()
+    
+    # Create tables for different types of analytics
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS errors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            message TEXT NOT NULL,
+            source TEXT,
+            lineno INTEGER,
+            colno INTEGER,
+            stack TEXT,
+            timestamp TEXT NOT NULL,
+            user_agent TEXT,
+            url TEXT
+        )
+    ''')
+    
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS performance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            page_load INTEGER,
+            dom_content_loaded INTEGER,
+            first_paint INTEGER,
+            dns_lookup INTEGER,
+            tcp_connection INTEGER,
+            server_response INTEGER,
+            dom_processing INTEGER,
+            resource_loading INTEGER,
+            timestamp TEXT NOT NULL,
+            url TEXT
+        )
+    ''')
+    
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS user_behavior (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            url TEXT,
+            user_agent TEXT
+        )
+    ''')
+    
+    # Hourly rollups maintained at ingest time, read by the stats endpoint
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS event_rollups (
+            bucket TEXT NOT NULL,
+            category TEXT NOT NULL,
+            type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, category, type)
+        )
+    ''')
+    
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS performance_rollups (
+            bucket TEXT NOT NULL,
+            field TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            samples INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, field)
+        )
+    ''')
+    
+    # Daily log-bucketed timing histograms per URL, used for percentiles
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS performance_histograms (
+            day TEXT NOT NULL,
+            url TEXT NOT NULL,
+            field TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, url, field, bucket)
+        )
+    ''')
+    
+    for table in RAW_EVENT_TABLES:
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)')
+    
+    # Backfill rollups the first time they are created on an existing database
+    needs_backfill = c.execute('''
+        SELECT (
+            (EXISTS (SELECT 1 FROM errors) OR EXISTS (SELECT 1 FROM user_behavior))
+            AND NOT EXISTS (SELECT 1 FROM event_rollups)
+        ) OR (
+            EXISTS (SELECT 1 FROM performance)
+            AND NOT (
+                EXISTS (SELECT 1 FROM performance_rollups)
+                AND EXISTS (SELECT 1 FROM performance_histograms)
+            )
+        )
+    ''').fetchone()[0]
+    if needs_backfill:
+        rebuild_rollups(conn)
+    
+    conn.commit()
+    pool.release(conn)
+
+def rollup_bucket(timestamp):
+    """Get the hourly rollup bucket (YYYY-MM-DDTHH) for an ISO timestamp"""
+    if isinstance(timestamp, str) and BUCKET_PATTERN.match(timestamp):
+        return timestamp[:13]
+    return datetime.now().strftime('%Y-%m-%dT%H')
+
+def event_timestamp(timestamp):
+    """Use an event's ISO timestamp, or the current time if it has none or another format"""
+    # Retention purges by comparing timestamps as strings, which only works for ISO ones
+    if isinstance(timestamp, str) and BUCKET_PATTERN.match(timestamp):
+        return timestamp
+    return datetime.now().isoformat()
+
+def histogram_bucket(value):
+    """Map a timing in milliseconds to its log-scale histogram bucket"""
+    if value < 1:
+        return 0
+    bucket = 1 + int(math.log(value) / math.log1p(HISTOGRAM_GROWTH))
+    return min(bucket, HISTOGRAM_MAX_BUCKET)
+
+def histogram_value(bucket):
+    """Get the representative timing for a histogram bucket"""
+    if bucket == 0:
+        return 0
+    return (1 + HISTOGRAM_GROWTH) ** (bucket - 1) * (1 + HISTOGRAM_GROWTH / 2)
+
+def normalize_url(url):
+    """Drop query strings and fragments so histograms are kept per page"""
+    if not url:
+        return ''
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}{parts.path}' if parts.netloc else parts.path
+
+def histogram_counts(performance):
+    """Count performance rows into (day, url, field, bucket) histogram cells"""
+    counts = {}
+    for row in performance:
+        day = rollup_bucket(row[len(PERFORMANCE_COLUMNS)])[:10]
+        url = normalize_url(row[len(PERFORMANCE_COLUMNS) + 1])
+        for column, value in zip(PERFORMANCE_COLUMNS, row):
+            if value is None:
+                continue
+            key = (day, url, column, histogram_bucket(value))
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+def update_rollups(conn, errors=(), performance=(), behavior=()):
+    """Fold newly inserted telemetry rows into the hourly rollup tables"""
+    event_counts = {}
+    for category, rows in (('error', errors), ('behavior', behavior)):
+        for row in rows:
+            timestamp = row[6] if category == 'error' else row[2]
+            key = (rollup_bucket(timestamp), category, row[0])
+            event_counts[key] = event_counts.get(key, 0) + 1
+    
+    performance_totals = {}
+    for row in performance:
+        bucket = rollup_bucket(row[len(PERFORMANCE_COLUMNS)])
+        for column, value in zip(PERFORMANCE_COLUMNS, row):
+            if value is None:
+                continue
+            total, samples = performance_totals.get((bucket, column), (0, 0))
+            performance_totals[(bucket, column)] = (total + value, samples + 1)
+    
+    c = conn.cursor()
+    if event_counts:
+        c.executemany(EVENT_ROLLUP_UPSERT, [
+            key + (count,) for key, count in event_counts.items()
+        ])
+    if performance_totals:
+        c.executemany(PERFORMANCE_ROLLUP_UPSERT, [
+            key + totals for key, totals in performance_totals.items()
+        ])
+        c.executemany(HISTOGRAM_UPSERT, [
+            key + (count,) for key, count in histogram_counts(performance).items()
+        ])
+
+def oldest_raw_day(conn):
+    """The first day (YYYY-MM-DD) that still has raw events, or None when there are none"""
+    days = [
+        conn.execute(
+            f'SELECT MIN(substr(timestamp, 1, 10)) FROM {table} WHERE timestamp GLOB ?',
+            (ISO_TIMESTAMP_GLOB,)
+        ).fetchone()[0]
+        for table in RAW_EVENT_TABLES
+    ]
+    days = [day for day in days if day is not None]
+    return min(days) if days else None
+
+def rebuild_rollups(conn, since=None, retention_days=ANALYTICS_RETENTION_DAYS):
+    """Recompute rollups from the raw telemetry tables and return the first day rebuilt (caller commits)"""
+    # Older rollups, including downsampled daily ones, are all that is left of purged raw events,
+    # so only days from the retention cutoff and the oldest raw row onwards are rebuilt. Retention
+    # purges whole days, so every day from the oldest raw row on is complete
+    oldest = oldest_raw_day(conn)
+    if oldest is None:
+        return None
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    since = max(since or '', cutoff, oldest)
+    c = conn.cursor()
+    c.execute('DELETE FROM event_rollups WHERE bucket >= ?', (since,))
+    c.execute('DELETE FROM performance_rollups WHERE bucket >= ?', (since,))
+    
+    for category, table in (('error', 'errors'), ('behavior', 'user_behavior')):
+        c.execute(f'''
+            INSERT INTO event_rollups (bucket, category, type, count)
+            SELECT substr(timestamp, 1, 13), ?, type, COUNT(*)
+            FROM {table}
+            WHERE timestamp >= ?
+            AND timestamp GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]*'
+            GROUP BY substr(timestamp, 1, 13), type
+        ''', (category, since))
+    
+    for column in PERFORMANCE_COLUMNS:
+        c.execute(f'''
+            INSERT INTO performance_rollups (bucket, field, total, samples)
+            SELECT substr(timestamp, 1, 13), ?, SUM({column}), COUNT({column})
+            FROM performance
+            WHERE {column} IS NOT NULL
+            AND timestamp >= ?
+            AND timestamp GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T[0-9][0-9]*'
+            GROUP BY substr(timestamp, 1, 13)
+        ''', (column, since))
+    
+    # Histogram buckets need log(), so they are rebuilt in Python in chunks
+    c.execute('DELETE FROM performance_histograms WHERE day >= ?', (since,))
+    rows = conn.execute(f'''
+        SELECT {', '.join(PERFORMANCE_COLUMNS)}, timestamp, url
+        FROM performance
+        WHERE timestamp >= ?
+    ''', (since,))
+    while True:
+        chunk = rows.fetchmany(5000)
+        if not chunk:
+            break
+        c.executemany(HISTOGRAM_UPSERT, [
+            key + (count,) for key, count in histogram_counts(chunk).items()
+        ])
+    
+    logger.info(f'Rebuilt analytics rollups from {since}')
+    return since
+
+def downsample_rollups(conn, before_day):
+    """Collapse hourly rollups older than before_day into one T00 bucket per day"""
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO event_rollups (bucket, category, type, count)
+        SELECT substr(bucket, 1, 10) || 'T00', category, type, SUM(count)
+        FROM event_rollups
+        WHERE bucket < ? AND substr(bucket, 12, 2) != '00'
+        GROUP BY substr(bucket, 1, 10), category, type
+        ON CONFLICT (bucket, category, type) DO UPDATE SET
+            count = count + excluded.count
+    ''', (before_day,))
+    c.execute('''
+        DELETE FROM event_rollups
+        WHERE bucket < ? AND substr(bucket, 12, 2) != '00'
+    ''', (before_day,))
+    
+    c.execute('''
+        INSERT INTO performance_rollups (bucket, field, total, samples)
+        SELECT substr(bucket, 1, 10) || 'T00', field, SUM(total), SUM(samples)
+        FROM performance_rollups
+        WHERE bucket < ? AND substr(bucket, 12, 2) != '00'
+        GROUP BY substr(bucket, 1, 10), field
+        ON CONFLICT (bucket, field) DO UPDATE SET
+            total = total + excluded.total,
+            samples = samples + excluded.samples
+    ''', (before_day,))
+    c.execute('''
+        DELETE FROM performance_rollups
+        WHERE bucket < ? AND substr(bucket, 12, 2) != '00'
+    ''', (before_day,))
+
+def archive_rows(archive_dir, table, rows):
+    """Append rows to gzip-compressed, date-partitioned JSON lines files"""
+    partitions = {}
+    for row in rows:
+        day = rollup_bucket(row['timestamp'])[:10]
+        partitions.setdefault(day, []).append(dict(row))
+    
+    for day, records in partitions.items():
+        path = Path(archive_dir) / table / f'{day}.jsonl.gz'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Appending writes a new gzip member; concatenated members read back as one stream
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+def purge_rows(conn, table, condition, params, archive_dir, batch_size, pause):
+    """Archive and delete the rows of a raw event table matching condition, in batches"""
+    purged = 0
+    while True:
+        rows = conn.execute(f'''
+            SELECT * FROM {table}
+            WHERE {condition}
+            ORDER BY timestamp
+            LIMIT ?
+        ''', params + (batch_size,)).fetchall()
+        if not rows:
+            return purged
+        
+        # Archive before deleting so a crash can only duplicate, never lose, rows
+        archive_rows(archive_dir, table, rows)
+        ids = [row['id'] for row in rows]
+        conn.execute(
+            f"DELETE FROM {table} WHERE id IN ({', '.join('?' for _ in ids)})",
+            ids
+        )
+        conn.commit()
+        purged += len(rows)
+        
+        # Short transactions with a pause let request writers interleave
+        time.sleep(pause)
+
+def prune_histograms(conn, before_day, batch_size, pause):
+    """Delete daily percentile histogram cells older than before_day, in batches"""
+    pruned = 0
+    while True:
+        deleted = conn.execute('''
+            DELETE FROM performance_histograms
+            WHERE rowid IN (
+                SELECT rowid FROM performance_histograms
+                WHERE day < ?
+                LIMIT ?
+            )
+        ''', (before_day, batch_size)).rowcount
+        conn.commit()
+        pruned += deleted
+        if deleted < batch_size:
+            return pruned
+        time.sleep(pause)
+
+def apply_retention(retention_days=ANALYTICS_RETENTION_DAYS,
+                    hourly_rollup_days=ANALYTICS_HOURLY_ROLLUP_DAYS,
+                    histogram_days=ANALYTICS_HISTOGRAM_DAYS,
+                    archive_dir=ANALYTICS_ARCHIVE_DIR,
+                    batch_size=ANALYTICS_PURGE_BATCH_SIZE,
+                    pause=ANALYTICS_PURGE_PAUSE):
+    """Archive and delete expired raw events, downsample old rollups and drop old histograms"""
+    now = datetime.now()
+    cutoff = (now - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    rollup_cutoff = (now - timedelta(days=hourly_rollup_days)).strftime('%Y-%m-%d')
+    histogram_cutoff = (now - timedelta(days=histogram_days)).strftime('%Y-%m-%d')
+    summary = {
+        'cutoff': cutoff,
+        'archived': {},
+        'rollup_cutoff': rollup_cutoff,
+        'histogram_cutoff': histogram_cutoff
+    }
+    
+    pool = get_pool(ANALYTICS_DATABASE_PATH)
+    conn = pool.acquire()
+    try:
+        for table in RAW_EVENT_TABLES:
+            # Rows written before timestamps were normalised may not be ISO strings, which
+            # never compare below the cutoff; they are purged on the first run instead
+            archived = purge_rows(conn, table, 'timestamp < ?', (cutoff,), archive_dir, batch_size, pause)
+            archived += purge_rows(
+                conn, table, 'NOT timestamp GLOB ?', (ISO_TIMESTAMP_GLOB,),
+                archive_dir, batch_size, pause
+            )
+            summary['archived'][table] = archived
+        
+        downsample_rollups(conn, rollup_cutoff)
+        conn.commit()
+        
+        summary['histograms_pruned'] = prune_histograms(conn, histogram_cutoff, batch_size, pause)
+    finally:
+        pool.release(conn)
+    
+    logger.info(f'Analytics retention applied: {summary}')
+    return summary
+
+def main():
+    """Run analytics maintenance commands"""
+    parser = argparse.ArgumentParser(description='Analytics database maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild = subparsers.add_parser('rebuild-rollups', help='Recompute rollups from raw events')
+    rebuild.add_argument(
+        '--since',
+        help='Only rebuild from this date (YYYY-MM-DD); earlier dates are raised to the retention '
+             'cutoff and the oldest raw event, so older rollups are never lost'
+    )
+    retention = subparsers.add_parser(
+        'apply-retention',
+        help='Archive and purge expired raw events, downsample old rollups and drop old histograms'
+    )
+    retention.add_argument('--days', type=int, default=ANALYTICS_RETENTION_DAYS)
+    retention.add_argument('--hourly-rollup-days', type=int, default=ANALYTICS_HOURLY_ROLLUP_DAYS)
+    retention.add_argument('--histogram-days', type=int, default=ANALYTICS_HISTOGRAM_DAYS)
+    retention.add_argument('--archive-dir', default=ANALYTICS_ARCHIVE_DIR)
+    retention.add_argument('--batch-size', type=int, default=ANALYTICS_PURGE_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    init_analytics_db()
+    if args.command == 'rebuild-rollups':
+        pool = get_pool(ANALYTICS_DATABASE_PATH)
+        conn = pool.acquire()
+        since = rebuild_rollups(conn, args.since)
+        conn.commit()
+        pool.release(conn)
+        print(json.dumps({'rebuilt_since': since}))
+    elif args.command == 'apply-retention':
+        summary = apply_retention(
+            retention_days=args.days,
+            hourly_rollup_days=args.hourly_rollup_days,
+            histogram_days=args.histogram_days,
+            archive_dir=args.archive_dir,
+            batch_size=args.batch_size
+        )
+        print(json.dumps(summary, indent=2))
+
+if __name__ == '__main__':
+    main() 
@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import stripe
+from ..database import get_db
+from ..utils.auth import invalidate_user
+from ..utils.error_handlers import handle_error, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Stripe configuration; STRIPE_API_BASE points the client at a local fake such as stripe-mock
+stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')
+if STRIPE_API_BASE:
+    stripe.api_base = STRIPE_API_BASE
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+
+# Every write carries an idempotency key, so retrying failed network calls is safe
+stripe.max_network_retries = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', 2))
+STRIPE_MAX_CONCURRENCY = int(os.getenv('STRIPE_MAX_CONCURRENCY', 4))
+
+# Stripe redelivers events for up to three days; remembering them longer is enough to drop repeats
+STRIPE_EVENT_RETENTION = float(os.getenv('STRIPE_EVENT_RETENTION', 30 * 86400))
+
+SUBSCRIPTION_EVENTS = (
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted'
+)
+
+# Stripe never reactivates a subscription in these states; resubscribing creates a new one
+TERMINAL_STATUSES = ('canceled', 'incomplete_expired')
+
+# Client-supplied Idempotency-Key headers; one per checkout attempt, reused only for its retries
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+_executor = ThreadPoolExecutor(max_workers=STRIPE_MAX_CONCURRENCY, thread_name_prefix='stripe')
+
+def idempotency_key(*parts):
+    """Derive a stable Stripe idempotency key from the parts that identify a write"""
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value) if value else None
+
+def stripe_time(subscription):
+    """The latest Stripe timestamp on a subscription, to order API results against events"""
+    # Only Stripe's clock is compared with event['created']; the local clock can be skewed
+    return max(
+        subscription.get(field) or 0
+        for field in ('created', 'start_date', 'current_period_start', 'canceled_at', 'ended_at')
+    )
+
+def _find_user(db, subscription):
+    # Subscriptions created here carry the user id; others are matched through the customer
+    user_id = (subscription.get('metadata') or {}).get('user_id')
+    if user_id:
+        return int(user_id)
+    
+    user = db.execute(
+        'SELECT id FROM users WHERE stripe_customer_id = ?',
+        (subscription.get('customer'),)
+    ).fetchone()
+    return user['id'] if user else None
+
+def mirror_subscription(db, subscription, synced_at, user_id=None, plan_type=None):
+    """Upsert a Stripe subscription as of synced_at (Stripe time) and return its user id, or None"""
+    user_id = user_id or _find_user(db, subscription)
+    if user_id is None:
+        return None
+    
+    plan_type = plan_type or (subscription.get('metadata') or {}).get('plan_type') or 'tradie'
+    if subscription.get('status') == 'canceled':
+        end_date = subscription.get('ended_at') or subscription.get('canceled_at')
+    else:
+        end_date = subscription.get('current_period_end')
+    
+    # Events can arrive out of order; a state older than the stored one is ignored. An ended
+    # subscription never changes status again, which also settles states stamped in the same second
+    db.execute(
+        f'''
+        INSERT INTO subscriptions (
+            user_id, stripe_customer_id, stripe_subscription_id, plan_type, status,
+            start_date, end_date, cancel_at_period_end, stripe_synced_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (stripe_subscription_id) DO UPDATE SET
+            status = excluded.status,
+            end_date = excluded.end_date,
+            cancel_at_period_end = excluded.cancel_at_period_end,
+            stripe_synced_at = excluded.stripe_synced_at
+        WHERE excluded.stripe_synced_at >= COALESCE(subscriptions.stripe_synced_at, 0)
+            AND (subscriptions.status NOT IN ({', '.join('?' for _ in TERMINAL_STATUSES)})
+                OR excluded.status = subscriptions.status)
+        ''',
+        (
+            user_id,
+            subscription.get('customer'),
+            subscription['id'],
+            plan_type,
+            subscription.get('status'),
+            _timestamp(subscription.get('start_date')),
+            _timestamp(end_date),
+            bool(subscription.get('cancel_at_period_end')),
+            synced_at,
+            *TERMINAL_STATUSES
+        )
+    )
+    return user_id
+
+def get_subscription(user_id):
+    """Get a user's current subscription from the local mirror, or None"""
+    try:
+        db = get_db()
+        subscription = db.execute(
+            '''
+            SELECT * FROM subscriptions
+            WHERE user_id = ?
+            ORDER BY status = 'active' DESC, id DESC
+            LIMIT 1
+            ''',
+            (user_id,)
+        ).fetchone()
+        
+        return dict(subscription) if subscription else None
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def create_subscription(user, payment_method_id, plan_type, plan, request_key):
+    """Create the customer, setup fee invoice and monthly subscription; safe to retry"""
+    if not request_key or len(request_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValidationError('An Idempotency-Key header identifying this checkout attempt is required')
+    
+    try:
+        db = get_db()
+        # Retries of the same checkout attempt reuse its Stripe objects instead of charging twice.
+        # The key must be new for every attempt: Stripe replays a key's response for 24 hours, so
+        # a key derived from the payment method would hand a resubscribing user the old, canceled
+        # subscription
+        base_key = idempotency_key('subscribe', user['id'], plan_type, request_key)
+        
+        customer_id = user['stripe_customer_id']
+        if not customer_id:
+            customer = stripe.Customer.create(
+                email=user['email'],
+                payment_method=payment_method_id,
+                invoice_settings={'default_payment_method': payment_method_id},
+                metadata={'user_id': str(user['id'])},
+                idempotency_key=f'{base_key}-customer'
+            )
+            customer_id = customer.id
+            
+            # Saved straight away so a failure below never orphans the customer
+            db.execute(
+                'UPDATE users SET stripe_customer_id = ? WHERE id = ?',
+                (customer_id, user['id'])
+            )
+            db.commit()
+        
+        # The setup fee invoice and the subscription only depend on the customer
+        setup_invoice = _executor.submit(
+            stripe.Invoice.create,
+            customer=customer_id,
+            collection_method='charge_automatically',
+            pending_invoice_items_behavior='exclude',
+            items=[{
+                'price_data': {
+                    'unit_amount': int(plan['setup_fee'] * 100),
+                    'currency': 'aud',
+                    'product_data': {
+                        'name': 'Website Setup Fee',
+                        'description': 'One-time setup fee for your tradie website'
+                    }
+                },
+                'quantity': 1
+            }],
+            idempotency_key=f'{base_key}-setup-invoice'
+        )
+        subscription = _executor.submit(
+            stripe.Subscription.create,
+            customer=customer_id,
+            items=[{
+                'price_data': {
+                    'unit_amount': int(plan['monthly_fee'] * 100),
+                    'currency': 'aud',
+                    'recurring': {
+                        'interval': 'month'
+                    },
+                    'product_data': {
+                        'name': 'Monthly Website Hosting',
+                        'description': 'Monthly hosting and maintenance for your tradie website'
+                    }
+                },
+                'quantity': 1
+            }],
+            metadata={'user_id': str(user['id']), 'plan_type': plan_type},
+            expand=['latest_invoice.payment_intent'],
+            idempotency_key=f'{base_key}-subscription'
+        )
+        setup_invoice, subscription = setup_invoice.result(), subscription.result()
+        
+        # Mirrored now so the dashboard shows it before the webhook arrives
+        mirror_subscription(db, subscription, stripe_time(subscription), user['id'], plan_type)
+        db.commit()
+        invalidate_user(user['id'])
+        
+        return subscription, setup_invoice
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def cancel_subscription(user_id, subscription):
+    """Cancel a mirrored subscription in Stripe and record the result"""
+    try:
+        db = get_db()
+        canceled = stripe.Subscription.delete(
+            subscription['stripe_subscription_id'],
+            idempotency_key=idempotency_key('cancel', subscription['stripe_subscription_id'])
+        )
+        
+        mirror_subscription(db, canceled, stripe_time(canceled), user_id, subscription['plan_type'])
+        db.commit()
+        invalidate_user(user_id)
+        
+        return canceled
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def ingest_webhook(payload, signature):
+    """Verify a Stripe webhook and apply it to the local mirror exactly once"""
+    try:
+        event = stripe.Webhook.construct_event(payload, signature, STRIPE_WEBHOOK_SECRET)
+    except (ValueError, stripe.error.SignatureVerificationError):
+        raise ValidationError('Invalid webhook payload or signature')
+    
+    db = get_db()
+    # Stripe delivers at least once, so repeats are recognised by event id
+    cursor = db.execute(
+        'INSERT OR IGNORE INTO stripe_events (id, type, created, received_at) VALUES (?, ?, ?, ?)',
+        (event['id'], event['type'], event['created'], datetime.now())
+    )
+    if not cursor.rowcount:
+        db.rollback()
+        return 'duplicate'
+    
+    user_id = None
+    if event['type'] in SUBSCRIPTION_EVENTS:
+        user_id = mirror_subscription(db, event['data']['object'], event['created'])
+        if user_id is None:
+            logger.warning(f"Stripe event {event['id']} matched no user")
+    
+    db.execute('DELETE FROM stripe_events WHERE created < ?', (time.time() - STRIPE_EVENT_RETENTION,))
+    db.commit()
+    
+    if user_id is not None:
+        invalidate_user(user_id)
+    return 'processed' if user_id is not None else 'ignored'
+
+def sync_subscriptions():
+    """Refresh the whole mirror from Stripe, e.g. to backfill it or recover missed webhooks"""
+    db = get_db()
+    synced = skipped = 0
+    for subscription in stripe.Subscription.list(status='all', limit=100).auto_paging_iter():
+        if mirror_subscription(db, subscription, stripe_time(subscription)) is None:
+            skipped += 1
+        else:
+            synced += 1
+    db.commit()
+    return {'synced': synced, 'skipped': skipped}
+
+def main():
+    """Maintain the local Stripe subscription mirror"""
+    parser = argparse.ArgumentParser(description='Stripe subscription mirror')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('sync', help='Refresh every subscription from Stripe')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'sync':
+        print(json.dumps(sync_subscriptions()))
+
+if __name__ == '__main__':
+    main()
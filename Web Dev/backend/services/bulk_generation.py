@@ -0,0 +1,236 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from ..database import DATABASE_PATH, db_transaction
+from ..utils.error_handlers import handle_error
+from .rendered_sites import encode_rendered_site
+from .version_control import add_version
+from .website_generator import TEMPLATES_DIR, TradieWebsiteBot
+
+logger = logging.getLogger(__name__)
+
+# Bulk generation configuration
+BULK_WORKERS = int(os.getenv('BULK_WORKERS', os.cpu_count() or 2))
+BULK_INSERT_BATCH_SIZE = int(os.getenv('BULK_INSERT_BATCH_SIZE', 200))
+BULK_MAX_RECORDS = int(os.getenv('BULK_MAX_RECORDS', 1000))
+
+REQUIRED_FIELDS = [
+    'businessName', 'phone', 'email', 'address',
+    'services', 'businessHours', 'location', 'template'
+]
+
+WEBSITE_INSERT = '''
+    INSERT INTO websites (
+        user_id, business_name, template, content,
+        published_url, created_at, updated_at, is_published
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (published_url) DO NOTHING
+'''
+
+RENDERED_SITE_INSERT = '''
+    INSERT INTO rendered_sites (
+        website_id, html, html_gzip, html_brotli,
+        etag, content_length, rendered_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# One warmed generator per pool process
+_worker_bot = None
+
+def slugify(business_name):
+    """Build the published URL slug used for new websites"""
+    return business_name.lower().replace(' ', '-')
+
+def validate_record(record):
+    """Return an error message for an invalid business record, or None"""
+    if not isinstance(record, dict):
+        return 'Record must be an object'
+    
+    missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, '')]
+    if missing:
+        return f"Missing required fields: {', '.join(missing)}"
+    
+    if not isinstance(record['services'], list) or not record['services']:
+        return 'services must be a non-empty list'
+    
+    if not os.path.exists(os.path.join(TEMPLATES_DIR, f"{record['template']}.html")):
+        return f"Unknown template: {record['template']}"
+    
+    return None
+
+def _init_worker():
+    global _worker_bot
+    _worker_bot = TradieWebsiteBot()
+    _worker_bot.warm_up()
+
+def _render_record(index, record):
+    # Runs in a pool process; failures are returned rather than raised so one bad record
+    # never aborts the batch (the underlying error is logged by the generator)
+    try:
+        html = _worker_bot.generate_website(record)
+        return index, encode_rendered_site(html), None
+    except Exception:
+        return index, None, 'Failed to render website'
+
+def _write_batch(rows, user_id, publish, db_path, report):
+    now = datetime.now()
+    with db_transaction(db_path) as db:
+        for index, record, encoded in rows:
+            published_url = slugify(record['businessName'])
+            cursor = db.execute(
+                WEBSITE_INSERT,
+                (
+                    user_id,
+                    record['businessName'],
+                    record['template'],
+                    json.dumps(record),
+                    published_url,
+                    now,
+                    now,
+                    publish
+                )
+            )
+            
+            if not cursor.rowcount:
+                report['failures'].append({
+                    'index': index,
+                    'error': f'Published URL already taken: {published_url}'
+                })
+                continue
+            
+            # Like single creates, every website starts with a first version in the same transaction
+            add_version(db, cursor.lastrowid, record, user_id)
+            
+            if encoded:
+                db.execute(
+                    RENDERED_SITE_INSERT,
+                    (
+                        cursor.lastrowid,
+                        encoded['html'],
+                        encoded['html_gzip'],
+                        encoded['html_brotli'],
+                        encoded['etag'],
+                        encoded['content_length'],
+                        now
+                    )
+                )
+            
+            report['websites'].append({
+                'index': index,
+                'id': cursor.lastrowid,
+                'published_url': published_url
+            })
+
+def generate_websites_bulk(user_id, records, publish=False, workers=BULK_WORKERS,
+                           batch_size=BULK_INSERT_BATCH_SIZE, db_path=DATABASE_PATH):
+    """Validate, render in parallel when publishing, and insert a stream of business records"""
+    try:
+        started = time.perf_counter()
+        report = {'total': 0, 'websites': [], 'failures': []}
+        records_by_index = {}
+        pending = []
+        rows = []
+        
+        def add_row(index, record, encoded):
+            rows.append((index, record, encoded))
+            if len(rows) >= batch_size:
+                _write_batch(rows, user_id, publish, db_path, report)
+                rows.clear()
+        
+        def collect(futures):
+            for future in futures:
+                index, encoded, error = future.result()
+                record = records_by_index.pop(index)
+                if error:
+                    report['failures'].append({'index': index, 'error': error})
+                    continue
+                add_row(index, record, encoded)
+        
+        # Unpublished websites are rendered when they are published, so only publishing needs the pool
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if publish else nullcontext()
+        with pool as executor:
+            for index, record in enumerate(records):
+                report['total'] += 1
+                error = validate_record(record)
+                if error:
+                    report['failures'].append({'index': index, 'error': error})
+                    continue
+                
+                if not publish:
+                    add_row(index, record, None)
+                    continue
+                
+                records_by_index[index] = record
+                pending.append(executor.submit(_render_record, index, record))
+                
+                # Bound the number of in-flight renders so large streams stay in constant memory
+                if len(pending) >= workers * 4:
+                    collect(pending)
+                    pending = []
+            
+            collect(pending)
+        
+        if rows:
+            _write_batch(rows, user_id, publish, db_path, report)
+        
+        elapsed = time.perf_counter() - started
+        report['failures'].sort(key=lambda failure: failure['index'])
+        report.update(
+            created=len(report['websites']),
+            failed=len(report['failures']),
+            elapsed_seconds=round(elapsed, 3),
+            records_per_second=round(report['total'] / elapsed, 2) if elapsed else None
+        )
+        return report
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def read_records(path):
+    """Stream business records from a partner CSV export or a JSON lines file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        
+        for row in csv.DictReader(f):
+            # CSV exports list services separated by semicolons and hours as JSON or free text
+            row['services'] = [service.strip() for service in (row.get('services') or '').split(';') if service.strip()]
+            try:
+                row['businessHours'] = json.loads(row.get('businessHours') or '')
+            except ValueError:
+                pass
+            yield row
+
+def main():
+    """Generate websites in bulk from a partner export"""
+    parser = argparse.ArgumentParser(description='Bulk website generation')
+    parser.add_argument('path', help='CSV export or JSON lines file of business records')
+    parser.add_argument('--user-id', type=int, required=True, help='Owner of the generated websites')
+    parser.add_argument('--publish', action='store_true', help='Publish and pre-render the websites')
+    parser.add_argument('--workers', type=int, default=BULK_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=BULK_INSERT_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    report = generate_websites_bulk(
+        args.user_id,
+        read_records(args.path),
+        publish=args.publish,
+        workers=args.workers,
+        batch_size=args.batch_size
+    )
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import socket
+import time
+from ..database import get_db
+from ..utils.error_handlers import handle_error
+
+logger = logging.getLogger(__name__)
+
+# Job queue configuration
+JOB_LEASE_TIMEOUT = float(os.getenv('JOB_LEASE_TIMEOUT', 120))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BASE_DELAY = float(os.getenv('JOB_RETRY_BASE_DELAY', 2))
+JOB_RETRY_MAX_DELAY = float(os.getenv('JOB_RETRY_MAX_DELAY', 300))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+
+# Succeeded jobs are kept this long for status polling, then purged by idle workers
+JOB_SUCCEEDED_RETENTION = float(os.getenv('JOB_SUCCEEDED_RETENTION', 7 * 86400))
+JOB_PURGE_INTERVAL = float(os.getenv('JOB_PURGE_INTERVAL', 3600))
+
+# Run jobs on the request thread instead of queueing them (development without a worker)
+JOB_QUEUE_INLINE = os.getenv('JOB_QUEUE_INLINE', 'false').lower() == 'true'
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'dead')
+
+JOB_HANDLERS = {}
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot succeed"""
+
+def job_handler(job_type):
+    """Register a function that performs jobs of a given type"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+def enqueue_job(job_type, payload, user_id=None, max_attempts=JOB_MAX_ATTEMPTS, delay=0):
+    """Add a job to the queue and return its id"""
+    try:
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job type: {job_type}')
+        
+        db = get_db()
+        cursor = db.execute(
+            '''
+            INSERT INTO jobs (
+                job_type, payload, user_id, max_attempts,
+                run_after, created_at, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (
+                job_type,
+                json.dumps(payload),
+                user_id,
+                max_attempts,
+                time.time() + delay,
+                datetime.now(),
+                datetime.now()
+            )
+        )
+        db.commit()
+        job_id = cursor.lastrowid
+        
+        if JOB_QUEUE_INLINE:
+            run_job(lease_job(f'inline-{os.getpid()}', job_id=job_id))
+        
+        return job_id
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def _reclaim_expired_leases(db, now):
+    # A worker that died mid-job (OOM, segfault) used up that attempt, so the job is retried
+    # with backoff, or dead-lettered once its attempts run out, instead of being leased forever.
+    # Clearing worker_id stops the old worker, if it is only slow, from recording an outcome
+    expired = db.execute(
+        '''
+        SELECT id, attempts, max_attempts, worker_id FROM jobs
+        WHERE status = 'running' AND leased_until < ?
+        ''',
+        (now,)
+    ).fetchall()
+    
+    for job in expired:
+        dead = job['attempts'] >= job['max_attempts']
+        db.execute(
+            '''
+            UPDATE jobs
+            SET status = ?, run_after = ?, last_error = ?,
+                leased_until = NULL, worker_id = NULL, updated_at = ?
+            WHERE id = ?
+            ''',
+            (
+                'dead' if dead else 'queued',
+                now + (0 if dead else retry_delay(job['attempts'])),
+                f"Lease expired on worker {job['worker_id']}",
+                datetime.now(),
+                job['id']
+            )
+        )
+        logger.warning(f"Job {job['id']} lease expired on attempt {job['attempts']}; {'dead-lettered' if dead else 'requeued'}")
+    return len(expired)
+
+def lease_job(worker_id, job_id=None, lease_timeout=JOB_LEASE_TIMEOUT):
+    """Claim the next runnable job, after requeueing or dead-lettering expired leases, or None"""
+    db = get_db()
+    now = time.time()
+    
+    # IMMEDIATE takes the write lock up front so two workers never claim the same job
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        _reclaim_expired_leases(db, now)
+        
+        job = db.execute(
+            f'''
+            SELECT * FROM jobs
+            WHERE status = 'queued' AND run_after <= ?
+            {'AND id = ?' if job_id else ''}
+            ORDER BY run_after, id
+            LIMIT 1
+            ''',
+            (now, job_id) if job_id else (now,)
+        ).fetchone()
+        
+        if job is None:
+            db.commit()
+            return None
+        
+        db.execute(
+            '''
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1,
+                leased_until = ?, worker_id = ?, updated_at = ?
+            WHERE id = ?
+            ''',
+            (now + lease_timeout, worker_id, datetime.now(), job['id'])
+        )
+        db.commit()
+        
+        return dict(job, attempts=job['attempts'] + 1, worker_id=worker_id)
+    
+    except Exception:
+        db.rollback()
+        raise
+
+def complete_job(job, result=None):
+    """Mark a leased job as succeeded"""
+    db = get_db()
+    # A worker whose lease expired must not overwrite the job's new owner
+    db.execute(
+        '''
+        UPDATE jobs
+        SET status = 'succeeded', result = ?, leased_until = NULL, updated_at = ?
+        WHERE id = ? AND worker_id = ?
+        ''',
+        (json.dumps(result), datetime.now(), job['id'], job['worker_id'])
+    )
+    db.commit()
+
+def retry_delay(attempts):
+    """Exponential backoff before the next attempt"""
+    return min(JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+
+def fail_job(job, error, permanent=False):
+    """Schedule a retry with backoff, or dead-letter the job once attempts run out"""
+    db = get_db()
+    dead = permanent or job['attempts'] >= job['max_attempts']
+    db.execute(
+        '''
+        UPDATE jobs
+        SET status = ?, run_after = ?, last_error = ?, leased_until = NULL, updated_at = ?
+        WHERE id = ? AND worker_id = ?
+        ''',
+        (
+            'dead' if dead else 'queued',
+            time.time() + (0 if dead else retry_delay(job['attempts'])),
+            error,
+            datetime.now(),
+            job['id'],
+            job['worker_id']
+        )
+    )
+    db.commit()
+    return 'dead' if dead else 'queued'
+
+def _root_cause(error):
+    # Services re-raise through handle_error, so report the original exception
+    while error.__context__ is not None:
+        error = error.__context__
+    return f'{type(error).__name__}: {error}'
+
+def run_job(job):
+    """Run a leased job's handler and record the outcome"""
+    if job is None:
+        return None
+    
+    try:
+        result = JOB_HANDLERS[job['job_type']](**json.loads(job['payload']))
+    except Exception as e:
+        get_db().rollback()
+        status = fail_job(job, _root_cause(e), permanent=isinstance(e, PermanentJobError))
+        logger.warning(f"Job {job['id']} ({job['job_type']}) failed on attempt {job['attempts']}: {_root_cause(e)}")
+        return status
+    
+    complete_job(job, result)
+    return 'succeeded'
+
+def requeue_dead_jobs(job_id=None):
+    """Give dead-lettered jobs a fresh set of attempts and return how many were requeued"""
+    db = get_db()
+    cursor = db.execute(
+        f'''
+        UPDATE jobs
+        SET status = 'queued', attempts = 0, run_after = ?, updated_at = ?
+        WHERE status = 'dead' {'AND id = ?' if job_id else ''}
+        ''',
+        (time.time(), datetime.now(), job_id) if job_id else (time.time(), datetime.now())
+    )
+    db.commit()
+    return cursor.rowcount
+
+def purge_jobs(retention=JOB_SUCCEEDED_RETENTION):
+    """Delete succeeded jobs finished more than retention seconds ago and return how many"""
+    db = get_db()
+    cursor = db.execute(
+        "DELETE FROM jobs WHERE status = 'succeeded' AND updated_at < ?",
+        (datetime.now() - timedelta(seconds=retention),)
+    )
+    db.commit()
+    return cursor.rowcount
+
+def get_job(job_id, user_id=None):
+    """Get a job's status, optionally restricted to the user who queued it, or None"""
+    try:
+        db = get_db()
+        job = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        
+        if not job or (user_id is not None and job['user_id'] != user_id):
+            return None
+        
+        job = dict(job)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def get_queue_stats():
+    """Count jobs by status for monitoring"""
+    db = get_db()
+    counts = dict(db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+    return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+def run_worker(worker_id=None, once=False, poll_interval=JOB_POLL_INTERVAL,
+               purge_interval=JOB_PURGE_INTERVAL):
+    """Process jobs until stopped; with once=True, drain the runnable jobs and return"""
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    processed = 0
+    purged_at = None
+    logger.info(f'Job worker {worker_id} started')
+    
+    while True:
+        job = lease_job(worker_id)
+        if job is None:
+            if once:
+                return processed
+            
+            # Housekeeping only runs while there is nothing to do
+            if purged_at is None or time.monotonic() - purged_at >= purge_interval:
+                purged_at = time.monotonic()
+                purged = purge_jobs()
+                if purged:
+                    logger.info(f'Purged {purged} succeeded jobs')
+            time.sleep(poll_interval)
+            continue
+        
+        run_job(job)
+        processed += 1
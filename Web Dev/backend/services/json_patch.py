@@ -0,0 +1,204 @@
+import copy
+import difflib
+import json
+
+# Strings at least this long are diffed by character ranges instead of being replaced whole
+TEXT_DIFF_MIN_LENGTH = 64
+
+# Lists whose alignment table would exceed this many cells are replaced whole
+LCS_MAX_CELLS = 250000
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+def _key(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+def _size(value):
+    return len(json.dumps(value, separators=(',', ':')))
+
+def _editable(old, new):
+    # Pairs worth diffing in place rather than removing one and adding the other
+    return (
+        (isinstance(old, dict) and isinstance(new, dict))
+        or (isinstance(old, list) and isinstance(new, list))
+        or (isinstance(old, str) and isinstance(new, str))
+    )
+
+def _lcs_pairs(old_keys, new_keys):
+    # Classic dynamic programming longest common subsequence over canonical element keys
+    rows, cols = len(old_keys), len(new_keys)
+    table = [[0] * (cols + 1) for _ in range(rows + 1)]
+    for i in range(rows - 1, -1, -1):
+        for j in range(cols - 1, -1, -1):
+            if old_keys[i] == new_keys[j]:
+                table[i][j] = table[i + 1][j + 1] + 1
+            else:
+                table[i][j] = max(table[i + 1][j], table[i][j + 1])
+    
+    pairs = []
+    i = j = 0
+    while i < rows and j < cols:
+        if old_keys[i] == new_keys[j]:
+            pairs.append((i, j))
+            i += 1
+            j += 1
+        elif table[i + 1][j] >= table[i][j + 1]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+def _diff_list(old, new, path):
+    old_keys = [_key(item) for item in old]
+    new_keys = [_key(item) for item in new]
+    if len(old) * len(new) > LCS_MAX_CELLS:
+        return [{'op': 'replace', 'path': path, 'value': new}]
+    
+    pairs = _lcs_pairs(old_keys, new_keys)
+    source = {j: i for i, j in pairs}
+    kept = set(source.values())
+    
+    # Unmatched new items equal to an unmatched old item are moves
+    removed = {}
+    for i, key in enumerate(old_keys):
+        if i not in kept:
+            removed.setdefault(key, []).append(i)
+    for j, key in enumerate(new_keys):
+        if j not in source and removed.get(key):
+            source[j] = removed[key].pop(0)
+    
+    # Remaining unmatched items between the same two anchors are edited in place when possible
+    anchors = [(-1, -1)] + pairs + [(len(old), len(new))]
+    used = set(source.values())
+    for (i0, j0), (i1, j1) in zip(anchors, anchors[1:]):
+        olds = [i for i in range(i0 + 1, i1) if i not in used]
+        news = [j for j in range(j0 + 1, j1) if j not in source]
+        for i, j in zip(olds, news):
+            if _editable(old[i], new[j]):
+                source[j] = i
+                used.add(i)
+    
+    ops = []
+    # Simulate the list so every emitted index is valid when ops are applied in order
+    current = list(range(len(old)))
+    for i in sorted((i for i in range(len(old)) if i not in used), reverse=True):
+        ops.append({'op': 'remove', 'path': f'{path}/{i}'})
+        current.remove(i)
+    
+    for j, item in enumerate(new):
+        if j not in source:
+            ops.append({'op': 'add', 'path': f'{path}/{j}', 'value': item})
+            current.insert(j, None)
+            continue
+        
+        i = source[j]
+        position = current.index(i)
+        if position != j:
+            ops.append({'op': 'move', 'from': f'{path}/{position}', 'path': f'{path}/{j}'})
+            current.pop(position)
+            current.insert(j, i)
+        ops.extend(make_patch(old[i], item, f'{path}/{j}'))
+    
+    return ops
+
+def _diff_text(old, new, path):
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    edits = [
+        [i1, i2, new[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
+    return {'op': 'text', 'path': path, 'edits': edits}
+
+def make_patch(old, new, path=''):
+    """Build a patch that turns old into new, as small as the structure allows"""
+    # Besides the RFC 6902 add, remove, replace and move operations, long strings produce a
+    # 'text' operation listing [start, end, replacement] edits against the old string
+    # Python equality treats 1 and True alike, so confirm with the canonical JSON
+    if old == new and _key(old) == _key(new):
+        return []
+    
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({'op': 'remove', 'path': f'{path}/{_escape(key)}'})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({'op': 'add', 'path': f'{path}/{_escape(key)}', 'value': value})
+            else:
+                ops.extend(make_patch(old[key], value, f'{path}/{_escape(key)}'))
+        return ops
+    
+    replace = [{'op': 'replace', 'path': path, 'value': new}]
+    
+    if isinstance(old, list) and isinstance(new, list):
+        ops = _diff_list(old, new, path)
+    elif isinstance(old, str) and isinstance(new, str) and max(len(old), len(new)) >= TEXT_DIFF_MIN_LENGTH:
+        ops = [_diff_text(old, new, path)]
+    else:
+        return replace
+    
+    # Fall back to a plain replacement whenever the structural patch is not smaller
+    return ops if _size(ops) < _size(replace) else replace
+
+def _resolve(doc, path):
+    tokens = [_unescape(token) for token in path.split('/')[1:]]
+    parent = doc
+    for token in tokens[:-1]:
+        parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+    return parent, tokens[-1]
+
+def _get(doc, path):
+    if path == '':
+        return doc
+    parent, key = _resolve(doc, path)
+    return parent[int(key)] if isinstance(parent, list) else parent[key]
+
+def _set(doc, path, value, insert):
+    if path == '':
+        return value
+    parent, key = _resolve(doc, path)
+    if isinstance(parent, list):
+        index = len(parent) if key == '-' else int(key)
+        if insert:
+            parent.insert(index, value)
+        else:
+            parent[index] = value
+    else:
+        parent[key] = value
+    return doc
+
+def _remove(doc, path):
+    parent, key = _resolve(doc, path)
+    value = parent[int(key)] if isinstance(parent, list) else parent[key]
+    del parent[int(key) if isinstance(parent, list) else key]
+    return value
+
+def apply_patch(doc, patch):
+    """Apply a patch from make_patch to a document without modifying the original"""
+    doc = copy.deepcopy(doc)
+    
+    for op in patch:
+        if op['op'] == 'add':
+            doc = _set(doc, op['path'], copy.deepcopy(op['value']), insert=True)
+        elif op['op'] == 'remove':
+            _remove(doc, op['path'])
+        elif op['op'] == 'replace':
+            doc = _set(doc, op['path'], copy.deepcopy(op['value']), insert=False)
+        elif op['op'] == 'move':
+            doc = _set(doc, op['path'], _remove(doc, op['from']), insert=True)
+        elif op['op'] == 'text':
+            text = _get(doc, op['path'])
+            # Edits index into the original string, so apply them back to front
+            for start, end, replacement in reversed(op['edits']):
+                text = text[:start] + replacement + text[end:]
+            doc = _set(doc, op['path'], text, insert=False)
+        else:
+            raise ValueError(f"Unsupported patch operation: {op['op']}")
+    
+    return doc
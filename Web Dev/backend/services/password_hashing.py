@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+from ..utils.error_handlers import ServiceUnavailableError
+
+# Password hashing configuration; the method is a werkzeug method string including its cost
+# parameters, e.g. scrypt:32768:8:1 or pbkdf2:sha256:600000
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 16))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+class PasswordHasher:
+    """Runs password hashing on a bounded thread pool and rejects work beyond its queue limit"""
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 max_queue=PASSWORD_HASH_MAX_QUEUE, timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        # werkzeug expands shorthand such as pbkdf2 to pbkdf2:sha256:600000 in the hashes it
+        # writes, so compare stored hashes against the prefix of a real hash, not the setting
+        self.hash_prefix = generate_password_hash('dummy', method).split('$', 1)[0]
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # hashlib releases the GIL while deriving keys, so threads hash in parallel
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._stats = {
+            'hashes': 0,
+            'verifications': 0,
+            'rehashes': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'in_flight': 0,
+            'completed': 0,
+            'hash_ms_total': 0.0,
+            'hash_ms_max': 0.0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0
+        }
+
+    def _record(self, wait_ms, hash_ms):
+        with self._lock:
+            self._stats['completed'] += 1
+            self._stats['wait_ms_total'] += wait_ms
+            self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+            self._stats['hash_ms_total'] += hash_ms
+            self._stats['hash_ms_max'] = max(self._stats['hash_ms_max'], hash_ms)
+
+    def _release(self, future):
+        with self._lock:
+            self._stats['in_flight'] -= 1
+        self._slots.release()
+
+    def _run(self, func, *args):
+        # Fail fast once every worker is busy and the queue is full, rather than stacking
+        # requests behind a login flood
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise ServiceUnavailableError('Too many sign-in requests, please try again shortly')
+        
+        submitted = time.perf_counter()
+        
+        def task():
+            started = time.perf_counter()
+            result = func(*args)
+            self._record((started - submitted) * 1000, (time.perf_counter() - started) * 1000)
+            return result
+        
+        with self._lock:
+            self._stats['in_flight'] += 1
+        future = self._executor.submit(task)
+        future.add_done_callback(self._release)
+        
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise ServiceUnavailableError('Sign-in is taking too long, please try again shortly')
+
+    def hash(self, password):
+        """Hash a password with the configured method and cost"""
+        with self._lock:
+            self._stats['hashes'] += 1
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Check a password against a stored hash of any supported method"""
+        with self._lock:
+            self._stats['verifications'] += 1
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with a different method or cost than configured"""
+        return password_hash.split('$', 1)[0] != self.hash_prefix
+
+    def rehash(self, password):
+        """Hash a password again after a successful login with outdated parameters"""
+        with self._lock:
+            self._stats['rehashes'] += 1
+        return self.hash(password)
+
+    def stats(self):
+        """Return hashing counters, latency and queue wait for monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+        
+        completed = stats['completed']
+        return {
+            'method': self.method,
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'hashes': stats['hashes'],
+            'verifications': stats['verifications'],
+            'rehashes': stats['rehashes'],
+            'rejected': stats['rejected'],
+            'timeouts': stats['timeouts'],
+            'in_flight': stats['in_flight'],
+            'avg_hash_ms': round(stats['hash_ms_total'] / completed, 2) if completed > 0 else None,
+            'max_hash_ms': round(stats['hash_ms_max'], 2),
+            'avg_wait_ms': round(stats['wait_ms_total'] / completed, 2) if completed > 0 else None,
+            'max_wait_ms': round(stats['wait_ms_max'], 2)
+        }
+
+password_hasher = PasswordHasher()
+
+def hash_password(password):
+    """Hash a password on the shared hashing pool"""
+    return password_hasher.hash(password)
+
+def verify_password(password_hash, password):
+    """Check a password on the shared hashing pool"""
+    return password_hasher.verify(password_hash, password)
+
+def needs_rehash(password_hash):
+    """Whether a stored hash should be replaced with one using the configured parameters"""
+    return password_hasher.needs_rehash(password_hash)
+
+def rehash_password(password):
+    """Hash a password with the configured parameters to replace an outdated hash"""
+    return password_hasher.rehash(password)
@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+import time
+from .site_assets import minify_css, minify_js
+
+# Comma-separated stage names applied to every rendered document, in order
+GENERATOR_POST_PROCESSORS = os.getenv('GENERATOR_POST_PROCESSORS', 'prune_css,minify_css,minify_js,minify_html')
+
+STYLE_BLOCK = re.compile(r'(<style[^>]*>)(.*?)(</style>)', re.S | re.I)
+SCRIPT_BLOCK = re.compile(r'(<script[^>]*>)(.*?)(</script>)', re.S | re.I)
+RAW_TEXT_BLOCK = re.compile(r'<(script|style|pre|textarea)\b[^>]*>.*?</\1>', re.S | re.I)
+
+# Whitespace around these tags never renders, so it can be dropped entirely
+BLOCK_TAGS = (
+    'html|head|body|meta|title|link|script|style|div|section|header|footer|nav|main|'
+    'article|aside|form|ul|ol|li|p|h[1-6]|table|thead|tbody|tr|td|th|br|hr'
+)
+BLOCK_TAG_WHITESPACE = re.compile(rf'\s*(</?(?:{BLOCK_TAGS})\b[^>]*>)\s*', re.I)
+
+def collect_dom_tokens(html):
+    """Collect tag names, classes and ids a stylesheet could match in a document"""
+    tags, classes, ids = set(), set(), set()
+    
+    # Scripts may add classes at runtime, so every word in them counts as a class or id
+    for script in SCRIPT_BLOCK.finditer(html):
+        words = set(re.findall(r'[\w-]+', script.group(2)))
+        classes |= words
+        ids |= words
+    
+    markup = RAW_TEXT_BLOCK.sub('', html)
+    tags.update(tag.lower() for tag in re.findall(r'<([a-zA-Z][\w-]*)', markup))
+    for value in re.findall(r'\bclass\s*=\s*["\']([^"\']*)["\']', markup, re.I):
+        classes.update(value.split())
+    ids.update(re.findall(r'\bid\s*=\s*["\']([^"\']*)["\']', markup, re.I))
+    
+    return tags, classes, ids
+
+def selector_matches(selector, tokens):
+    """Check whether every tag, class and id in a selector exists in the document"""
+    tags, classes, ids = tokens
+    
+    # Attribute selectors cannot be checked cheaply, so keep them
+    if '[' in selector:
+        return True
+    
+    selector = re.sub(r'::?[\w-]+(\([^)]*\))?', '', selector)
+    for compound in re.split(r'[\s>+~]+', selector.strip()):
+        tag = re.match(r'[a-zA-Z][\w-]*', compound)
+        if tag and tag.group(0).lower() not in tags:
+            return False
+        if any(name not in classes for name in re.findall(r'\.([\w-]+)', compound)):
+            return False
+        if any(name not in ids for name in re.findall(r'#([\w-]+)', compound)):
+            return False
+    return True
+
+def prune_stylesheet(css, tokens):
+    """Drop rules whose selectors match nothing in the document"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    kept = []
+    position = 0
+    
+    while True:
+        start = css.find('{', position)
+        if start == -1:
+            break
+        
+        # Find the matching close brace so nested @media blocks stay intact
+        depth, end = 1, start + 1
+        while end < len(css) and depth:
+            depth += {'{': 1, '}': -1}.get(css[end], 0)
+            end += 1
+        
+        prelude = css[position:start].strip()
+        body = css[start + 1:end - 1]
+        position = end
+        
+        if prelude.startswith(('@media', '@supports')):
+            inner = prune_stylesheet(body, tokens)
+            if inner.strip():
+                kept.append(f'{prelude} {{{inner}}}')
+        elif prelude.startswith('@'):
+            kept.append(f'{prelude} {{{body}}}')
+        else:
+            selectors = [s.strip() for s in prelude.split(',') if selector_matches(s, tokens)]
+            if selectors:
+                kept.append(f"{', '.join(selectors)} {{{body}}}")
+    
+    return '\n'.join(kept)
+
+def prune_css(html):
+    """Remove unused rules from inline stylesheets"""
+    tokens = collect_dom_tokens(html)
+    return STYLE_BLOCK.sub(
+        lambda m: m.group(1) + prune_stylesheet(m.group(2), tokens) + m.group(3),
+        html
+    )
+
+def minify_inline_css(html):
+    """Minify the contents of inline stylesheets"""
+    return STYLE_BLOCK.sub(lambda m: m.group(1) + minify_css(m.group(2)) + m.group(3), html)
+
+def minify_inline_js(html):
+    """Minify the contents of inline scripts"""
+    return SCRIPT_BLOCK.sub(lambda m: m.group(1) + minify_js(m.group(2)) + m.group(3), html)
+
+def minify_html(html):
+    """Collapse insignificant whitespace outside scripts, styles and preformatted text"""
+    parts = []
+    position = 0
+    
+    for block in RAW_TEXT_BLOCK.finditer(html):
+        parts.append(_collapse_whitespace(html[position:block.start()]))
+        parts.append(block.group(0))
+        position = block.end()
+    parts.append(_collapse_whitespace(html[position:]))
+    
+    # Raw blocks sit at odd indexes; scripts and styles never need surrounding whitespace
+    for index in range(1, len(parts), 2):
+        if parts[index][:7].lower() in ('<script', '<style>', '<style '):
+            parts[index - 1] = parts[index - 1].rstrip()
+            parts[index + 1] = parts[index + 1].lstrip()
+    
+    return ''.join(parts).strip()
+
+def _collapse_whitespace(markup):
+    markup = re.sub(r'<!--(?!\[if).*?-->', '', markup, flags=re.S)
+    markup = re.sub(r'\s+', ' ', markup)
+    return BLOCK_TAG_WHITESPACE.sub(r'\1', markup)
+
+POST_PROCESSORS = {
+    'prune_css': prune_css,
+    'minify_css': minify_inline_css,
+    'minify_js': minify_inline_js,
+    'minify_html': minify_html
+}
+
+class PostProcessingPipeline:
+    """Ordered post-processing stages for rendered documents with per-stage stats"""
+    def __init__(self, stages=None):
+        if stages is None:
+            names = [name.strip() for name in GENERATOR_POST_PROCESSORS.split(',') if name.strip()]
+            unknown = [name for name in names if name not in POST_PROCESSORS]
+            if unknown:
+                raise ValueError(f"Unknown post-processing stages: {', '.join(unknown)}")
+            stages = [(name, POST_PROCESSORS[name]) for name in names]
+        
+        self.stages = list(stages)
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {'runs': 0, 'bytes_in': 0, 'bytes_out': 0, 'total_ms': 0.0}
+            for name, _ in self.stages
+        }
+    
+    @property
+    def names(self):
+        return [name for name, _ in self.stages]
+    
+    def add_stage(self, name, func):
+        """Append a stage that takes and returns a document string"""
+        with self._lock:
+            self.stages.append((name, func))
+            self._stats.setdefault(name, {'runs': 0, 'bytes_in': 0, 'bytes_out': 0, 'total_ms': 0.0})
+    
+    def run(self, html):
+        """Run a document through every stage in order"""
+        for name, func in list(self.stages):
+            bytes_in = len(html.encode('utf-8'))
+            started = time.perf_counter()
+            html = func(html)
+            elapsed = (time.perf_counter() - started) * 1000
+            
+            with self._lock:
+                stats = self._stats[name]
+                stats['runs'] += 1
+                stats['bytes_in'] += bytes_in
+                stats['bytes_out'] += len(html.encode('utf-8'))
+                stats['total_ms'] += elapsed
+        return html
+    
+    def stats(self):
+        """Return per-stage byte savings and timings for monitoring"""
+        with self._lock:
+            return {
+                name: dict(
+                    stats,
+                    bytes_saved=stats['bytes_in'] - stats['bytes_out'],
+                    avg_ms=round(stats['total_ms'] / stats['runs'], 3) if stats['runs'] else 0.0,
+                    total_ms=round(stats['total_ms'], 3)
+                )
+                for name, stats in self._stats.items()
+            }
@@ -0,0 +1,88 @@
+from datetime import datetime
+import gzip
+import hashlib
+from ..database import get_db
+from ..utils.error_handlers import handle_error
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def encode_rendered_site(html):
+    """Build the stored representations of a rendered document"""
+    body = html.encode('utf-8')
+    return {
+        'html': body,
+        # mtime=0 keeps the gzip bytes identical for identical documents
+        'html_gzip': gzip.compress(body, compresslevel=9, mtime=0),
+        'html_brotli': brotli.compress(body, quality=11) if brotli else None,
+        'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        'content_length': len(body)
+    }
+
+def store_rendered_site(website_id, html):
+    """Persist the final document for a website, replacing any previous render"""
+    try:
+        db = get_db()
+        encoded = encode_rendered_site(html)
+        
+        db.execute(
+            '''
+            INSERT INTO rendered_sites (
+                website_id, html, html_gzip, html_brotli,
+                etag, content_length, rendered_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (website_id) DO UPDATE SET
+                html = excluded.html,
+                html_gzip = excluded.html_gzip,
+                html_brotli = excluded.html_brotli,
+                etag = excluded.etag,
+                content_length = excluded.content_length,
+                rendered_at = excluded.rendered_at
+            ''',
+            (
+                website_id,
+                encoded['html'],
+                encoded['html_gzip'],
+                encoded['html_brotli'],
+                encoded['etag'],
+                encoded['content_length'],
+                datetime.now()
+            )
+        )
+        db.commit()
+        
+        return encoded['etag']
+        
+    except Exception as e:
+        raise handle_error(e)
+
+def get_rendered_site(published_url):
+    """Get the stored render of a published website by its URL slug"""
+    try:
+        db = get_db()
+        
+        return db.execute(
+            '''
+            SELECT r.*, w.id AS website_id
+            FROM websites w
+            JOIN rendered_sites r ON r.website_id = w.id
+            WHERE w.published_url = ? AND w.is_published
+            ''',
+            (published_url,)
+        ).fetchone()
+        
+    except Exception as e:
+        raise handle_error(e)
+
+def delete_rendered_site(website_id):
+    """Remove the stored render of a website"""
+    try:
+        db = get_db()
+        db.execute('DELETE FROM rendered_sites WHERE website_id = ?', (website_id,))
+        db.commit()
+        
+    except Exception as e:
+        raise handle_error(e)
\ No newline at end of file
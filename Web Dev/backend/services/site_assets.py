@@ -0,0 +1,100 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from ..utils.error_handlers import handle_error
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-hashed CSS/JS shared by every generated site
+SITE_ASSETS_DIR = os.getenv(
+    'SITE_ASSETS_DIR',
+    os.path.join(os.path.dirname(__file__), '../../cache/assets')
+)
+SITE_ASSETS_URL = os.getenv('SITE_ASSETS_URL', '/websites/assets')
+
+ASSET_MIMETYPES = {
+    'css': 'text/css',
+    'js': 'application/javascript'
+}
+
+ASSET_FILENAME_PATTERN = re.compile(r'^site\.[0-9a-f]{16}\.(css|js)$')
+
+def minify_css(css):
+    """Strip comments and redundant whitespace from a stylesheet"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+def minify_js(js):
+    """Drop indentation, blank lines and whole-line comments from a script"""
+    # Line breaks are kept so automatic semicolon insertion behaves the same
+    lines = (line.strip() for line in js.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+def asset_filename(kind, content):
+    """Name an asset after the hash of its content"""
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+    return f'site.{digest}.{kind}'
+
+def _write_atomic(path, data):
+    # Write then rename so other workers never serve a partial file
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def build_site_assets(css, js, directory=SITE_ASSETS_DIR):
+    """Write minified, content-hashed assets with precompressed variants and return the manifest"""
+    try:
+        os.makedirs(directory, exist_ok=True)
+        manifest = {}
+        
+        for kind, content in (('css', minify_css(css)), ('js', minify_js(js))):
+            filename = asset_filename(kind, content)
+            path = os.path.join(directory, filename)
+            
+            # Identical content always maps to the same file, so existing builds are reused
+            if not os.path.exists(path):
+                body = content.encode('utf-8')
+                _write_atomic(f'{path}.gz', gzip.compress(body, compresslevel=9, mtime=0))
+                if brotli:
+                    _write_atomic(f'{path}.br', brotli.compress(body, quality=11))
+                _write_atomic(path, body)
+            
+            manifest[kind] = {
+                'filename': filename,
+                'url': f"{SITE_ASSETS_URL.rstrip('/')}/{filename}"
+            }
+        
+        _write_atomic(
+            os.path.join(directory, 'manifest.json'),
+            json.dumps(manifest, indent=2).encode('utf-8')
+        )
+        return manifest
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def get_site_asset(filename, encodings=(), directory=SITE_ASSETS_DIR):
+    """Get the best stored variant of a built asset as (body, mimetype, encoding), or None"""
+    match = ASSET_FILENAME_PATTERN.match(filename)
+    if not match:
+        return None
+    
+    path = os.path.join(directory, filename)
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz'), (None, '')):
+        if encoding and encoding not in encodings:
+            continue
+        try:
+            with open(path + suffix, 'rb') as f:
+                return f.read(), ASSET_MIMETYPES[match.group(1)], encoding
+        except OSError:
+            continue
+    return None
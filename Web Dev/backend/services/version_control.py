@@ -1,57 +1,283 @@
 from datetime import datetime
+import argparse
+import hashlib
 import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from ..database import get_db
 from ..utils.error_handlers import handle_error
+from .json_patch import make_patch, apply_patch
 
-def create_version(website_id, content):
+# Version storage: a full snapshot every N versions with JSON Patch deltas in between
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv('VERSION_SNAPSHOT_INTERVAL', 20))
+VERSION_COMPRESS_DELTAS = os.getenv('VERSION_COMPRESS_DELTAS', 'true').lower() == 'true'
+
+# Version listing page sizes
+VERSIONS_PAGE_SIZE = int(os.getenv('VERSIONS_PAGE_SIZE', 20))
+VERSIONS_MAX_PAGE_SIZE = int(os.getenv('VERSIONS_MAX_PAGE_SIZE', 100))
+
+# Computed diffs, keyed by the content hashes of the compared pair
+DIFF_CACHE_MAX_ENTRIES = int(os.getenv('DIFF_CACHE_MAX_ENTRIES', 512))
+
+METADATA_COLUMNS = 'version_number, created_at, created_by, content_hash, content_size'
+
+_diff_cache = OrderedDict()
+_diff_cache_lock = threading.Lock()
+
+# Storage columns that are internal to the delta scheme and never returned to callers
+STORAGE_COLUMNS = ('storage_kind', 'base_version', 'delta', 'blob_data')
+
+def content_metadata(content):
+    """Hash canonical JSON so identical content always gets the same hash, and measure its size"""
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(canonical).hexdigest(), len(canonical)
+
+def encode_payload(value, compress=VERSION_COMPRESS_DELTAS):
+    """Serialize a patch or content, prefixed with a marker byte recording the encoding"""
+    body = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    return b'z' + zlib.compress(body, 9) if compress else b'j' + body
+
+def decode_payload(data):
+    """Deserialize a value written by encode_payload"""
+    data = bytes(data)
+    body = zlib.decompress(data[1:]) if data[:1] == b'z' else data[1:]
+    return json.loads(body)
+
+def _store_blob(db, content_hash, content, data=None):
+    # Content-addressed, so identical content from any version of any website is stored once
+    db.execute(
+        '''
+        INSERT OR IGNORE INTO version_blobs (content_hash, data, size, created_at)
+        VALUES (?, ?, ?, ?)
+        ''',
+        (content_hash, data or encode_payload(content), content_metadata(content)[1], datetime.now())
+    )
+
+def _is_duplicate(db, website_id, content_hash, exclude_version=None):
+    # Repeated saves and restores reproduce content that already has a blob or an earlier version.
+    # When compaction rewrites a version, the blob it wrote itself is not a duplicate: only another
+    # snapshot, or another version of this website, makes it one
+    return db.execute(
+        '''
+        SELECT 1 FROM version_blobs WHERE content_hash = ? AND ? IS NULL
+        UNION ALL
+        SELECT 1 FROM website_versions
+        WHERE content_hash = ? AND (website_id = ? OR storage_kind = 'snapshot')
+            AND NOT (website_id = ? AND version_number IS ?)
+        LIMIT 1
+        ''',
+        (content_hash, exclude_version, content_hash, website_id, website_id, exclude_version)
+    ).fetchone() is not None
+
+def _plan_version(db, website_id, content, content_hash, previous, chain_length, interval,
+                  exclude_version=None):
+    # Returns (storage_kind, base_version, delta) for a row. Snapshots reference a blob and are
+    # written for duplicates, the first version, the end of every chain, and whenever the delta
+    # would not be smaller than the blob
+    if _is_duplicate(db, website_id, content_hash, exclude_version):
+        _store_blob(db, content_hash, content)
+        return 'snapshot', None, None
+    
+    data = encode_payload(content)
+    if previous is not None and chain_length + 1 < interval:
+        previous_number, previous_content = previous
+        delta = encode_payload(make_patch(previous_content, content))
+        if len(delta) < len(data):
+            return 'delta', previous_number, delta
+    
+    _store_blob(db, content_hash, content, data)
+    return 'snapshot', None, None
+
+def _public(row, content):
+    version = {key: row[key] for key in row.keys() if key not in STORAGE_COLUMNS}
+    version['content'] = json.dumps(content)
+    return version
+
+def _iter_versions(db, website_id, from_version=None, to_version=None):
+    # Yields (row, content) in ascending order, replaying deltas from the nearest snapshot
+    start = db.execute(
+        '''
+        SELECT MAX(version_number) AS version_number FROM website_versions
+        WHERE website_id = ? AND storage_kind = 'snapshot' AND version_number <= ?
+        ''',
+        (website_id, from_version if from_version is not None else -1)
+    ).fetchone()['version_number'] or 0
+    
+    rows = db.execute(
+        '''
+        SELECT v.*, b.data AS blob_data
+        FROM website_versions v
+        LEFT JOIN version_blobs b
+            ON v.storage_kind = 'snapshot' AND b.content_hash = v.content_hash
+        WHERE v.website_id = ? AND v.version_number >= ? AND v.version_number <= ?
+        ORDER BY v.version_number
+        ''',
+        (website_id, start, to_version if to_version is not None else 2 ** 62)
+    )
+    
+    content = None
+    previous_number = None
+    for row in rows:
+        if row['storage_kind'] == 'snapshot':
+            # Rows written before blobs existed keep their content inline
+            content = json.loads(row['content']) if row['content'] is not None else decode_payload(row['blob_data'])
+        elif row['base_version'] != previous_number:
+            raise ValueError(f"Broken version chain at version {row['version_number']}")
+        else:
+            content = apply_patch(content, decode_payload(row['delta']))
+        previous_number = row['version_number']
+        
+        if from_version is None or row['version_number'] >= from_version:
+            yield row, content
+
+def reconstruct_version(db, website_id, version_number):
+    """Rebuild one version's content from its snapshot; cost is bounded by the snapshot interval"""
+    for row, content in _iter_versions(db, website_id, version_number, version_number):
+        return row, content
+    return None, None
+
+def _next_version_number(db, website_id):
+    # Incrementing the counter takes the write lock before anything else is read, so concurrent
+    # saves get distinct numbers and each delta is built against the version that precedes it
+    cursor = db.execute(
+        'UPDATE websites SET version_count = version_count + 1 WHERE id = ?',
+        (website_id,)
+    )
+    if not cursor.rowcount:
+        raise ValueError(f'Website {website_id} not found')
+    return db.execute('SELECT version_count FROM websites WHERE id = ?', (website_id,)).fetchone()[0]
+
+def _insert_version(db, website_id, content, created_by=None, interval=VERSION_SNAPSHOT_INTERVAL):
+    version_number = _next_version_number(db, website_id)
+    
+    # The newest rows, read through the unique index; a chain is never longer than the interval
+    recent = db.execute(
+        '''
+        SELECT version_number, storage_kind FROM website_versions
+        WHERE website_id = ? AND version_number < ?
+        ORDER BY version_number DESC
+        LIMIT ?
+        ''',
+        (website_id, version_number, interval)
+    ).fetchall()
+    
+    previous = None
+    chain_length = 0
+    if recent:
+        _, previous_content = reconstruct_version(db, website_id, recent[0]['version_number'])
+        previous = (recent[0]['version_number'], previous_content)
+        for row in recent:
+            if row['storage_kind'] == 'snapshot':
+                break
+            chain_length += 1
+        else:
+            chain_length = interval
+    
+    content_hash, content_size = content_metadata(content)
+    storage_kind, base_version, delta = _plan_version(
+        db, website_id, content, content_hash, previous, chain_length, interval
+    )
+    
+    db.execute(
+        '''
+        INSERT INTO website_versions (
+            website_id, version_number, created_at, created_by,
+            storage_kind, base_version, delta, content_hash, content_size
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        (
+            website_id, version_number, datetime.now(), created_by,
+            storage_kind, base_version, delta, content_hash, content_size
+        )
+    )
+    return version_number
+
+def add_version(db, website_id, content, created_by=None):
+    """Add a new version on the caller's connection without committing, for batched writes"""
+    return _insert_version(db, website_id, content, created_by)
+
+def create_version(website_id, content, created_by=None):
     """Create a new version of a website"""
     try:
         db = get_db()
-        
-        # Get current version number
-        current_version = db.execute(
-            '''
-            SELECT MAX(version_number) as max_version 
-            FROM website_versions 
-            WHERE website_id = ?
-            ''',
-            (website_id,)
-        ).fetchone()
-        
-        version_number = (current_version['max_version'] or 0) + 1
-        
-        # Create new version
-        db.execute(
-            '''
-            INSERT INTO website_versions (
-                website_id, version_number, content, created_at
-            )
-            VALUES (?, ?, ?, ?)
-            ''',
-            (website_id, version_number, json.dumps(content), datetime.now())
-        )
+        version_number = _insert_version(db, website_id, content, created_by)
         db.commit()
         
         return version_number
-        
+    
     except Exception as e:
         raise handle_error(e)
 
-def get_versions(website_id):
-    """Get all versions of a website"""
+def _update_content(db, website_id, content):
+    cursor = db.execute(
+        '''
+        UPDATE websites
+        SET content = ?, updated_at = ?
+        WHERE id = ?
+        ''',
+        (json.dumps(content), datetime.now(), website_id)
+    )
+    if not cursor.rowcount:
+        raise ValueError(f'Website {website_id} not found')
+
+def save_website_version(website_id, content, created_by=None):
+    """Update a website's content and snapshot it as a new version in a single transaction"""
     try:
         db = get_db()
+        _update_content(db, website_id, content)
+        version_number = _insert_version(db, website_id, content, created_by)
+        db.commit()
         
-        versions = db.execute(
-            '''
-            SELECT * FROM website_versions 
-            WHERE website_id = ? 
+        return version_number
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def _backfill_metadata(db, website_id):
+    # Versions written before hashes and sizes were recorded are filled in from a single replay
+    for row, content in _iter_versions(db, website_id):
+        if row['content_hash'] is None:
+            db.execute(
+                '''
+                UPDATE website_versions SET content_hash = ?, content_size = ?
+                WHERE website_id = ? AND version_number = ?
+                ''',
+                (*content_metadata(content), website_id, row['version_number'])
+            )
+    db.commit()
+
+def list_versions(website_id, limit=VERSIONS_PAGE_SIZE, before=None):
+    """List version metadata newest first, one keyset page at a time, without loading content"""
+    try:
+        db = get_db()
+        limit = max(1, min(int(limit), VERSIONS_MAX_PAGE_SIZE))
+        query = f'''
+            SELECT {METADATA_COLUMNS} FROM website_versions
+            WHERE website_id = ? {'AND version_number < ?' if before is not None else ''}
             ORDER BY version_number DESC
-            ''',
-            (website_id,)
-        ).fetchall()
+            LIMIT ?
+        '''
+        params = (website_id, before, limit + 1) if before is not None else (website_id, limit + 1)
         
-        return [dict(version) for version in versions]
+        rows = db.execute(query, params).fetchall()
+        if any(row['content_hash'] is None for row in rows):
+            _backfill_metadata(db, website_id)
+            rows = db.execute(query, params).fetchall()
+        
+        # The extra row only tells us whether another page exists
+        has_more = len(rows) > limit
+        versions = [dict(row) for row in rows[:limit]]
+        
+        return {
+            'versions': versions,
+            'next_before': versions[-1]['version_number'] if has_more else None
+        }
         
     except Exception as e:
         raise handle_error(e)
@@ -61,74 +287,106 @@ def get_version(website_id, version_number):
     try:
         db = get_db()
         
-        version = db.execute(
-            '''
-            SELECT * FROM website_versions 
-            WHERE website_id = ? AND version_number = ?
-            ''',
-            (website_id, version_number)
-        ).fetchone()
+        row, content = reconstruct_version(db, website_id, version_number)
         
-        if not version:
+        if not row:
             raise ValueError(f'Version {version_number} not found')
         
-        return dict(version)
-        
+        return _public(row, content)
+    
     except Exception as e:
         raise handle_error(e)
 
-def restore_version(website_id, version_number):
-    """Restore a website to a specific version"""
+def restore_version(website_id, version_number, created_by=None):
+    """Restore a website to a specific version, updating its content in the same transaction"""
     try:
+        db = get_db()
+        
         # Get version content
         version = get_version(website_id, version_number)
+        content = json.loads(version['content'])
         
-        # Create new version with restored content
-        create_version(website_id, json.loads(version['content']))
+        _update_content(db, website_id, content)
         
-        return json.loads(version['content'])
+        # Every restore is recorded in the history; the new version references the existing blob
+        _insert_version(db, website_id, content, created_by)
+        db.commit()
         
+        return content
+    
     except Exception as e:
         raise handle_error(e)
 
+def _content_hash(db, website_id, version_number):
+    row = db.execute(
+        'SELECT content_hash FROM website_versions WHERE website_id = ? AND version_number = ?',
+        (website_id, version_number)
+    ).fetchone()
+    if not row:
+        raise ValueError(f'Version {version_number} not found')
+    return row['content_hash']
+
+def _cached_patch(cache_key):
+    if cache_key is None:
+        return None
+    with _diff_cache_lock:
+        patch = _diff_cache.get(cache_key)
+        if patch is not None:
+            _diff_cache.move_to_end(cache_key)
+        return patch
+
+def diff_contents(old, new, cache_key=None):
+    """Diff two contents, reusing a previous result for the same cache key"""
+    patch = _cached_patch(cache_key)
+    if patch is not None:
+        return patch
+    
+    patch = make_patch(old, new)
+    
+    if cache_key is not None:
+        with _diff_cache_lock:
+            _diff_cache[cache_key] = patch
+            while len(_diff_cache) > DIFF_CACHE_MAX_ENTRIES:
+                _diff_cache.popitem(last=False)
+    return patch
+
 def compare_versions(website_id, version1, version2):
-    """Compare two versions of a website"""
+    """Compare two versions of a website as a structural patch from version1 to version2"""
     try:
-        v1 = get_version(website_id, version1)
-        v2 = get_version(website_id, version2)
-        
-        content1 = json.loads(v1['content'])
-        content2 = json.loads(v2['content'])
+        db = get_db()
         
-        # Compare content
-        differences = {
-            'added': {},
-            'removed': {},
-            'modified': {}
-        }
+        # Versions are immutable, so the content hashes identify the diff
+        hash1 = _content_hash(db, website_id, version1)
+        hash2 = _content_hash(db, website_id, version2)
+        cache_key = (hash1, hash2) if hash1 and hash2 else None
         
-        # Compare each field
-        for key in set(content1.keys()) | set(content2.keys()):
-            if key not in content1:
-                differences['added'][key] = content2[key]
-            elif key not in content2:
-                differences['removed'][key] = content1[key]
-            elif content1[key] != content2[key]:
-                differences['modified'][key] = {
-                    'old': content1[key],
-                    'new': content2[key]
-                }
+        # Equal hashes mean equal content, so there is nothing to reconstruct
+        patch = [] if hash1 and hash1 == hash2 else _cached_patch(cache_key)
+        if patch is None:
+            content1 = json.loads(get_version(website_id, version1)['content'])
+            content2 = json.loads(get_version(website_id, version2)['content'])
+            patch = diff_contents(content1, content2, cache_key)
         
         return {
             'version1': version1,
             'version2': version2,
-            'differences': differences,
+            'identical': not patch,
+            'patch': patch,
             'compared_at': datetime.now().isoformat()
         }
         
     except Exception as e:
         raise handle_error(e)
 
+def apply_version_patch(website_id, version_number, patch):
+    """Apply a patch from compare_versions to a version's content and return the result"""
+    try:
+        version = get_version(website_id, version_number)
+        return apply_patch(json.loads(version['content']), patch)
+        
+    except Exception as e:
+        raise handle_error(e)
+
 def delete_version(website_id, version_number):
     """Delete a specific version of a website"""
     try:
@@ -137,17 +395,278 @@ def delete_version(website_id, version_number):
         # Verify version exists
         version = get_version(website_id, version_number)
         
+        # A delta built on this version must become a snapshot before its base disappears
+        dependant = db.execute(
+            '''
+            SELECT version_number FROM website_versions
+            WHERE website_id = ? AND base_version = ? AND storage_kind = 'delta'
+            ''',
+            (website_id, version_number)
+        ).fetchone()
+        if dependant:
+            _, content = reconstruct_version(db, website_id, dependant['version_number'])
+            content_hash, content_size = content_metadata(content)
+            _store_blob(db, content_hash, content)
+            db.execute(
+                '''
+                UPDATE website_versions
+                SET storage_kind = 'snapshot', content = NULL, base_version = NULL, delta = NULL,
+                    content_hash = ?, content_size = ?
+                WHERE website_id = ? AND version_number = ?
+                ''',
+                (content_hash, content_size, website_id, dependant['version_number'])
+            )
+        
         # Delete version
         db.execute(
             '''
-            DELETE FROM website_versions 
+            DELETE FROM website_versions
             WHERE website_id = ? AND version_number = ?
             ''',
             (website_id, version_number)
         )
+        if version['content_hash']:
+            prune_blobs(db, version['content_hash'])
         db.commit()
         
         return {'message': f'Version {version_number} deleted successfully'}
+    
+    except Exception as e:
+        raise handle_error(e)
+
+def _compact_website(db, website_id, interval):
+    # Materialize the whole history first, then rewrite every row under the current scheme
+    history = [(row['version_number'], content) for row, content in _iter_versions(db, website_id)]
+    
+    previous = None
+    chain_length = 0
+    for version_number, content in history:
+        content_hash, content_size = content_metadata(content)
+        storage_kind, base_version, delta = _plan_version(
+            db, website_id, content, content_hash, previous, chain_length, interval,
+            exclude_version=version_number
+        )
+        db.execute(
+            '''
+            UPDATE website_versions
+            SET storage_kind = ?, content = NULL, base_version = ?, delta = ?,
+                content_hash = ?, content_size = ?
+            WHERE website_id = ? AND version_number = ?
+            ''',
+            (storage_kind, base_version, delta, content_hash, content_size, website_id, version_number)
+        )
+        chain_length = 0 if storage_kind == 'snapshot' else chain_length + 1
+        previous = (version_number, content)
+    
+    return len(history)
+
+def prune_blobs(db, content_hash=None):
+    """Delete blobs no snapshot references any more and return how many were removed"""
+    cursor = db.execute(
+        f'''
+        DELETE FROM version_blobs
+        WHERE content_hash NOT IN (
+            SELECT content_hash FROM website_versions
+            WHERE storage_kind = 'snapshot' AND content_hash IS NOT NULL
+        )
+        {'AND content_hash = ?' if content_hash else ''}
+        ''',
+        (content_hash,) if content_hash else ()
+    )
+    return cursor.rowcount
+
+def get_version_storage_stats(db=None):
+    """Report stored bytes and row counts per storage kind, plus the shared blobs"""
+    db = db or get_db()
+    rows = db.execute(
+        '''
+        SELECT storage_kind, COUNT(*) AS versions,
+               COALESCE(SUM(LENGTH(content)), 0) + COALESCE(SUM(LENGTH(delta)), 0) AS bytes
+        FROM website_versions
+        GROUP BY storage_kind
+        '''
+    ).fetchall()
+    stats = {row['storage_kind']: {'versions': row['versions'], 'bytes': row['bytes']} for row in rows}
+    
+    blobs = db.execute(
+        'SELECT COUNT(*) AS blobs, COALESCE(SUM(LENGTH(data)), 0) AS bytes FROM version_blobs'
+    ).fetchone()
+    stats['blobs'] = {'versions': blobs['blobs'], 'bytes': blobs['bytes']}
+    return stats
+
+def compact_versions(website_id=None, interval=VERSION_SNAPSHOT_INTERVAL):
+    """Rewrite version chains (including legacy full rows) as snapshots plus deltas"""
+    try:
+        db = get_db()
+        before = get_version_storage_stats(db)
+        
+        if website_id is None:
+            website_ids = [
+                row['website_id']
+                for row in db.execute('SELECT DISTINCT website_id FROM website_versions').fetchall()
+            ]
+        else:
+            website_ids = [website_id]
+        
+        versions = 0
+        for current_id in website_ids:
+            # One transaction per website keeps write locks short
+            versions += _compact_website(db, current_id, interval)
+            db.commit()
+        
+        # Rewritten chains can leave blobs that no snapshot points at
+        blobs_pruned = prune_blobs(db)
+        db.commit()
         
+        return {
+            'websites': len(website_ids),
+            'versions': versions,
+            'blobs_pruned': blobs_pruned,
+            'bytes_before': sum(kind['bytes'] for kind in before.values()),
+            'bytes_after': sum(kind['bytes'] for kind in get_version_storage_stats(db).values())
+        }
+    
     except Exception as e:
-        raise handle_error(e) 
\ No newline at end of file
+        raise handle_error(e)
+
+def _simulated_edits(count, seed=0):
+    # A realistic editing history: small changes to one field of a business profile at a time
+    rng = random.Random(seed)
+    content = {
+        'businessName': 'Smith & Sons Plumbing',
+        'phone': '0400 000 000',
+        'email': 'hello@smithplumbing.com.au',
+        'address': '12 Example Street, Parramatta NSW 2150',
+        'services': ['Blocked drains', 'Hot water systems', 'Gas fitting', 'Leak detection'],
+        'businessHours': {
+            day: '7am - 5pm' for day in ('mon', 'tue', 'wed', 'thu', 'fri')
+        },
+        'location': 'Western Sydney',
+        'template': 'modern',
+        'about': 'Family owned and operated for over 30 years. ' * 20
+    }
+    for index in range(count):
+        content = json.loads(json.dumps(content))
+        field = rng.choice(['phone', 'services', 'businessHours', 'about', 'address'])
+        if field == 'services':
+            content['services'].append(f'Service {index}')
+        elif field == 'businessHours':
+            content['businessHours'][rng.choice(list(content['businessHours']))] = f'{rng.randint(6, 9)}am - 5pm'
+        elif field == 'about':
+            content['about'] += f' Update {index}.'
+        else:
+            content[field] = f'{content[field].split(" #")[0]} #{index}'
+        yield content
+
+def benchmark_version_storage(versions=500, interval=VERSION_SNAPSHOT_INTERVAL, reads=200):
+    """Compare storage size and read latency of full-copy versions against snapshots plus deltas"""
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    db.execute('CREATE TABLE websites (id INTEGER PRIMARY KEY, version_count INTEGER NOT NULL DEFAULT 0)')
+    db.execute('INSERT INTO websites (id) VALUES (1), (2)')
+    db.execute('''
+    CREATE TABLE website_versions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        website_id INTEGER,
+        version_number INTEGER,
+        content JSON,
+        created_at TIMESTAMP,
+        created_by INTEGER,
+        storage_kind TEXT NOT NULL DEFAULT 'snapshot',
+        base_version INTEGER,
+        delta BLOB,
+        content_hash TEXT,
+        content_size INTEGER,
+        UNIQUE (website_id, version_number)
+    )
+    ''')
+    db.execute('''
+    CREATE TABLE version_blobs (
+        content_hash TEXT PRIMARY KEY,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TIMESTAMP
+    )
+    ''')
+    
+    started = time.perf_counter()
+    for number, content in enumerate(_simulated_edits(versions), start=1):
+        db.execute(
+            'INSERT INTO website_versions (website_id, version_number, content) VALUES (1, ?, ?)',
+            (number, json.dumps(content))
+        )
+    full_write = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for content in _simulated_edits(versions):
+        _insert_version(db, 2, content, interval=interval)
+    delta_write = time.perf_counter() - started
+    
+    sizes = {
+        row['website_id']: row['bytes']
+        for row in db.execute(
+            '''
+            SELECT website_id,
+                   COALESCE(SUM(LENGTH(content)), 0) + COALESCE(SUM(LENGTH(delta)), 0) AS bytes
+            FROM website_versions GROUP BY website_id
+            '''
+        ).fetchall()
+    }
+    # Only the delta scheme writes blobs
+    sizes[2] += db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM version_blobs').fetchone()[0]
+    
+    rng = random.Random(1)
+    targets = [rng.randint(1, versions) for _ in range(reads)]
+    
+    started = time.perf_counter()
+    for number in targets:
+        row = db.execute(
+            'SELECT content FROM website_versions WHERE website_id = 1 AND version_number = ?',
+            (number,)
+        ).fetchone()
+        json.loads(row['content'])
+    full_read = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    for number in targets:
+        reconstruct_version(db, 2, number)
+    delta_read = time.perf_counter() - started
+    
+    return {
+        'versions': versions,
+        'snapshot_interval': interval,
+        'full': {
+            'bytes': sizes[1],
+            'write_ms_per_version': round(full_write * 1000 / versions, 3),
+            'read_ms_per_version': round(full_read * 1000 / reads, 3)
+        },
+        'delta': {
+            'bytes': sizes[2],
+            'write_ms_per_version': round(delta_write * 1000 / versions, 3),
+            'read_ms_per_version': round(delta_read * 1000 / reads, 3)
+        },
+        'storage_ratio': round(sizes[2] / sizes[1], 3)
+    }
+
+def main():
+    """Run version storage maintenance commands"""
+    parser = argparse.ArgumentParser(description='Website version storage maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compact = subparsers.add_parser('compact', help='Rewrite version history as snapshots plus deltas')
+    compact.add_argument('--website-id', type=int)
+    compact.add_argument('--interval', type=int, default=VERSION_SNAPSHOT_INTERVAL)
+    subparsers.add_parser('stats', help='Report stored bytes per storage kind')
+    benchmark = subparsers.add_parser('benchmark', help='Compare full-copy and delta storage')
+    benchmark.add_argument('--versions', type=int, default=500)
+    benchmark.add_argument('--interval', type=int, default=VERSION_SNAPSHOT_INTERVAL)
+    args = parser.parse_args()
+    
+    if args.command == 'compact':
+        print(json.dumps(compact_versions(args.website_id, args.interval), indent=2))
+    elif args.command == 'stats':
+        print(json.dumps(get_version_storage_stats(), indent=2))
+    elif args.command == 'benchmark':
+        print(json.dumps(benchmark_version_storage(args.versions, args.interval), indent=2))
+
+if __name__ == '__main__':
+    main()
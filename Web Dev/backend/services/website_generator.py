@@ -1,17 +1,253 @@
 import jinja2
 import os
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from ..utils.error_handlers import handle_error
+from .site_assets import build_site_assets
+from .post_processing import PostProcessingPipeline
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), '../templates')
+
+# Compiled template bytecode shared by all workers on the host
+JINJA_BYTECODE_CACHE_DIR = os.getenv(
+    'JINJA_BYTECODE_CACHE_DIR',
+    os.path.join(os.path.dirname(__file__), '../../cache/jinja')
+)
+
+# Rendered-site cache configuration
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv('RENDER_CACHE_MAX_ENTRIES', 256))
+RENDER_CACHE_DIR = os.getenv('RENDER_CACHE_DIR')
+# The disk tier is shared by every worker; files unread for the max age, then the least
+# recently read ones beyond the size cap, are deleted
+RENDER_CACHE_DISK_MAX_BYTES = int(os.getenv('RENDER_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024))
+RENDER_CACHE_DISK_MAX_AGE = float(os.getenv('RENDER_CACHE_DISK_MAX_AGE', 7 * 86400))
+RENDER_CACHE_DISK_PRUNE_INTERVAL = float(os.getenv('RENDER_CACHE_DISK_PRUNE_INTERVAL', 300))
+
+# Inline the shared CSS/JS into every page, or link the content-hashed build instead
+SITE_ASSETS_INLINE = os.getenv('SITE_ASSETS_INLINE', 'true').lower() == 'true'
+
+class RenderCache:
+    """Content-addressed cache of rendered sites with an in-memory LRU and optional disk tier"""
+    def __init__(self, max_entries=RENDER_CACHE_MAX_ENTRIES, directory=RENDER_CACHE_DIR,
+                 disk_max_bytes=RENDER_CACHE_DISK_MAX_BYTES, disk_max_age=RENDER_CACHE_DISK_MAX_AGE,
+                 disk_prune_interval=RENDER_CACHE_DISK_PRUNE_INTERVAL):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_max_age = disk_max_age
+        self.disk_prune_interval = disk_prune_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+        self._stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'disk_evictions': 0
+        }
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.html')
+
+    def get(self, key):
+        """Get rendered HTML for a key, or None on a miss"""
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return html
+        
+        if self.directory:
+            path = self._disk_path(key)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    html = f.read()
+                # The modification time doubles as the last read time for disk LRU pruning
+                os.utime(path)
+            except OSError:
+                html = None
+            if html is not None:
+                self._store(key, html)
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                return html
+        
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key, html):
+        """Store rendered HTML in memory and, if configured, on disk"""
+        self._store(key, html)
+        
+        if self.directory:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so other workers never read a partial file
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(tmp_path, path)
+            self._maybe_prune_disk()
+
+    def _store(self, key, html):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _maybe_prune_disk(self):
+        with self._lock:
+            if time.monotonic() - self._pruned_at < self.disk_prune_interval:
+                return
+            self._pruned_at = time.monotonic()
+        self.prune_disk()
+
+    def prune_disk(self):
+        """Delete disk entries unread for the max age, then the least recently read over the size cap"""
+        if not self.directory:
+            return 0
+        
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        
+        # Oldest first, so once an entry is fresh and the total fits, the rest stay
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            expired = now - mtime >= self.disk_max_age
+            if not expired and total <= self.disk_max_bytes:
+                break
+            # Another worker may be writing this file right now
+            if path.endswith('.tmp') and not expired:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        
+        with self._lock:
+            self._stats['disk_evictions'] += removed
+        return removed
+
+    def clear(self):
+        """Drop all in-memory entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache counters for monitoring"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries)
 
 class TradieWebsiteBot:
-    def __init__(self):
+    def __init__(self, render_cache=None, inline_assets=SITE_ASSETS_INLINE, pipeline=None):
         self.template_loader = jinja2.FileSystemLoader(
-            searchpath=os.path.join(os.path.dirname(__file__), '../templates')
+            searchpath=TEMPLATES_DIR
+        )
+        os.makedirs(JINJA_BYTECODE_CACHE_DIR, exist_ok=True)
+        self.template_env = jinja2.Environment(
+            loader=self.template_loader,
+            bytecode_cache=jinja2.FileSystemBytecodeCache(JINJA_BYTECODE_CACHE_DIR)
+        )
+        self.render_cache = render_cache or RenderCache()
+        self.pipeline = pipeline or PostProcessingPipeline()
+        self._template_mtimes = {}
+        self.inline_assets = inline_assets
+        self._asset_manifest = None
+    
+    def warm_up(self):
+        """Compile every template up front and report the per-template cost"""
+        timings = {}
+        for name in self.template_loader.list_templates():
+            started = time.perf_counter()
+            try:
+                self.template_env.get_template(name)
+            except jinja2.TemplateError as e:
+                logger.error(f"Failed to compile template {name}: {str(e)}")
+                continue
+            timings[name] = round((time.perf_counter() - started) * 1000, 2)
+        
+        for name, ms in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+            logger.info(f'Template {name} loaded in {ms}ms')
+        return timings
+    
+    def build_assets(self):
+        """Emit the shared CSS/JS as content-hashed files and remember their URLs"""
+        self._asset_manifest = build_site_assets(self.generate_css(), self.generate_js())
+        return self._asset_manifest
+    
+    def asset_manifest(self):
+        """Get the shared asset manifest, building the assets on first use"""
+        if self._asset_manifest is None:
+            self.build_assets()
+        return self._asset_manifest
+    
+    def cache_key(self, business_info):
+        """Hash the template name, template file mtime and normalized business info"""
+        template_name = f"{business_info['template']}.html"
+        try:
+            mtime = os.stat(os.path.join(TEMPLATES_DIR, template_name)).st_mtime_ns
+        except OSError:
+            mtime = None
+        
+        # Drop in-memory renders as soon as a template file changes on disk
+        if self._template_mtimes.get(template_name, mtime) != mtime:
+            self.render_cache.clear()
+        self._template_mtimes[template_name] = mtime
+        
+        payload = json.dumps(
+            {
+                'template': template_name,
+                'mtime': mtime,
+                'year': datetime.now().year,
+                'assets': 'inline' if self.inline_assets else self.asset_manifest(),
+                'post_processors': self.pipeline.names,
+                'business_info': business_info
+            },
+            sort_keys=True,
+            separators=(',', ':'),
+            default=str
         )
-        self.template_env = jinja2.Environment(loader=self.template_loader)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
     
     def generate_website(self, business_info):
-        """Generate a complete tradie website based on business info"""
+        """Generate a complete tradie website based on business info, reusing cached renders"""
+        try:
+            key = self.cache_key(business_info)
+            html = self.render_cache.get(key)
+            if html is None:
+                html = self.render_website(business_info)
+                self.render_cache.set(key, html)
+            return html
+            
+        except Exception as e:
+            raise handle_error(e)
+    
+    def render_website(self, business_info):
+        """Render a complete tradie website without consulting the cache"""
         try:
             # Get template
             template = self.template_env.get_template(f"{business_info['template']}.html")
@@ -33,11 +269,13 @@ class TradieWebsiteBot:
             # Generate HTML
             html = template.render(**template_data)
             
-            # Generate CSS
-            css = self.generate_css()
-            
-            # Generate JS
-            js = self.generate_js()
+            if self.inline_assets:
+                styles = f"<style>{self.generate_css()}</style>"
+                scripts = f"<script>{self.generate_js()}</script>"
+            else:
+                manifest = self.asset_manifest()
+                styles = f'<link rel="stylesheet" href="{manifest["css"]["url"]}">'
+                scripts = f'<script src="{manifest["js"]["url"]}" defer></script>'
             
             # Combine everything
             complete_html = f"""
@@ -48,16 +286,17 @@ class TradieWebsiteBot:
                 <meta name="viewport" content="width=device-width, initial-scale=1.0">
                 <title>{business_info['businessName']} - Professional {business_info['services'][0]} Services</title>
                 <meta name="description" content="Professional {business_info['services'][0]} services in {business_info['location']}. Contact us for all your {business_info['services'][0]} needs.">
-                <style>{css}</style>
+                {styles}
             </head>
             <body>
                 {html}
-                <script>{js}</script>
+                {scripts}
             </body>
             </html>
             """
             
-            return complete_html
+            # Minify and prune the final document
+            return self.pipeline.run(complete_html)
             
         except Exception as e:
             raise handle_error(e)
@@ -199,4 +438,20 @@ def generate_website_html(business_info):
     try:
         return tradie_bot.generate_website(business_info)
     except Exception as e:
-        raise handle_error(e) 
\ No newline at end of file
+        raise handle_error(e)
+
+def build_shared_assets():
+    """Write the shared CSS/JS build referenced by linked-asset pages"""
+    return tradie_bot.build_assets()
+
+def warm_up_templates():
+    """Compile all templates into the shared bytecode cache"""
+    return tradie_bot.warm_up()
+
+if __name__ == '__main__':
+    # Populate the bytecode cache and shared assets before workers start, e.g. from deploy.sh
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps({
+        'templates': warm_up_templates(),
+        'assets': build_shared_assets()
+    }, indent=2)) 
\ No newline at end of file
@@ -0,0 +1,110 @@
+import argparse
+import json
+import logging
+from flask import Flask
+from ..database import get_db, init_db, init_app as init_database
+from .job_queue import (
+    job_handler, enqueue_job, run_worker, requeue_dead_jobs, purge_jobs, get_queue_stats,
+    PermanentJobError
+)
+from .bulk_generation import generate_websites_bulk
+from .rendered_sites import store_rendered_site
+from .version_control import create_version
+from .website_generator import generate_website_html
+
+logger = logging.getLogger(__name__)
+
+def _load_website(website_id):
+    website = get_db().execute('SELECT * FROM websites WHERE id = ?', (website_id,)).fetchone()
+    if not website:
+        # Deleted before the job ran; retrying cannot help
+        raise PermanentJobError(f'Website {website_id} no longer exists')
+    return website
+
+@job_handler('render_website')
+def render_website_job(website_id, snapshot=False):
+    """Re-render a website, refresh its served document and optionally snapshot a version"""
+    website = _load_website(website_id)
+    content = json.loads(website['content'])
+    html_content = generate_website_html(content)
+    
+    result = {'website_id': website_id}
+    if website['is_published']:
+        result['etag'] = store_rendered_site(website_id, html_content)
+    if snapshot:
+        result['version'] = create_version(website_id, content)
+    return result
+
+@job_handler('publish_website')
+def publish_website_job(website_id):
+    """Render a website once and publish it so visitors are served stored bytes"""
+    website = _load_website(website_id)
+    html_content = generate_website_html(json.loads(website['content']))
+    
+    # Committed together with the stored render
+    get_db().execute('UPDATE websites SET is_published = TRUE WHERE id = ?', (website_id,))
+    etag = store_rendered_site(website_id, html_content)
+    
+    return {
+        'website_id': website_id,
+        'url': f"https://{website['published_url']}",
+        'etag': etag
+    }
+
+@job_handler('generate_websites_bulk')
+def generate_websites_bulk_job(user_id, records, publish=False):
+    """Create websites from a batch of business records; the report becomes the job result"""
+    return generate_websites_bulk(user_id, records, publish=publish)
+
+def queue_render(website_id, user_id, snapshot=True):
+    """Queue a re-render of a website and return the job id"""
+    return enqueue_job('render_website', {'website_id': website_id, 'snapshot': snapshot}, user_id)
+
+def queue_publish(website_id, user_id):
+    """Queue publishing a website and return the job id"""
+    return enqueue_job('publish_website', {'website_id': website_id}, user_id)
+
+def queue_bulk_generation(user_id, records, publish=False):
+    """Queue creating websites from business records and return the job id"""
+    return enqueue_job(
+        'generate_websites_bulk',
+        {'user_id': user_id, 'records': records, 'publish': publish},
+        user_id
+    )
+
+def create_worker_app():
+    """Build the app context jobs run in: the databases, without the web routes"""
+    app = Flask(__name__)
+    init_database(app)
+    
+    with app.app_context():
+        init_db()
+    return app
+
+def main(argv=None):
+    """Run the render/publish job worker or queue maintenance commands"""
+    parser = argparse.ArgumentParser(description='Website render/publish job worker')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    work = subparsers.add_parser('work', help='Process queued jobs')
+    work.add_argument('--once', action='store_true', help='Exit once no runnable jobs remain')
+    requeue = subparsers.add_parser('requeue-dead', help='Retry dead-lettered jobs')
+    requeue.add_argument('--job-id', type=int)
+    subparsers.add_parser('purge', help='Delete succeeded jobs older than JOB_SUCCEEDED_RETENTION')
+    subparsers.add_parser('stats', help='Count jobs by status')
+    args = parser.parse_args(argv)
+    
+    app = create_worker_app()
+    
+    with app.app_context():
+        if args.command == 'work':
+            processed = run_worker(once=args.once)
+            logger.info(f'Processed {processed} jobs')
+        elif args.command == 'requeue-dead':
+            print(json.dumps({'requeued': requeue_dead_jobs(args.job_id)}))
+        elif args.command == 'purge':
+            print(json.dumps({'purged': purge_jobs()}))
+        elif args.command == 'stats':
+            print(json.dumps(get_queue_stats(), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,11 @@
 from flask import Blueprint, request, jsonify
 import stripe
-import sqlite3
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 from .auth import token_required
+from .database import get_db as get_pooled_db
+from .services import billing
 
 load_dotenv()
 
@@ -12,9 +13,7 @@ stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
 subscriptions_bp = Blueprint('subscriptions', __name__)
 
 def get_db():
-    conn = sqlite3.connect('database/3clickbuilder.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_pooled_db('database/3clickbuilder.db')
 
 @subscriptions_bp.route('/plans', methods=['GET'])
 def get_plans():
@@ -93,7 +92,6 @@ def create_subscription(current_user):
             subscription.status
         ))
         conn.commit()
-        conn.close()
         
         return jsonify({
             'message': 'Subscription created successfully!',
@@ -106,27 +104,16 @@ def create_subscription(current_user):
 @token_required
 def get_subscription(current_user):
     """Get current subscription details"""
-    conn = get_db()
-    subscription = conn.execute('''
-        SELECT * FROM subscriptions 
-        WHERE user_id = ? 
-        ORDER BY created_at DESC 
-        LIMIT 1
-    ''', (current_user['id'],)).fetchone()
-    conn.close()
+    subscription = billing.get_subscription(current_user['id'])
     
     if not subscription:
         return jsonify({'message': 'No active subscription!'}), 404
     
-    try:
-        stripe_subscription = stripe.Subscription.retrieve(subscription['stripe_subscription_id'])
-        return jsonify({
-            'status': stripe_subscription.status,
-            'current_period_end': stripe_subscription.current_period_end,
-            'plan': stripe_subscription.plan.id
-        })
-    except Exception as e:
-        return jsonify({'message': str(e)}), 400
+    return jsonify({
+        'status': subscription['status'],
+        'current_period_end': subscription['end_date'],
+        'plan': subscription['plan_type']
+    })
 
 @subscriptions_bp.route('/subscription/cancel', methods=['POST'])
 @token_required
@@ -139,7 +126,6 @@ def cancel_subscription(current_user):
         ORDER BY created_at DESC 
         LIMIT 1
     ''', (current_user['id'],)).fetchone()
-    conn.close()
     
     if not subscription:
         return jsonify({'message': 'No active subscription!'}), 404
@@ -154,7 +140,6 @@ def cancel_subscription(current_user):
             WHERE id = ?
         ''', (subscription['id'],))
         conn.commit()
-        conn.close()
         
         return jsonify({'message': 'Subscription canceled successfully!'})
     except Exception as e:
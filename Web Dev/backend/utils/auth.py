@@ -2,14 +2,207 @@ from functools import wraps
 from flask import request, jsonify
 import jwt
 import os
+import hashlib
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from .error_handlers import AuthenticationError, AuthorizationError
 
+logger = logging.getLogger(__name__)
+
+# Tokens expire after a day; revocation entries are kept as long as the token could be used
+TOKEN_LIFETIME = timedelta(days=1)
+
+# Verified token payloads, so repeat requests with the same token skip the HMAC check
+AUTH_TOKEN_CACHE_TTL = float(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_TOKEN_CACHE_MAX_ENTRIES', 4096))
+
+# Admin flag and subscription plan per user; each worker process holds its own copy, so the
+# TTL bounds how long a change made through another worker can go unnoticed
+AUTH_USER_CACHE_TTL = float(os.getenv('AUTH_USER_CACHE_TTL', 60))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_USER_CACHE_MAX_ENTRIES', 1024))
+
+# Revoked tokens: how often each worker picks up revocations made by other workers, and how
+# often rows for tokens that have expired anyway are deleted
+AUTH_REVOCATION_SYNC_INTERVAL = float(os.getenv('AUTH_REVOCATION_SYNC_INTERVAL', 1))
+AUTH_REVOCATION_PRUNE_INTERVAL = float(os.getenv('AUTH_REVOCATION_PRUNE_INTERVAL', 3600))
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a time to live"""
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def get(self, key):
+        """Get a live value for a key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+            
+            if entry is not None:
+                del self._entries[key]
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        """Store a value, expiring after ttl seconds or the cache's default"""
+        expires_at = time.monotonic() + min(self.ttl if ttl is None else ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        """Drop one entry"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache counters for monitoring"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries)
+
+class TokenRevocationList:
+    """Revoked token ids from the revoked_tokens table, mirrored into an in-process hash set"""
+    def __init__(self, sync_interval=AUTH_REVOCATION_SYNC_INTERVAL,
+                 prune_interval=AUTH_REVOCATION_PRUNE_INTERVAL):
+        self.sync_interval = sync_interval
+        self.prune_interval = prune_interval
+        self._revoked = {}
+        self._last_id = 0
+        self._synced_at = None
+        self._pruned_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {
+            'checks': 0,
+            'revoked_hits': 0,
+            'syncs': 0,
+            'pruned': 0
+        }
+
+    def is_revoked(self, token_id):
+        """Check a token id against the set, first catching up with the table if due"""
+        self._maybe_sync()
+        with self._lock:
+            self._stats['checks'] += 1
+            revoked = token_id in self._revoked
+            if revoked:
+                self._stats['revoked_hits'] += 1
+            return revoked
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+                return
+            # Claim this sync so concurrent requests keep using the current set
+            self._synced_at = now
+            last_id = self._last_id
+            prune = now - self._pruned_at >= self.prune_interval
+            if prune:
+                self._pruned_at = now
+        
+        try:
+            self.sync(last_id)
+            if prune:
+                self.prune()
+        except Exception as e:
+            # Keep serving the set already loaded; the next interval retries
+            logger.warning(f'Token revocation sync failed: {str(e)}')
+
+    def sync(self, last_id=None):
+        """Load revocations added since the last sync; only new rows are read"""
+        from ..database import pooled_connection
+        with pooled_connection() as conn:
+            rows = conn.execute(
+                '''
+                SELECT id, token_id, expires_at FROM revoked_tokens
+                WHERE id > ? AND expires_at > ?
+                ORDER BY id
+                ''',
+                (self._last_id if last_id is None else last_id, time.time())
+            ).fetchall()
+        
+        with self._lock:
+            for row in rows:
+                self._revoked[row['token_id']] = row['expires_at']
+                self._last_id = max(self._last_id, row['id'])
+            self._stats['syncs'] += 1
+
+    def revoke(self, token_id, user_id, expires_at):
+        """Record a revocation for every worker and apply it to this one immediately"""
+        from ..database import pooled_connection
+        with pooled_connection() as conn:
+            conn.execute(
+                '''
+                INSERT OR IGNORE INTO revoked_tokens (token_id, user_id, expires_at, revoked_at)
+                VALUES (?, ?, ?, ?)
+                ''',
+                (token_id, user_id, expires_at, time.time())
+            )
+            conn.commit()
+        
+        with self._lock:
+            self._revoked[token_id] = expires_at
+
+    def prune(self):
+        """Forget revocations of tokens that have expired, in memory and in the table"""
+        now = time.time()
+        with self._lock:
+            expired = [token_id for token_id, expires_at in self._revoked.items() if expires_at <= now]
+            for token_id in expired:
+                del self._revoked[token_id]
+            self._stats['pruned'] += len(expired)
+        
+        from ..database import pooled_connection
+        with pooled_connection() as conn:
+            conn.execute('DELETE FROM revoked_tokens WHERE expires_at <= ?', (now,))
+            conn.commit()
+
+    def clear(self):
+        """Drop the in-process set so the next check reloads it from the table"""
+        with self._lock:
+            self._revoked.clear()
+            self._last_id = 0
+            self._synced_at = None
+
+    def stats(self):
+        """Return revocation counters for monitoring"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._revoked))
+
+token_cache = TTLCache(AUTH_TOKEN_CACHE_MAX_ENTRIES, AUTH_TOKEN_CACHE_TTL)
+user_cache = TTLCache(AUTH_USER_CACHE_MAX_ENTRIES, AUTH_USER_CACHE_TTL)
+revocation_list = TokenRevocationList()
+
 def generate_token(user_id):
     """Generate JWT token for user"""
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=1)
+        'exp': datetime.utcnow() + TOKEN_LIFETIME,
+        'jti': secrets.token_hex(16)
     }
     return jwt.encode(
         payload,
@@ -17,31 +210,114 @@ def generate_token(user_id):
         algorithm='HS256'
     )
 
-def verify_token(token):
-    """Verify JWT token"""
+def _token_digest(token):
+    # The digest rather than the token itself is kept in memory
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _token_id(payload, key):
+    # Tokens issued before jti was added are revoked by digest
+    return payload.get('jti') or key
+
+def _decode_token(token, key):
+    cached = token_cache.get(key)
+    if cached is not None:
+        # Entries never outlive the token, but check in case the clock jumped
+        if cached.get('exp') is not None and cached['exp'] <= time.time():
+            token_cache.invalidate(key)
+            raise AuthenticationError('Token has expired')
+        return cached
+    
     try:
         payload = jwt.decode(
             token,
             os.getenv('JWT_SECRET_KEY'),
             algorithms=['HS256']
         )
-        return payload
     except jwt.ExpiredSignatureError:
         raise AuthenticationError('Token has expired')
     except jwt.InvalidTokenError:
         raise AuthenticationError('Invalid token')
+    
+    ttl = payload['exp'] - time.time() if payload.get('exp') is not None else None
+    token_cache.set(key, payload, ttl)
+    return payload
+
+def verify_token(token):
+    """Verify JWT token"""
+    key = _token_digest(token)
+    payload = _decode_token(token, key)
+    
+    if revocation_list.is_revoked(_token_id(payload, key)):
+        raise AuthenticationError('Token has been revoked')
+    
+    return dict(payload)
+
+def revoke_token(token):
+    """Revoke a valid token so no worker accepts it again before it expires"""
+    payload = verify_token(token)
+    key = _token_digest(token)
+    
+    expires_at = payload.get('exp') or time.time() + TOKEN_LIFETIME.total_seconds()
+    revocation_list.revoke(_token_id(payload, key), payload['user_id'], expires_at)
+    token_cache.invalidate(key)
+    return payload
+
+def get_bearer_token():
+    """Get the bearer token from the Authorization header"""
+    auth_header = request.headers.get('Authorization')
+    
+    if not auth_header or not auth_header.startswith('Bearer '):
+        raise AuthenticationError('Missing or invalid token')
+    
+    return auth_header.split(' ')[1]
+
+def get_auth_user(user_id):
+    """Get the admin flag and subscription plan used by the auth decorators, or None"""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    
+    from ..database import get_db
+    db = get_db()
+    row = db.execute(
+        '''
+        SELECT u.id, u.is_admin, s.plan_type, s.end_date
+        FROM users u
+        LEFT JOIN subscriptions s ON u.id = s.user_id
+        WHERE u.id = ?
+        ''',
+        (user_id,)
+    ).fetchone()
+    
+    if not row:
+        return None
+    
+    user = dict(row)
+    user_cache.set(user_id, user)
+    return user
+
+def invalidate_user(user_id):
+    """Forget a user's cached admin flag and plan; call after changing either"""
+    user_cache.invalidate(user_id)
+
+def clear_auth_caches():
+    """Drop every cached token payload and user"""
+    token_cache.clear()
+    user_cache.clear()
+
+def get_auth_cache_stats():
+    """Return token, user and revocation counters for monitoring"""
+    return {
+        'tokens': token_cache.stats(),
+        'users': user_cache.stats(),
+        'revocations': revocation_list.stats()
+    }
 
 def login_required(f):
     """Decorator to require authentication for routes"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header or not auth_header.startswith('Bearer '):
-            raise AuthenticationError('Missing or invalid token')
-        
-        token = auth_header.split(' ')[1]
-        payload = verify_token(token)
+        payload = verify_token(get_bearer_token())
         
         # Add user info to request
         request.user = {'id': payload['user_id']}
@@ -49,26 +325,33 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def admin_required(f):
-    """Decorator to require admin privileges for routes"""
+def token_required(f):
+    """Decorator for routes that take the authenticated user's row as their first argument"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        
-        if not auth_header or not auth_header.startswith('Bearer '):
-            raise AuthenticationError('Missing or invalid token')
-        
-        token = auth_header.split(' ')[1]
-        payload = verify_token(token)
+        payload = verify_token(get_bearer_token())
         
-        # Verify admin status
         from ..database import get_db
-        db = get_db()
-        user = db.execute(
+        current_user = get_db().execute(
             'SELECT * FROM users WHERE id = ?',
             (payload['user_id'],)
         ).fetchone()
         
+        if not current_user:
+            raise AuthenticationError('User not found')
+        
+        return f(current_user, *args, **kwargs)
+    return decorated_function
+
+def admin_required(f):
+    """Decorator to require admin privileges for routes"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        payload = verify_token(get_bearer_token())
+        
+        # Verify admin status
+        user = get_auth_user(payload['user_id'])
+        
         if not user or not user['is_admin']:
             raise AuthorizationError('Admin privileges required')
         
@@ -86,26 +369,10 @@ def subscription_required(required_plan):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            auth_header = request.headers.get('Authorization')
-            
-            if not auth_header or not auth_header.startswith('Bearer '):
-                raise AuthenticationError('Missing or invalid token')
-            
-            token = auth_header.split(' ')[1]
-            payload = verify_token(token)
+            payload = verify_token(get_bearer_token())
             
             # Verify subscription
-            from ..database import get_db
-            db = get_db()
-            user = db.execute(
-                '''
-                SELECT u.*, s.plan_type, s.end_date 
-                FROM users u
-                LEFT JOIN subscriptions s ON u.id = s.user_id
-                WHERE u.id = ?
-                ''',
-                (payload['user_id'],)
-            ).fetchone()
+            user = get_auth_user(payload['user_id'])
             
             if not user:
                 raise AuthenticationError('User not found')
@@ -128,17 +395,7 @@ def subscription_required(required_plan):
 
 def rate_limit(limit, period):
     """Decorator to implement rate limiting"""
-    from flask_limiter import Limiter
-    from flask_limiter.util import get_remote_address
-    
-    limiter = Limiter(
-        key_func=get_remote_address,
-        default_limits=[f"{limit} per {period}"]
-    )
-    
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            return limiter.limit(f"{limit} per {period}")(f)(*args, **kwargs)
-        return decorated_function
-    return decorator 
\ No newline at end of file
+    # Registered on the application's shared limiter, so every worker counts against the
+    # same stored window for this route
+    from .rate_limiting import limiter
+    return limiter.limit(f"{limit} per {period}") 
\ No newline at end of file
@@ -1,6 +1,7 @@
 import logging
 from functools import wraps
 from flask import jsonify
+from werkzeug.exceptions import HTTPException
 import traceback
 
 # Configure logging
@@ -44,6 +45,11 @@ class NotFoundError(APIError):
     def __init__(self, message, payload=None):
         super().__init__(message, status_code=404, payload=payload)
 
+class ServiceUnavailableError(APIError):
+    """Raised when a backing resource is temporarily exhausted"""
+    def __init__(self, message, payload=None):
+        super().__init__(message, status_code=503, payload=payload)
+
 def handle_error(error):
     """Handle and format errors consistently"""
     if isinstance(error, APIError):
@@ -51,6 +57,16 @@ def handle_error(error):
         response.status_code = error.status_code
         return response
     
+    # HTTP errors raised by Flask and its extensions, such as 404 or the rate limiter's 429,
+    # keep their status instead of becoming a 500
+    if isinstance(error, HTTPException):
+        response = jsonify({
+            'status': 'error',
+            'message': error.description
+        })
+        response.status_code = error.code
+        return response
+    
     # Log unexpected errors
     logger.error(f"Unexpected error: {str(error)}")
     logger.error(traceback.format_exc())
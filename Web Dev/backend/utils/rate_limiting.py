@@ -0,0 +1,279 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from flask import request
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from limits.storage import Storage, MovingWindowSupport
+from .error_handlers import AuthenticationError
+
+# Rate limiter configuration; the SQLite file is shared by every worker on the host
+RATE_LIMIT_DATABASE_PATH = os.path.join(os.path.dirname(__file__), '../database/rate_limits.db')
+RATE_LIMIT_STORAGE_URI = os.getenv('RATE_LIMIT_STORAGE_URI', f'sqlite:///{RATE_LIMIT_DATABASE_PATH}')
+RATE_LIMIT_STRATEGY = os.getenv('RATE_LIMIT_STRATEGY', 'moving-window')
+RATE_LIMIT_DEFAULTS = os.getenv('RATE_LIMIT_DEFAULTS', '200 per day;50 per hour')
+RATE_LIMIT_PRUNE_INTERVAL = float(os.getenv('RATE_LIMIT_PRUNE_INTERVAL', 300))
+
+# The default limits cover the API blueprints only; published sites, their assets and browser
+# telemetry are exempt, and telemetry ingest gets its own per-address limit
+RATE_LIMIT_API_BLUEPRINTS = ('auth', 'websites', 'templates', 'subscriptions', 'analytics', 'feedback')
+RATE_LIMIT_INGEST = os.getenv('RATE_LIMIT_INGEST', '600 per minute')
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    """Rate limit counters in a WAL-mode SQLite file shared by all worker processes"""
+    # The moving window is a sliding-window counter: each key keeps the hit counts of the
+    # current and previous fixed windows, weighting the previous count by how much of it the
+    # sliding window still covers, so storage is one row per key rather than one per hit
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, prune_interval=RATE_LIMIT_PRUNE_INTERVAL, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        # sqlite:///relative/path or sqlite:////absolute/path
+        self.path = urlparse(uri).path[1:]
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._pruned_at = time.monotonic()
+        self._prune_lock = threading.Lock()
+        
+        with self._transaction() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_counters (
+                key TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_windows (
+                key TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                expiry INTEGER NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL
+            )
+            ''')
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # One autocommit connection per thread, reopened after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            from ..database import apply_storage_profile
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            apply_storage_profile(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, so each read-modify-write is atomic
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _maybe_prune(self, now):
+        with self._prune_lock:
+            if time.monotonic() - self._pruned_at < self.prune_interval:
+                return
+            self._pruned_at = time.monotonic()
+        
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM rate_limit_counters WHERE expires_at <= ?', (now,))
+            conn.execute('DELETE FROM rate_limit_windows WHERE window_start + 2 * expiry <= ?', (now,))
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        """Increment a fixed-window counter, starting a new window once the last one expired"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                '''
+                INSERT INTO rate_limit_counters (key, count, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END,
+                    expires_at = CASE WHEN expires_at <= ? OR ? THEN excluded.expires_at ELSE expires_at END
+                ''',
+                (key, amount, now + expiry, now, now, bool(elastic_expiry))
+            )
+            count = conn.execute('SELECT count FROM rate_limit_counters WHERE key = ?', (key,)).fetchone()[0]
+        
+        self._maybe_prune(now)
+        return count
+
+    def get(self, key):
+        """Get the current fixed-window count for a key"""
+        row = self._connection().execute(
+            'SELECT count FROM rate_limit_counters WHERE key = ? AND expires_at > ?',
+            (key, time.time())
+        ).fetchone()
+        return row['count'] if row else 0
+
+    def get_expiry(self, key):
+        """Get the time a key's fixed window resets"""
+        row = self._connection().execute(
+            'SELECT expires_at FROM rate_limit_counters WHERE key = ?',
+            (key,)
+        ).fetchone()
+        return int(row['expires_at']) if row else int(time.time())
+
+    def _window_counts(self, conn, key, expiry, now):
+        # Returns (window_start, current, previous) with the stored row rolled forward to now
+        window_start = math.floor(now / expiry) * expiry
+        row = conn.execute(
+            'SELECT window_start, current, previous FROM rate_limit_windows WHERE key = ?',
+            (key,)
+        ).fetchone()
+        current = previous = 0
+        if row is not None and row['window_start'] == window_start:
+            current, previous = row['current'], row['previous']
+        elif row is not None and row['window_start'] == window_start - expiry:
+            previous = row['current']
+        return window_start, current, previous
+
+    def _estimate(self, window_start, current, previous, expiry, now):
+        return previous * (1 - (now - window_start) / expiry) + current
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        """Count a hit in the sliding window unless it would exceed the limit"""
+        now = time.time()
+        with self._transaction() as conn:
+            window_start, current, previous = self._window_counts(conn, key, expiry, now)
+            if self._estimate(window_start, current, previous, expiry, now) + amount > limit:
+                return False
+            
+            conn.execute(
+                '''
+                INSERT INTO rate_limit_windows (key, window_start, expiry, current, previous)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    window_start = excluded.window_start,
+                    expiry = excluded.expiry,
+                    current = excluded.current,
+                    previous = excluded.previous
+                ''',
+                (key, window_start, expiry, current + amount, previous)
+            )
+        
+        self._maybe_prune(now)
+        return True
+
+    def get_moving_window(self, key, limit, expiry):
+        """Get (window start, hits) for a key's sliding window"""
+        now = time.time()
+        window_start, current, previous = self._window_counts(self._connection(), key, expiry, now)
+        return int(window_start), math.ceil(self._estimate(window_start, current, previous, expiry, now))
+
+    def check(self):
+        """Check the storage file can be queried"""
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        """Delete every counter and return how many were removed"""
+        with self._transaction() as conn:
+            removed = conn.execute('DELETE FROM rate_limit_counters').rowcount
+            removed += conn.execute('DELETE FROM rate_limit_windows').rowcount
+        return removed
+
+    def clear(self, key):
+        """Delete the counters for one key"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM rate_limit_counters WHERE key = ?', (key,))
+            conn.execute('DELETE FROM rate_limit_windows WHERE key = ?', (key,))
+
+def rate_limit_key():
+    """Limit authenticated callers per user and everyone else per client address"""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        from .auth import verify_token
+        try:
+            # Verified payloads are cached, so this costs a dictionary lookup per request
+            return f"user:{verify_token(auth_header.split(' ')[1])['user_id']}"
+        except AuthenticationError:
+            pass
+    return f'ip:{get_remote_address()}'
+
+def outside_api():
+    """Whether the current request is outside the blueprints the default limits apply to"""
+    return request.blueprint not in RATE_LIMIT_API_BLUEPRINTS
+
+# One limiter for the whole application; default limits and route limits are kept per route
+limiter = Limiter(
+    rate_limit_key,
+    default_limits=[limit.strip() for limit in RATE_LIMIT_DEFAULTS.split(';') if limit.strip()],
+    default_limits_exempt_when=outside_api,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy=RATE_LIMIT_STRATEGY
+)
+
+# One budget per client address across every telemetry ingest route
+ingest_limit = limiter.shared_limit(RATE_LIMIT_INGEST, scope='analytics-ingest', key_func=get_remote_address)
+
+def benchmark_rate_limiter(hits=5000, keys=100):
+    """Compare per-hit latency of the in-memory and SQLite limiter storages"""
+    from limits import parse
+    from limits.storage import MemoryStorage
+    from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter
+    
+    item = parse('1000000 per hour')
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        storages = {
+            'memory': MemoryStorage(),
+            'sqlite': SQLiteStorage(f"sqlite:///{os.path.join(directory, 'rate_limits.db')}")
+        }
+        for name, storage in storages.items():
+            for strategy, limiter_class in (('fixed-window', FixedWindowRateLimiter),
+                                            ('moving-window', MovingWindowRateLimiter)):
+                rate_limiter = limiter_class(storage)
+                started = time.perf_counter()
+                for hit in range(hits):
+                    rate_limiter.hit(item, 'benchmark', strategy, str(hit % keys))
+                elapsed = time.perf_counter() - started
+                results.setdefault(strategy, {})[name] = {
+                    'us_per_hit': round(elapsed * 1000000 / hits, 2),
+                    'hits_per_second': round(hits / elapsed)
+                }
+    
+    return {'hits': hits, 'keys': keys, 'strategies': results}
+
+def main():
+    """Benchmark or reset the shared rate limiter storage"""
+    parser = argparse.ArgumentParser(description='Shared rate limiter storage')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    benchmark = subparsers.add_parser('benchmark', help='Compare in-memory and SQLite storage')
+    benchmark.add_argument('--hits', type=int, default=5000)
+    benchmark.add_argument('--keys', type=int, default=100)
+    subparsers.add_parser('reset', help='Clear every rate limit counter')
+    args = parser.parse_args()
+    
+    if args.command == 'benchmark':
+        print(json.dumps(benchmark_rate_limiter(args.hits, args.keys), indent=2))
+    elif args.command == 'reset':
+        print(json.dumps({'removed': SQLiteStorage(RATE_LIMIT_STORAGE_URI).reset()}))
+
+if __name__ == '__main__':
+    main()
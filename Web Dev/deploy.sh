@@ -50,15 +50,37 @@ After=network.target
 User=$USER
 WorkingDirectory=/var/www/3clickbuilder
 Environment="PATH=/var/www/3clickbuilder/venv/bin"
-ExecStart=/var/www/3clickbuilder/venv/bin/gunicorn --workers 3 --bind 127.0.0.1:5001 backend.app:app
+ExecStart=/var/www/3clickbuilder/venv/bin/gunicorn --workers 3 --worker-class gthread --threads 4 --bind 127.0.0.1:5001 backend.app:app
 
 [Install]
 WantedBy=multi-user.target
 EOF
 
+# Create the render/publish job worker service
+sudo tee /etc/systemd/system/3clickbuilder-worker.service << EOF
+[Unit]
+Description=3ClickBuilder render/publish job worker
+After=network.target
+
+[Service]
+User=$USER
+WorkingDirectory=/var/www/3clickbuilder
+Environment="PATH=/var/www/3clickbuilder/venv/bin"
+ExecStart=/var/www/3clickbuilder/venv/bin/python -m backend.services.website_jobs work
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+# Precompile templates into the shared Jinja bytecode cache and build shared site assets
+python -m backend.services.website_generator
+
 # Start the service
 sudo systemctl start 3clickbuilder
 sudo systemctl enable 3clickbuilder
+sudo systemctl start 3clickbuilder-worker
+sudo systemctl enable 3clickbuilder-worker
 
 # Set up maintenance scripts
 mkdir -p /var/www/3clickbuilder/scripts
@@ -4,16 +4,32 @@ class Analytics {
         this.errors = [];
         this.performance = {};
         this.userBehavior = {};
+        this.queue = [];
+        this.flushTimer = null;
+        this.batchSize = 20;
+        this.flushInterval = 5000;
+        this.batchEndpoint = '/api/analytics/batch';
         this.init();
     }
 
     init() {
+        this.setupBatching();
         this.setupErrorTracking();
         this.setupPerformanceMonitoring();
         this.setupUserBehaviorTracking();
         this.setupEventTracking();
     }
 
+    setupBatching() {
+        // Deliver whatever is queued when the page is hidden or unloaded
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') {
+                this.flush(true);
+            }
+        });
+        window.addEventListener('pagehide', () => this.flush(true));
+    }
+
     setupErrorTracking() {
         window.onerror = (message, source, lineno, colno, error) => {
             this.trackError({
@@ -40,18 +56,22 @@ class Analytics {
     setupPerformanceMonitoring() {
         if (window.performance && window.performance.timing) {
             window.addEventListener('load', () => {
-                const timing = window.performance.timing;
-                this.performance = {
-                    pageLoad: timing.loadEventEnd - timing.navigationStart,
-                    domContentLoaded: timing.domContentLoadedEventEnd - timing.navigationStart,
-                    firstPaint: timing.responseEnd - timing.navigationStart,
-                    dnsLookup: timing.domainLookupEnd - timing.domainLookupStart,
-                    tcpConnection: timing.connectEnd - timing.connectStart,
-                    serverResponse: timing.responseEnd - timing.requestStart,
-                    domProcessing: timing.domComplete - timing.domLoading,
-                    resourceLoading: timing.loadEventEnd - timing.domContentLoadedEventEnd
-                };
-                this.sendPerformanceData();
+                // loadEventEnd is still 0 inside load handlers, so read the timings once they return
+                setTimeout(() => {
+                    const timing = window.performance.timing;
+                    this.performance = {
+                        pageLoad: timing.loadEventEnd - timing.navigationStart,
+                        domContentLoaded: timing.domContentLoadedEventEnd - timing.navigationStart,
+                        firstPaint: timing.responseEnd - timing.navigationStart,
+                        dnsLookup: timing.domainLookupEnd - timing.domainLookupStart,
+                        tcpConnection: timing.connectEnd - timing.connectStart,
+                        serverResponse: timing.responseEnd - timing.requestStart,
+                        domProcessing: timing.domComplete - timing.domLoading,
+                        resourceLoading: timing.loadEventEnd - timing.domContentLoadedEventEnd,
+                        timestamp: new Date().toISOString()
+                    };
+                    this.sendPerformanceData();
+                }, 0);
             });
         }
     }
@@ -160,46 +180,57 @@ class Analytics {
         return path.join(' > ');
     }
 
-    async sendErrorData(error) {
-        try {
-            await fetch('/api/analytics/error', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(error)
-            });
-        } catch (e) {
-            console.error('Failed to send error data:', e);
-        }
+    sendErrorData(error) {
+        this.enqueue('error', error);
     }
 
-    async sendPerformanceData() {
-        try {
-            await fetch('/api/analytics/performance', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(this.performance)
-            });
-        } catch (e) {
-            console.error('Failed to send performance data:', e);
+    sendPerformanceData() {
+        this.enqueue('performance', this.performance);
+    }
+
+    sendUserBehaviorData(action) {
+        this.enqueue('behavior', action);
+    }
+
+    enqueue(kind, payload) {
+        this.queue.push({ kind, ...payload });
+
+        if (this.queue.length >= this.batchSize) {
+            this.flush();
+        } else if (!this.flushTimer) {
+            this.flushTimer = setTimeout(() => this.flush(), this.flushInterval);
         }
     }
 
-    async sendUserBehaviorData(action) {
-        try {
-            await fetch('/api/analytics/behavior', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(action)
-            });
-        } catch (e) {
-            console.error('Failed to send user behavior data:', e);
+    flush(useBeacon = false) {
+        clearTimeout(this.flushTimer);
+        this.flushTimer = null;
+
+        if (this.queue.length === 0) {
+            return;
+        }
+
+        const events = this.queue.splice(0, this.queue.length);
+        const body = JSON.stringify({ events });
+
+        // sendBeacon survives page unload; fall back to a keepalive fetch if it is refused
+        if (useBeacon && navigator.sendBeacon) {
+            const blob = new Blob([body], { type: 'application/json' });
+            if (navigator.sendBeacon(this.batchEndpoint, blob)) {
+                return;
+            }
         }
+
+        fetch(this.batchEndpoint, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body,
+            keepalive: useBeacon
+        }).catch((e) => {
+            console.error('Failed to send analytics batch:', e);
+        });
     }
 }
 
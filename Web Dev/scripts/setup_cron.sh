@@ -3,6 +3,7 @@
 # Create cron jobs for maintenance tasks
 (crontab -l 2>/dev/null; echo "0 0 * * * /var/www/3clickbuilder/scripts/backup.sh") | crontab -
 (crontab -l 2>/dev/null; echo "*/5 * * * * /var/www/3clickbuilder/scripts/monitor.sh") | crontab -
+(crontab -l 2>/dev/null; echo "30 2 * * * cd /var/www/3clickbuilder && venv/bin/python -m backend.services.analytics_retention apply-retention >> /var/log/3clickbuilder/retention.log 2>&1") | crontab -
 
 # Make scripts executable
 chmod +x /var/www/3clickbuilder/scripts/backup.sh
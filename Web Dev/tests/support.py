@@ -0,0 +1,40 @@
+"""Shared setup for backend tests: scratch database files and a minimal Flask app"""
+import os
+import tempfile
+
+# Set before any backend module is imported, since their paths are read at import time
+DATA_DIR = tempfile.mkdtemp(prefix='3clickbuilder-tests-')
+os.environ.setdefault('DATABASE_PATH', os.path.join(DATA_DIR, '3clickbuilder.db'))
+os.environ.setdefault('ANALYTICS_DATABASE_PATH', os.path.join(DATA_DIR, 'analytics.db'))
+os.environ.setdefault('FEEDBACK_DATABASE_PATH', os.path.join(DATA_DIR, 'feedback.db'))
+os.environ.setdefault('RATE_LIMIT_STORAGE_URI', f"sqlite:///{os.path.join(DATA_DIR, 'rate_limits.db')}")
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret')
+os.environ.setdefault('STRIPE_WEBHOOK_SECRET', 'whsec_test')
+
+from flask import Flask
+from backend.database import init_db, init_app as init_database, get_db
+from backend.utils.error_handlers import handle_error
+
+def create_app(*blueprints):
+    """Build an app with the given (blueprint, url_prefix) pairs on an initialized database"""
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    for blueprint, url_prefix in blueprints:
+        app.register_blueprint(blueprint, url_prefix=url_prefix)
+    app.register_error_handler(Exception, handle_error)
+    init_database(app)
+    
+    with app.app_context():
+        init_db()
+    return app
+
+def create_user(email, **fields):
+    """Insert a user row and return its id"""
+    db = get_db()
+    columns = ['email', 'password_hash'] + list(fields)
+    cursor = db.execute(
+        f"INSERT INTO users ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        [email, 'unused'] + list(fields.values())
+    )
+    db.commit()
+    return cursor.lastrowid
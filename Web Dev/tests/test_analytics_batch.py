@@ -0,0 +1,159 @@
+import unittest
+import json
+import support
+from backend.analytics import analytics_bp, ANALYTICS_BATCH_MAX_EVENTS
+from backend.database import get_db, ANALYTICS_DATABASE_PATH
+
+def valid_events():
+    return [
+        {'kind': 'error', 'type': 'TypeError', 'message': 'x is undefined',
+         'lineno': 10, 'colno': 4, 'timestamp': '2026-01-01T10:00:00.000Z'},
+        {'kind': 'performance', 'pageLoad': 1200, 'firstPaint': 310.5},
+        {'kind': 'behavior', 'type': 'click', 'data': {'target': 'cta'}}
+    ]
+
+class AnalyticsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app((analytics_bp, ''))
+
+    def setUp(self):
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            conn = get_db(ANALYTICS_DATABASE_PATH)
+            for table in ('errors', 'performance', 'user_behavior', 'event_rollups',
+                          'performance_rollups', 'performance_histograms'):
+                conn.execute(f'DELETE FROM {table}')
+            conn.commit()
+
+    def count(self, table):
+        with self.app.app_context():
+            return get_db(ANALYTICS_DATABASE_PATH).execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+class TestAnalyticsBatch(AnalyticsTestCase):
+    def post_batch(self, body):
+        return self.client.post('/api/analytics/batch', data=body, content_type='text/plain')
+
+    def test_valid_batch_is_stored_and_rolled_up(self):
+        response = self.post_batch(json.dumps({'events': valid_events()}))
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['accepted'], 3)
+        self.assertEqual(response.json['rejected'], [])
+        self.assertEqual(self.count('errors'), 1)
+        self.assertEqual(self.count('performance'), 1)
+        self.assertEqual(self.count('user_behavior'), 1)
+        self.assertEqual(self.count('event_rollups'), 2)
+        self.assertGreater(self.count('performance_histograms'), 0)
+
+    def test_malformed_events_are_rejected_individually(self):
+        malformed = [
+            {'kind': 'error', 'type': 't', 'message': 'm', 'timestamp': {'at': 1}},
+            {'kind': 'error', 'type': 't', 'message': 'm', 'url': ['/a']},
+            {'kind': 'error', 'type': 't', 'message': 'm', 'source': 7},
+            {'kind': 'error', 'type': 't', 'message': 'm', 'stack': ['frame']},
+            {'kind': 'error', 'type': 't', 'message': 'm', 'lineno': '12'},
+            {'kind': 'error', 'type': 't', 'message': 'm', 'colno': True},
+            {'kind': 'error', 'type': 't', 'message': 'm', 'timestamp': 'yesterday'},
+            {'kind': 'performance', 'pageLoad': -5},
+            {'kind': 'performance', 'pageLoad': 10 ** 30},
+            {'kind': 'unknown'},
+            'not an event'
+        ]
+        body = json.dumps(valid_events() + malformed)
+        # Python's json emits NaN and Infinity, as a misbehaving client could
+        body = body[:-1] + ', {"kind": "performance", "pageLoad": NaN}' \
+            + ', {"kind": "performance", "domContentLoaded": 1e400}]'
+        
+        response = self.post_batch(body)
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['accepted'], 3)
+        self.assertEqual(
+            [rejected['index'] for rejected in response.json['rejected']],
+            list(range(3, 3 + len(malformed) + 2))
+        )
+        self.assertEqual(self.count('errors'), 1)
+        self.assertEqual(self.count('performance'), 1)
+
+    def test_samples_from_the_shipped_client_are_stored(self):
+        # What frontend/analytics.js queues: timings read after load, and the negative values older
+        # clients computed from loadEventEnd before it was set
+        timings = {
+            'pageLoad': 1840, 'domContentLoaded': 920, 'firstPaint': 310, 'dnsLookup': 0,
+            'tcpConnection': 0, 'serverResponse': 120, 'domProcessing': 1400, 'resourceLoading': 920
+        }
+        early_read = dict(timings, pageLoad=-1700000000000, resourceLoading=-1700000000920)
+        events = [
+            dict({'kind': 'performance'}, **timings),
+            dict({'kind': 'performance'}, **early_read),
+            {'kind': 'behavior', 'type': 'page_view',
+             'data': {'path': '/', 'referrer': '', 'title': 'Home'},
+             'timestamp': '2026-01-01T10:00:00.000Z', 'url': 'https://example.com/',
+             'userAgent': 'Mozilla/5.0'}
+        ]
+        
+        response = self.post_batch(json.dumps({'events': events}))
+        
+        self.assertEqual(response.json['accepted'], 3)
+        with self.app.app_context():
+            rows = get_db(ANALYTICS_DATABASE_PATH).execute(
+                'SELECT page_load, resource_loading, dom_processing FROM performance ORDER BY id'
+            ).fetchall()
+            samples = get_db(ANALYTICS_DATABASE_PATH).execute(
+                "SELECT SUM(samples) FROM performance_rollups WHERE field = 'page_load'"
+            ).fetchone()[0]
+        self.assertEqual([tuple(row) for row in rows], [(1840, 920, 1400), (None, None, 1400)])
+        self.assertEqual(samples, 1)
+
+    def test_events_are_bucketed_by_their_own_timestamp(self):
+        events = [dict(event, timestamp='2026-01-01T10:15:00.000Z') for event in valid_events()]
+        
+        self.post_batch(json.dumps(events))
+        
+        with self.app.app_context():
+            conn = get_db(ANALYTICS_DATABASE_PATH)
+            event_buckets = {row[0] for row in conn.execute('SELECT bucket FROM event_rollups')}
+            performance_buckets = {row[0] for row in conn.execute('SELECT bucket FROM performance_rollups')}
+        self.assertEqual(event_buckets, {'2026-01-01T10'})
+        self.assertEqual(performance_buckets, {'2026-01-01T10'})
+
+    def test_batch_that_is_not_a_list_is_rejected(self):
+        response = self.post_batch(json.dumps({'events': 'nope'}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_oversized_batch_is_rejected(self):
+        events = [valid_events()[2]] * (ANALYTICS_BATCH_MAX_EVENTS + 1)
+        response = self.post_batch(json.dumps(events))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.count('user_behavior'), 0)
+
+class TestSingleEventEndpoints(AnalyticsTestCase):
+    def post(self, kind, event):
+        return self.client.post(f'/api/analytics/{kind}', json=event)
+
+    def test_valid_events_are_stored(self):
+        error, performance, behavior = valid_events()
+        
+        self.assertEqual(self.post('error', error).status_code, 201)
+        self.assertEqual(self.post('performance', performance).status_code, 201)
+        self.assertEqual(self.post('behavior', behavior).status_code, 201)
+        self.assertEqual(self.count('performance_rollups'), 2)
+
+    def test_malformed_events_are_rejected(self):
+        for kind, event in (
+            ('error', {'type': 't'}),
+            ('error', {'type': 't', 'message': 'm', 'lineno': 'x'}),
+            ('performance', {'pageLoad': 'slow'}),
+            ('performance', {}),
+            ('behavior', {'type': 'click'}),
+            ('behavior', ['not', 'an', 'object'])
+        ):
+            self.assertEqual(self.post(kind, event).status_code, 400, (kind, event))
+        
+        self.assertEqual(self.count('errors'), 0)
+        self.assertEqual(self.count('performance'), 0)
+        self.assertEqual(self.count('user_behavior'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
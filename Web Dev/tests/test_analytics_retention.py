@@ -0,0 +1,67 @@
+import unittest
+import tempfile
+from datetime import datetime, timedelta
+import support
+from backend.analytics import behavior_row, performance_row, insert_events
+from backend.database import get_pool, ANALYTICS_DATABASE_PATH
+from backend.services.analytics_retention import (
+    init_analytics_db, apply_retention, rebuild_rollups, RAW_EVENT_TABLES
+)
+
+def days_ago(days):
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%dT10:00:00')
+
+class TestRebuildAfterRetention(unittest.TestCase):
+    def setUp(self):
+        init_analytics_db()
+        self.pool = get_pool(ANALYTICS_DATABASE_PATH)
+        self.conn = self.pool.acquire()
+        for table in RAW_EVENT_TABLES + ['event_rollups', 'performance_rollups', 'performance_histograms']:
+            self.conn.execute(f'DELETE FROM {table}')
+        
+        # Two old days that retention purges and downsamples, and one recent day
+        for days in (60, 45, 1):
+            insert_events(
+                self.conn,
+                behavior=[behavior_row({'type': 'click', 'data': {}, 'timestamp': days_ago(days)}, None, '/')],
+                performance=[performance_row({'pageLoad': 1200, 'timestamp': days_ago(days)}, '/')]
+            )
+        self.conn.commit()
+        apply_retention(retention_days=30, hourly_rollup_days=40, archive_dir=tempfile.mkdtemp(), pause=0)
+
+    def tearDown(self):
+        self.pool.release(self.conn)
+
+    def rollups(self):
+        return (
+            self.conn.execute('SELECT bucket, count FROM event_rollups ORDER BY bucket').fetchall(),
+            self.conn.execute('SELECT bucket, samples FROM performance_rollups ORDER BY bucket').fetchall(),
+            self.conn.execute('SELECT day, count FROM performance_histograms ORDER BY day').fetchall()
+        )
+
+    def test_rebuild_keeps_rollups_of_purged_days(self):
+        before = [[tuple(row) for row in rows] for rows in self.rollups()]
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM user_behavior').fetchone()[0], 1)
+        self.assertEqual(before[0][0], (days_ago(60)[:10] + 'T00', 1))
+        
+        since = rebuild_rollups(self.conn)
+        self.conn.commit()
+        
+        self.assertEqual(since, days_ago(1)[:10])
+        self.assertEqual([[tuple(row) for row in rows] for rows in self.rollups()], before)
+
+    def test_since_before_the_retention_cutoff_is_clamped(self):
+        # Raw rows inserted after the purge, e.g. late beacons, are older than the cutoff
+        self.conn.execute(
+            'INSERT INTO user_behavior (type, data, timestamp) VALUES (?, ?, ?)',
+            ('click', '{}', days_ago(50))
+        )
+        
+        since = rebuild_rollups(self.conn, since='2000-01-01', retention_days=30)
+        
+        self.assertEqual(since, (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
+        buckets = [row[0] for row in self.conn.execute('SELECT bucket FROM event_rollups ORDER BY bucket')]
+        self.assertEqual(buckets, [days_ago(60)[:10] + 'T00', days_ago(45)[:10] + 'T00', days_ago(1)[:13]])
+
+if __name__ == '__main__':
+    unittest.main()
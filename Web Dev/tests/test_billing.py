@@ -0,0 +1,199 @@
+import unittest
+import hashlib
+import hmac
+import json
+import os
+import time
+from types import SimpleNamespace
+from unittest import mock
+import stripe
+import support
+from backend.database import get_db
+from backend.routes.subscriptions import subscriptions_bp
+from backend.utils.auth import generate_token
+
+class FakeStripe:
+    """Stripe's write endpoints, replaying the first response for a repeated idempotency key"""
+    def __init__(self):
+        self.now = int(time.time())
+        self.responses = {}
+        self.subscriptions = 0
+
+    def _replay(self, key, create):
+        if key not in self.responses:
+            # Each new write happens a little later on Stripe's clock
+            self.now += 60
+            self.responses[key] = create()
+        return self.responses[key]
+
+    def create_customer(self, idempotency_key, **params):
+        return self._replay(idempotency_key, lambda: SimpleNamespace(id='cus_test'))
+
+    def create_invoice(self, idempotency_key, **params):
+        return self._replay(idempotency_key, lambda: {'id': f'in_{len(self.responses)}'})
+
+    def create_subscription(self, idempotency_key, customer, metadata, **params):
+        def create():
+            self.subscriptions += 1
+            return {
+                'id': f'sub_{self.subscriptions}', 'customer': customer, 'status': 'active',
+                'metadata': metadata, 'created': self.now, 'start_date': self.now,
+                'current_period_start': self.now, 'current_period_end': self.now + 30 * 86400
+            }
+        return self._replay(idempotency_key, create)
+
+    def delete_subscription(self, subscription_id, idempotency_key):
+        return self._replay(idempotency_key, lambda: {
+            'id': subscription_id, 'customer': 'cus_test', 'status': 'canceled',
+            'created': self.now - 60, 'canceled_at': self.now, 'ended_at': self.now
+        })
+
+def signed(event):
+    # The Stripe-Signature header for a payload, as Stripe computes it
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(
+        os.environ['STRIPE_WEBHOOK_SECRET'].encode('utf-8'),
+        f'{timestamp}.{payload}'.encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+    return payload, f't={timestamp},v1={signature}'
+
+class BillingTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app((subscriptions_bp, '/api/subscriptions'))
+
+    def setUp(self):
+        self.context = self.app.app_context()
+        self.context.push()
+        db = get_db()
+        for table in ('subscriptions', 'stripe_events', 'users'):
+            db.execute(f'DELETE FROM {table}')
+        db.commit()
+        self.client = self.app.test_client()
+        self.user_id = support.create_user('owner@example.com')
+
+    def tearDown(self):
+        self.context.pop()
+
+    def subscription_status(self, subscription_id):
+        row = get_db().execute(
+            'SELECT status FROM subscriptions WHERE stripe_subscription_id = ?',
+            (subscription_id,)
+        ).fetchone()
+        return row['status'] if row else None
+
+class TestWebhooks(BillingTestCase):
+    def deliver(self, event_id, created, status):
+        payload, signature = signed({
+            'id': event_id,
+            'object': 'event',
+            'type': f"customer.subscription.{'deleted' if status == 'canceled' else 'updated'}",
+            'created': created,
+            'data': {'object': {
+                'id': 'sub_hook', 'object': 'subscription', 'customer': 'cus_test',
+                'status': status, 'metadata': {'user_id': str(self.user_id)}
+            }}
+        })
+        response = self.client.post(
+            '/api/subscriptions/webhook', data=payload, headers={'Stripe-Signature': signature}
+        )
+        return response.json['status']
+
+    def test_repeated_event_is_applied_once(self):
+        now = int(time.time())
+        self.assertEqual(self.deliver('evt_1', now, 'active'), 'processed')
+        self.assertEqual(self.deliver('evt_1', now, 'active'), 'duplicate')
+        self.assertEqual(self.subscription_status('sub_hook'), 'active')
+
+    def test_older_event_does_not_overwrite_newer_state(self):
+        now = int(time.time())
+        self.deliver('evt_2', now, 'past_due')
+        self.deliver('evt_1', now - 60, 'active')
+        self.assertEqual(self.subscription_status('sub_hook'), 'past_due')
+
+    def test_canceled_subscription_is_not_reactivated_by_a_same_second_event(self):
+        now = int(time.time())
+        self.deliver('evt_2', now, 'canceled')
+        self.deliver('evt_1', now, 'active')
+        self.assertEqual(self.subscription_status('sub_hook'), 'canceled')
+
+    def test_bad_signature_is_rejected(self):
+        payload, _ = signed({'id': 'evt_1', 'type': 'customer.subscription.updated'})
+        response = self.client.post(
+            '/api/subscriptions/webhook', data=payload, headers={'Stripe-Signature': 't=1,v1=bad'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+class TestCheckout(BillingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stripe = FakeStripe()
+        for target, name, fake in (
+            (stripe.Customer, 'create', self.stripe.create_customer),
+            (stripe.Invoice, 'create', self.stripe.create_invoice),
+            (stripe.Subscription, 'create', self.stripe.create_subscription),
+            (stripe.Subscription, 'delete', self.stripe.delete_subscription)
+        ):
+            patcher = mock.patch.object(target, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.headers = {'Authorization': f'Bearer {generate_token(self.user_id)}'}
+
+    def subscribe(self, key=None):
+        headers = dict(self.headers, **({'Idempotency-Key': key} if key else {}))
+        return self.client.post(
+            '/api/subscriptions/subscribe', json={'payment_method_id': 'pm_card_visa'}, headers=headers
+        )
+
+    def test_idempotency_key_is_required(self):
+        response = self.subscribe()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stripe.responses, {})
+
+    def test_retried_attempt_reuses_its_subscription(self):
+        first = self.subscribe('attempt-1')
+        retry = self.subscribe('attempt-1')
+        
+        self.assertEqual(first.json['subscription']['id'], 'sub_1')
+        self.assertEqual(retry.json['subscription']['id'], 'sub_1')
+        self.assertEqual(self.stripe.subscriptions, 1)
+
+    def test_resubscribing_after_cancel_creates_a_new_subscription(self):
+        self.subscribe('attempt-1')
+        self.assertEqual(self.client.post('/api/subscriptions/cancel', headers=self.headers).status_code, 200)
+        
+        response = self.subscribe('attempt-2')
+        
+        self.assertEqual(response.json['subscription']['id'], 'sub_2')
+        self.assertEqual(self.subscription_status('sub_1'), 'canceled')
+        self.assertEqual(self.subscription_status('sub_2'), 'active')
+
+    def test_late_retry_of_an_old_attempt_does_not_reactivate_it(self):
+        self.subscribe('attempt-1')
+        self.client.post('/api/subscriptions/cancel', headers=self.headers)
+        
+        self.subscribe('attempt-1')
+        
+        self.assertEqual(self.stripe.subscriptions, 1)
+        self.assertEqual(self.subscription_status('sub_1'), 'canceled')
+
+    def test_webhook_from_before_a_cancel_is_ignored(self):
+        self.subscribe('attempt-1')
+        self.client.post('/api/subscriptions/cancel', headers=self.headers)
+        
+        payload, signature = signed({
+            'id': 'evt_late', 'object': 'event', 'type': 'customer.subscription.updated',
+            'created': self.stripe.now - 30,
+            'data': {'object': {
+                'id': 'sub_1', 'object': 'subscription', 'customer': 'cus_test',
+                'status': 'active', 'metadata': {'user_id': str(self.user_id)}
+            }}
+        })
+        self.client.post('/api/subscriptions/webhook', data=payload, headers={'Stripe-Signature': signature})
+        
+        self.assertEqual(self.subscription_status('sub_1'), 'canceled')
+
+if __name__ == '__main__':
+    unittest.main()
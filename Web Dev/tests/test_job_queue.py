@@ -0,0 +1,163 @@
+import unittest
+import io
+import json
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+import support
+from backend.database import get_db
+from backend.services import job_queue, website_jobs
+from backend.services.job_queue import (
+    job_handler, enqueue_job, lease_job, run_job, purge_jobs, get_job, retry_delay
+)
+
+calls = []
+
+@job_handler('test_ok')
+def ok_job(value):
+    calls.append(value)
+    return {'value': value}
+
+@job_handler('test_flaky')
+def flaky_job():
+    raise RuntimeError('upstream unavailable')
+
+class TestJobQueue(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app()
+
+    def setUp(self):
+        self.context = self.app.app_context()
+        self.context.push()
+        get_db().execute('DELETE FROM jobs')
+        get_db().commit()
+        calls.clear()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def expire_lease(self, job_id):
+        get_db().execute('UPDATE jobs SET leased_until = ? WHERE id = ?', (time.time() - 1, job_id))
+        get_db().commit()
+
+    def make_runnable(self, job_id):
+        get_db().execute('UPDATE jobs SET run_after = ? WHERE id = ?', (time.time() - 1, job_id))
+        get_db().commit()
+
+    def test_leased_job_is_not_leased_twice(self):
+        job_id = enqueue_job('test_ok', {'value': 1})
+        
+        job = lease_job('worker-a')
+        
+        self.assertEqual(job['id'], job_id)
+        self.assertEqual(job['attempts'], 1)
+        self.assertIsNone(lease_job('worker-b'))
+        self.assertEqual(run_job(job), 'succeeded')
+        self.assertEqual(calls, [1])
+        self.assertEqual(get_job(job_id)['result'], {'value': 1})
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job_id = enqueue_job('test_flaky', {}, max_attempts=3)
+        
+        self.assertEqual(run_job(lease_job('worker-a')), 'queued')
+        
+        job = get_job(job_id)
+        self.assertEqual(job['attempts'], 1)
+        self.assertEqual(job['last_error'], 'RuntimeError: upstream unavailable')
+        self.assertIsNone(lease_job('worker-a'))
+        self.assertGreaterEqual(job['run_after'], time.time() + retry_delay(1) - 1)
+
+    def test_job_is_dead_lettered_after_max_attempts(self):
+        job_id = enqueue_job('test_flaky', {}, max_attempts=2)
+        
+        run_job(lease_job('worker-a'))
+        self.make_runnable(job_id)
+        
+        self.assertEqual(run_job(lease_job('worker-a')), 'dead')
+        self.assertEqual(get_job(job_id)['status'], 'dead')
+        self.make_runnable(job_id)
+        self.assertIsNone(lease_job('worker-a'))
+
+    def test_expired_lease_is_requeued_with_backoff(self):
+        job_id = enqueue_job('test_ok', {'value': 2}, max_attempts=3)
+        lease_job('worker-a')
+        self.expire_lease(job_id)
+        
+        self.assertIsNone(lease_job('worker-b'))
+        
+        job = get_job(job_id)
+        self.assertEqual(job['status'], 'queued')
+        self.assertIn('Lease expired', job['last_error'])
+        self.make_runnable(job_id)
+        self.assertEqual(lease_job('worker-b')['attempts'], 2)
+
+    def test_expired_lease_on_last_attempt_is_dead_lettered(self):
+        job_id = enqueue_job('test_ok', {'value': 3}, max_attempts=1)
+        lease_job('worker-a')
+        self.expire_lease(job_id)
+        
+        self.assertIsNone(lease_job('worker-b'))
+        self.assertEqual(get_job(job_id)['status'], 'dead')
+        self.assertEqual(calls, [])
+
+    def test_stale_worker_cannot_complete_reclaimed_job(self):
+        job_id = enqueue_job('test_ok', {'value': 4}, max_attempts=3)
+        job = lease_job('worker-a')
+        self.expire_lease(job_id)
+        lease_job('worker-b')
+        
+        run_job(job)
+        
+        self.assertEqual(get_job(job_id)['status'], 'queued')
+
+    def test_purge_removes_only_old_succeeded_jobs(self):
+        old_id = enqueue_job('test_ok', {'value': 5})
+        run_job(lease_job('worker-a'))
+        new_id = enqueue_job('test_ok', {'value': 6})
+        run_job(lease_job('worker-a'))
+        queued_id = enqueue_job('test_ok', {'value': 7}, delay=60)
+        get_db().execute(
+            'UPDATE jobs SET updated_at = ? WHERE id IN (?, ?)',
+            (datetime.now() - timedelta(seconds=job_queue.JOB_SUCCEEDED_RETENTION + 60), old_id, queued_id)
+        )
+        get_db().commit()
+        
+        self.assertEqual(purge_jobs(), 1)
+        self.assertIsNone(get_job(old_id))
+        self.assertEqual(get_job(new_id)['status'], 'succeeded')
+        self.assertEqual(get_job(queued_id)['status'], 'queued')
+
+class TestWorkerCommand(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app()
+
+    def setUp(self):
+        with self.app.app_context():
+            get_db().execute('DELETE FROM jobs')
+            get_db().commit()
+        calls.clear()
+
+    def test_work_once_runs_queued_jobs(self):
+        with self.app.app_context():
+            job_id = enqueue_job('test_ok', {'value': 8})
+        
+        website_jobs.main(['work', '--once'])
+        
+        self.assertEqual(calls, [8])
+        with self.app.app_context():
+            self.assertEqual(get_job(job_id)['status'], 'succeeded')
+
+    def test_stats_reports_jobs_by_status(self):
+        with self.app.app_context():
+            enqueue_job('test_ok', {'value': 9}, delay=60)
+        
+        output = io.StringIO()
+        with redirect_stdout(output):
+            website_jobs.main(['stats'])
+        
+        self.assertEqual(json.loads(output.getvalue())['queued'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+from unittest import mock
+import support
+from backend.database import get_db
+from backend.services import analytics
+from backend.services.analytics import PageViewBuffer
+
+class RecordingBuffer(PageViewBuffer):
+    """Buffer that remembers which threads flushed it"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.flush_threads = []
+
+    def flush(self):
+        self.flush_threads.append(threading.current_thread())
+        return super().flush()
+
+class TestPageViewBuffer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app()
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db = get_db()
+        db.execute('DELETE FROM website_analytics')
+        db.execute("DELETE FROM websites WHERE business_name = 'Buffer Test'")
+        self.website_ids = [
+            db.execute(
+                "INSERT INTO websites (business_name, template, content) VALUES ('Buffer Test', 'modern', '{}')"
+            ).lastrowid
+            for _ in range(2)
+        ]
+        db.commit()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_full_buffer_is_flushed_off_the_request_thread(self):
+        buffer = RecordingBuffer(flush_interval=60, max_keys=2)
+        for website_id in self.website_ids:
+            buffer.add(website_id, page_views=1, unique_visitors=1)
+        
+        self.assertTrue(self.wait_for(lambda: buffer.stats()['flushes'] == 1))
+        self.assertNotIn(threading.current_thread(), buffer.flush_threads)
+        self.assertEqual(buffer.stats()['pending_rows'], 0)
+
+    def test_failed_flush_backs_off_and_keeps_deltas(self):
+        buffer = PageViewBuffer(flush_interval=60, max_keys=100, max_backoff=90)
+        buffer.add(self.website_ids[0], page_views=3)
+        
+        with mock.patch.object(analytics, 'pooled_connection', side_effect=RuntimeError('database is locked')):
+            buffer.flush()
+            first = buffer.stats()['retry_in_seconds']
+            buffer.flush()
+            second = buffer.stats()['retry_in_seconds']
+        
+        self.assertGreater(first, 50)
+        self.assertGreater(second, first)
+        self.assertLessEqual(second, 90)
+        self.assertEqual(buffer.stats()['pending_hits'], 3)
+        
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.stats()['retry_in_seconds'], 0.0)
+        total = get_db().execute('SELECT SUM(page_views) FROM website_analytics').fetchone()[0]
+        self.assertEqual(total, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import support
+from backend.database import get_db
+from backend.routes.websites import websites_bp
+from backend.services.analytics import page_view_buffer
+from backend.services.rendered_sites import store_rendered_site
+
+class TestPublishedSiteViews(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app((websites_bp, '/websites'))
+
+    def setUp(self):
+        with self.app.app_context():
+            db = get_db()
+            db.execute('DELETE FROM website_analytics')
+            db.execute("DELETE FROM websites WHERE published_url = 'smith-plumbing'")
+            cursor = db.execute(
+                '''
+                INSERT INTO websites (business_name, template, content, published_url, is_published)
+                VALUES ('Smith Plumbing', 'modern', '{}', 'smith-plumbing', 1)
+                '''
+            )
+            db.commit()
+            self.website_id = cursor.lastrowid
+            self.etag = store_rendered_site(self.website_id, '<html><body>Smith Plumbing</body></html>')
+
+    def visit(self, client, revalidate=False):
+        headers = {'If-None-Match': self.etag} if revalidate else {}
+        return client.get('/websites/site/smith-plumbing', headers=headers)
+
+    def counters(self):
+        page_view_buffer.flush()
+        with self.app.app_context():
+            row = get_db().execute(
+                'SELECT SUM(page_views), SUM(unique_visitors) FROM website_analytics WHERE website_id = ?',
+                (self.website_id,)
+            ).fetchone()
+        return tuple(row)
+
+    def test_first_view_sets_a_private_visitor_cookie(self):
+        response = self.visit(self.app.test_client())
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('last_visit=', response.headers['Set-Cookie'])
+        self.assertTrue(response.headers['Cache-Control'].startswith('private'))
+        self.assertEqual(self.counters(), (1, 1))
+
+    def test_repeat_views_count_once_per_full_response(self):
+        client = self.app.test_client()
+        self.visit(client)
+        
+        repeat = self.visit(client)
+        revalidated = self.visit(client, revalidate=True)
+        
+        self.assertEqual(repeat.status_code, 200)
+        self.assertNotIn('Set-Cookie', repeat.headers)
+        self.assertTrue(repeat.headers['Cache-Control'].startswith('public'))
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.counters(), (2, 1))
+
+    def test_revalidation_counts_a_browser_new_today(self):
+        response = self.visit(self.app.test_client(), revalidate=True)
+        
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('last_visit=', response.headers['Set-Cookie'])
+        self.assertTrue(response.headers['Cache-Control'].startswith('private'))
+        self.assertEqual(self.counters(), (1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
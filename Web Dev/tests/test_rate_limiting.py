@@ -0,0 +1,65 @@
+import unittest
+import os
+import multiprocessing
+import support
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter
+from backend.analytics import analytics_bp
+from backend.routes.websites import websites_bp
+from backend.utils.rate_limiting import limiter, SQLiteStorage
+
+STORAGE_URI = f"sqlite:///{os.path.join(support.DATA_DIR, 'shared_limits.db')}"
+
+def hit_from_worker(args):
+    # Each worker process opens its own connection to the shared file
+    strategy, hits = args
+    limiter_class = MovingWindowRateLimiter if strategy == 'moving-window' else FixedWindowRateLimiter
+    rate_limiter = limiter_class(SQLiteStorage(STORAGE_URI))
+    return sum(rate_limiter.hit(parse('30 per minute'), 'shared', strategy) for _ in range(hits))
+
+class TestSharedStorage(unittest.TestCase):
+    def setUp(self):
+        SQLiteStorage(STORAGE_URI).reset()
+
+    def hits_allowed(self, strategy):
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            return sum(pool.map(hit_from_worker, [(strategy, 20)] * 4))
+
+    def test_moving_window_is_shared_across_processes(self):
+        self.assertEqual(self.hits_allowed('moving-window'), 30)
+
+    def test_fixed_window_is_shared_across_processes(self):
+        self.assertEqual(self.hits_allowed('fixed-window'), 30)
+
+class TestDefaultLimits(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app((websites_bp, '/websites'), (analytics_bp, ''))
+        cls.app.add_url_rule('/ping', 'ping', lambda: 'pong')
+        limiter.init_app(cls.app)
+
+    def setUp(self):
+        limiter.reset()
+        self.client = self.app.test_client()
+
+    def statuses(self, method, path, count=60, **kwargs):
+        return [getattr(self.client, method)(path, **kwargs).status_code for _ in range(count)]
+
+    def test_api_routes_get_the_default_limits(self):
+        statuses = self.statuses('get', '/api/analytics/stats')
+        self.assertNotIn(429, statuses[:50])
+        self.assertEqual(set(statuses[50:]), {429})
+
+    def test_published_sites_and_assets_are_exempt(self):
+        self.assertEqual(set(self.statuses('get', '/websites/site/missing')), {404})
+        self.assertEqual(set(self.statuses('get', '/websites/assets/missing.css')), {404})
+
+    def test_routes_outside_the_api_are_exempt(self):
+        self.assertEqual(set(self.statuses('get', '/ping')), {200})
+
+    def test_ingest_uses_its_own_limit(self):
+        statuses = self.statuses('post', '/api/analytics/batch', data='[]', content_type='text/plain')
+        self.assertNotIn(429, statuses)
+
+if __name__ == '__main__':
+    unittest.main()
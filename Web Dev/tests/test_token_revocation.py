@@ -0,0 +1,86 @@
+import unittest
+import time
+import jwt
+import os
+import support
+from flask import Blueprint, jsonify, request
+from backend.database import get_db
+from backend.utils.auth import (
+    login_required, generate_token, verify_token, revoke_token, revocation_list, token_cache,
+    TokenRevocationList
+)
+from backend.utils.error_handlers import AuthenticationError
+
+protected_bp = Blueprint('protected', __name__)
+
+@protected_bp.route('/whoami')
+@login_required
+def whoami():
+    return jsonify({'id': request.user['id']})
+
+class TestTokenRevocation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app((protected_bp, '/api'))
+
+    def setUp(self):
+        self.context = self.app.app_context()
+        self.context.push()
+        get_db().execute('DELETE FROM revoked_tokens')
+        get_db().commit()
+        revocation_list.clear()
+        token_cache.clear()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def whoami(self, token):
+        return self.client.get('/api/whoami', headers={'Authorization': f'Bearer {token}'})
+
+    def test_revoked_token_is_rejected(self):
+        token = generate_token(7)
+        self.assertEqual(self.whoami(token).json, {'id': 7})
+        
+        revoke_token(token)
+        
+        response = self.whoami(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.whoami(generate_token(7)).status_code, 200)
+
+    def test_revocation_reaches_other_workers(self):
+        token = generate_token(8)
+        other_worker = TokenRevocationList(sync_interval=0)
+        jti = verify_token(token)['jti']
+        self.assertFalse(other_worker.is_revoked(jti))
+        
+        revoke_token(token)
+        
+        self.assertTrue(other_worker.is_revoked(jti))
+
+    def test_token_without_jti_is_revoked_by_digest(self):
+        token = jwt.encode(
+            {'user_id': 9, 'exp': int(time.time()) + 60},
+            os.environ['JWT_SECRET_KEY'],
+            algorithm='HS256'
+        )
+        verify_token(token)
+        
+        revoke_token(token)
+        
+        with self.assertRaises(AuthenticationError):
+            verify_token(token)
+
+    def test_expired_revocations_are_pruned(self):
+        revocation_list.revoke('expired', 1, time.time() - 1)
+        revocation_list.revoke('live', 1, time.time() + 60)
+        
+        revocation_list.prune()
+        
+        rows = get_db().execute('SELECT token_id FROM revoked_tokens').fetchall()
+        self.assertEqual([row['token_id'] for row in rows], ['live'])
+        self.assertFalse(revocation_list.is_revoked('expired'))
+        self.assertTrue(revocation_list.is_revoked('live'))
+
+if __name__ == '__main__':
+    unittest.main()
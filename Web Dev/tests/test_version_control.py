@@ -0,0 +1,127 @@
+import unittest
+import json
+import support
+from backend.database import get_db
+from backend.services.version_control import (
+    _insert_version, create_version, get_version, list_versions,
+    compare_versions, delete_version, restore_version, compact_versions
+)
+
+class TestVersionControl(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = support.create_app()
+
+    def setUp(self):
+        self.context = self.app.app_context()
+        self.context.push()
+        db = get_db()
+        # Blobs are shared across websites, so every test starts from an empty store
+        db.execute('DELETE FROM website_versions')
+        db.execute('DELETE FROM version_blobs')
+        cursor = db.execute(
+            "INSERT INTO websites (business_name, template, content) VALUES ('Test', 'modern', '{}')"
+        )
+        db.commit()
+        self.website_id = cursor.lastrowid
+        # Small edits to a large document, so every delta is smaller than a snapshot
+        about = ' '.join(f'Sentence {index} about the business.' for index in range(40))
+        self.history = [
+            {'businessName': 'Smith & Sons Plumbing', 'phone': f'0400 000 {index:03d}', 'about': about}
+            for index in range(12)
+        ]
+
+    def tearDown(self):
+        self.context.pop()
+
+    def save_history(self, interval):
+        db = get_db()
+        for content in self.history:
+            _insert_version(db, self.website_id, content, interval=interval)
+        db.commit()
+
+    def storage_kinds(self):
+        return [
+            row['storage_kind'] for row in get_db().execute(
+                'SELECT storage_kind FROM website_versions WHERE website_id = ? ORDER BY version_number',
+                (self.website_id,)
+            ).fetchall()
+        ]
+
+    def assert_history(self):
+        for number, content in enumerate(self.history, start=1):
+            self.assertEqual(json.loads(get_version(self.website_id, number)['content']), content)
+
+    def test_snapshot_and_delta_round_trip(self):
+        self.save_history(interval=4)
+        
+        self.assertEqual(self.storage_kinds(), ['snapshot', 'delta', 'delta', 'delta'] * 3)
+        self.assert_history()
+        
+        page = list_versions(self.website_id, limit=5)
+        self.assertEqual([v['version_number'] for v in page['versions']], [12, 11, 10, 9, 8])
+        self.assertEqual(page['next_before'], 8)
+
+    def test_duplicate_content_references_the_existing_blob(self):
+        self.save_history(interval=4)
+        blobs = get_db().execute('SELECT COUNT(*) FROM version_blobs').fetchone()[0]
+        
+        number = create_version(self.website_id, self.history[2])
+        
+        self.assertEqual(self.storage_kinds()[-1], 'snapshot')
+        self.assertEqual(get_db().execute('SELECT COUNT(*) FROM version_blobs').fetchone()[0], blobs + 1)
+        self.assertTrue(compare_versions(self.website_id, 3, number)['identical'])
+
+    def test_restore_always_records_a_version(self):
+        self.save_history(interval=4)
+        blobs = get_db().execute('SELECT COUNT(*) FROM version_blobs').fetchone()[0]
+        
+        restore_version(self.website_id, 12)
+        restore_version(self.website_id, 12)
+        
+        latest = list_versions(self.website_id, limit=3)['versions']
+        self.assertEqual([v['version_number'] for v in latest], [14, 13, 12])
+        self.assertEqual(len({v['content_hash'] for v in latest}), 1)
+        self.assertEqual(self.storage_kinds()[-2:], ['snapshot', 'snapshot'])
+        self.assertEqual(get_db().execute('SELECT COUNT(*) FROM version_blobs').fetchone()[0], blobs + 1)
+        self.assertEqual(
+            json.loads(get_db().execute('SELECT content FROM websites WHERE id = ?', (self.website_id,)).fetchone()[0]),
+            self.history[-1]
+        )
+
+    def test_deleting_a_delta_base_keeps_later_versions_readable(self):
+        self.save_history(interval=4)
+        
+        delete_version(self.website_id, 2)
+        
+        self.history.pop(1)
+        for number, content in zip([1] + list(range(3, 13)), self.history):
+            self.assertEqual(json.loads(get_version(self.website_id, number)['content']), content)
+
+    def test_compaction_rewrites_snapshots_as_deltas(self):
+        self.save_history(interval=1)
+        self.assertEqual(self.storage_kinds(), ['snapshot'] * 12)
+        
+        report = compact_versions(self.website_id, interval=6)
+        
+        self.assertEqual(self.storage_kinds(), ['snapshot'] + ['delta'] * 5 + ['snapshot'] + ['delta'] * 5)
+        self.assertEqual(report['versions'], 12)
+        self.assertEqual(report['blobs_pruned'], 10)
+        self.assertLess(report['bytes_after'], report['bytes_before'])
+        self.assert_history()
+
+    def test_compaction_keeps_duplicates_as_snapshots(self):
+        self.history.append(self.history[4])
+        self.save_history(interval=1)
+        
+        compact_versions(self.website_id, interval=20)
+        
+        kinds = self.storage_kinds()
+        self.assertEqual(kinds[0], 'snapshot')
+        self.assertEqual(kinds[4], 'snapshot')
+        self.assertEqual(kinds[12], 'snapshot')
+        self.assertEqual(kinds.count('snapshot'), 3)
+        self.assert_history()
+
+if __name__ == '__main__':
+    unittest.main()